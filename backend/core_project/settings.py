@@ -154,6 +154,24 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR.parent, 'media')  # Apunta a la carpeta media en la raíz del proyecto
 
+# Caché en disco de los tiles JSON del mapa (/api/tiles/{z}/{x}/{y}/)
+MAPA_TILES_ROOT = os.getenv('MAPA_TILES_ROOT', os.path.join(MEDIA_ROOT, 'tiles'))
+
+# Anchos (px) de las versiones redimensionadas de cada foto (ver travel_api/rendiciones.py)
+FOTOS_ANCHOS_RENDICION = [
+    int(ancho) for ancho in os.getenv('FOTOS_ANCHOS_RENDICION', '150,300,800,1600,2560').split(',')
+]
+# Formatos en que se guardan renditions y thumbnails (avif solo si Pillow lo soporta)
+FOTOS_FORMATOS_RENDICION = os.getenv('FOTOS_FORMATOS_RENDICION', 'jpeg,webp,avif').split(',')
+
+# Tamaños (caja ANCHOxALTO) permitidos en /media/r/<ancho>x<alto>/<uuid>.<formato>
+# y carpeta donde se guardan las imágenes generadas
+FOTOS_TAMANOS_BAJO_DEMANDA = [
+    tuple(int(n) for n in tamano.split('x'))
+    for tamano in os.getenv('FOTOS_TAMANOS_BAJO_DEMANDA', '150x150,300x300,800x800,1600x1600,2560x2560').split(',')
+]
+FOTOS_RENDICIONES_CACHE_ROOT = os.getenv('FOTOS_RENDICIONES_CACHE_ROOT', os.path.join(MEDIA_ROOT, 'rendiciones'))
+
 # Configuración CORS – en producción restringir orígenes
 if DEBUG:
     CORS_ALLOW_ALL_ORIGINS = True
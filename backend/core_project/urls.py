@@ -18,16 +18,19 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from django.views.static import serve
+from travel_api.views import rendicion_bajo_demanda, servir_media
 import os
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('travel_api.urls')),
-    # Configuración explícita para servir archivos de media
-    path('media/<path:path>', serve, {
-        'document_root': settings.MEDIA_ROOT,
-    }),
+    # Imágenes redimensionadas bajo demanda (antes que la ruta genérica de media)
+    path('media/r/<int:ancho>x<int:alto>/<uuid:uuid>.<str:extension>', rendicion_bajo_demanda,
+         name='rendicion-bajo-demanda'),
+    path('media/r/<int:ancho>x<int:alto>/<uuid:uuid>', rendicion_bajo_demanda,
+         name='rendicion-bajo-demanda-negociada'),
+    # Configuración explícita para servir archivos de media (con variantes WebP/AVIF)
+    path('media/<path:path>', servir_media),
 ]
 
 # Añadir configuración de media siempre (no solo en DEBUG)
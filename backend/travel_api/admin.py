@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Lugar, Fotografia, EntradaDeBlog
+from .models import Lugar, Fotografia, EntradaDeBlog, TrabajoImagen
 from django.utils.html import format_html
 from django.conf import settings
 
@@ -15,11 +15,11 @@ class LugarAdmin(admin.ModelAdmin):
 
 @admin.register(Fotografia)
 class FotografiaAdmin(admin.ModelAdmin):
-    list_display = ('uuid', 'lugar', 'entrada_blog', 'thumbnail_preview', 'autor_fotografia', 'fecha_toma', 'orden_en_entrada')
-    list_filter = ('lugar', 'entrada_blog', 'fecha_toma', 'es_foto_principal_lugar', 'autor_fotografia')
+    list_display = ('uuid', 'lugar', 'entrada_blog', 'thumbnail_preview', 'estado_imagen', 'autor_fotografia', 'fecha_toma', 'orden_en_entrada')
+    list_filter = ('lugar', 'entrada_blog', 'fecha_toma', 'es_foto_principal_lugar', 'autor_fotografia', 'estado_imagen')
     search_fields = ('uuid', 'lugar__nombre', 'entrada_blog__titulo', 'descripcion', 'palabras_clave', 'autor_fotografia')
-    readonly_fields = ('uuid', 'url_imagen', 'thumbnail_url', 'image_preview', 'thumbnail_preview_large')
-    fields = ('lugar', 'entrada_blog', 'imagen', 'thumbnail', 'autor_fotografia', 'fecha_toma', 'descripcion', 'orden_en_entrada', 'es_foto_principal_lugar', 'uuid', 'url_imagen', 'thumbnail_url', 'image_preview', 'thumbnail_preview_large')
+    readonly_fields = ('uuid', 'url_imagen', 'thumbnail_url', 'estado_imagen', 'image_preview', 'thumbnail_preview_large')
+    fields = ('lugar', 'entrada_blog', 'imagen', 'thumbnail', 'autor_fotografia', 'fecha_toma', 'descripcion', 'orden_en_entrada', 'es_foto_principal_lugar', 'uuid', 'url_imagen', 'thumbnail_url', 'estado_imagen', 'image_preview', 'thumbnail_preview_large')
 
     def image_preview(self, obj):
         if obj.imagen:
@@ -103,3 +103,9 @@ class EntradaDeBlogAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         return EntradaDeBlog.all_objects.select_related('autor', 'lugar_asociado')
+
+@admin.register(TrabajoImagen)
+class TrabajoImagenAdmin(admin.ModelAdmin):
+    list_display = ('id', 'fotografia', 'estado', 'intentos', 'creado', 'terminado')
+    list_filter = ('estado',)
+    readonly_fields = ('fotografia', 'estado', 'intentos', 'ultimo_error', 'creado', 'iniciado', 'terminado')
@@ -0,0 +1,85 @@
+"""
+Feed de cambios para sincronización incremental (``/api/changes/``).
+
+El cursor es opaco para el cliente: codifica el instante hasta el que ya
+recibió cambios. Cada respuesta cubre el intervalo ``(cursor, ahora - margen]``;
+el margen evita saltarse filas de transacciones que aún no han hecho commit
+cuando se genera la respuesta.
+
+Solo se informan filas que siguen en la base de datos (incluidas las
+deshabilitadas). Los borrados físicos no dejan rastro, por eso en el admin
+conviene deshabilitar en lugar de borrar.
+"""
+import base64
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+from .models import Lugar, Fotografia, EntradaDeBlog, StatusChoices
+from .serializers import LugarSerializer, FotografiaSerializer, EntradaDeBlogSerializer
+
+MARGEN_COMMIT = timedelta(seconds=5)
+
+# (clave en la respuesta, modelo, serializer, select_related, prefetch_related)
+FUENTES = [
+    ('lugares', Lugar, LugarSerializer, (), ()),
+    ('fotografias', Fotografia, FotografiaSerializer, ('lugar', 'entrada_blog'), ('rendiciones',)),
+    ('entradas_blog', EntradaDeBlog, EntradaDeBlogSerializer, ('autor', 'lugar_asociado'), ()),
+]
+
+
+def codificar_cursor(instante):
+    return base64.urlsafe_b64encode(instante.isoformat().encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """
+    Raises:
+        ValueError: si el cursor no fue generado por ``codificar_cursor``.
+    """
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        instante = datetime.fromisoformat(base64.urlsafe_b64decode(cursor + relleno).decode())
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Cursor inválido") from e
+    if timezone.is_naive(instante):
+        raise ValueError("Cursor inválido")
+    return instante
+
+
+def obtener_cambios(cursor=None, context=None):
+    """
+    Devuelve los cambios desde ``cursor`` (todo si es ``None``) y el cursor siguiente.
+
+    Las filas activas se serializan completas en ``actualizados``, sin cargar
+    las columnas que el serializer no usa (``columnas_no_usadas``); de las
+    deshabilitadas solo se envía el id en ``deshabilitados``.
+    """
+    request = (context or {}).get('request')
+    desde = decodificar_cursor(cursor) if cursor else None
+    hasta = timezone.now() - MARGEN_COMMIT
+    if desde and desde >= hasta:
+        hasta = desde
+
+    respuesta = {'cursor': codificar_cursor(hasta)}
+    for clave, modelo, serializer_class, relacionados, precargas in FUENTES:
+        if desde:
+            filas = modelo.all_objects.changed_between(desde, hasta)
+        else:
+            filas = modelo.all_objects.filter(updated_at__lte=hasta)
+
+        activas = (
+            filas.filter(status=StatusChoices.ACTIVE)
+            .select_related(*relacionados)
+            .prefetch_related(*precargas)
+        )
+        diferidas = serializer_class.columnas_no_usadas(request)
+        if diferidas:
+            activas = activas.defer(*diferidas)
+        respuesta[clave] = {
+            'actualizados': serializer_class(activas, many=True, context=context).data,
+            'deshabilitados': list(
+                filas.exclude(status=StatusChoices.ACTIVE).values_list('id', flat=True)
+            ),
+        }
+    return respuesta
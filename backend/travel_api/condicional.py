@@ -0,0 +1,60 @@
+"""
+Peticiones condicionales (ETag / Last-Modified) para los endpoints de lectura.
+
+El validador es el contador de versión de ``MapaSnapshot``, que los signals
+incrementan con cada cambio en Lugar, Fotografia o EntradaDeBlog. Se obtiene
+con una consulta por clave primaria antes de serializar nada; si el cliente
+ya tiene la versión actual se responde 304 sin tocar el resto de la base de
+datos.
+"""
+import hashlib
+from functools import wraps
+
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
+
+from .models import MapaSnapshot
+
+
+def _estado(request):
+    # etag_func y last_modified_func se llaman por separado: una sola consulta
+    if not hasattr(request, '_estado_datos'):
+        request._estado_datos = MapaSnapshot.estado()
+    return request._estado_datos
+
+
+def etag_datos(request, *args, **kwargs):
+    """ETag = versión de los datos + variante según el header Accept."""
+    version, _ = _estado(request)
+    variante = hashlib.md5(request.META.get('HTTP_ACCEPT', '').encode()).hexdigest()[:8]
+    return f'"{version}-{variante}"'
+
+
+def ultima_modificacion_datos(request, *args, **kwargs):
+    _, actualizado = _estado(request)
+    return actualizado
+
+
+_condicion = condition(etag_func=etag_datos, last_modified_func=ultima_modificacion_datos)
+
+
+def con_validadores(vista):
+    """
+    ETag / Last-Modified de los datos. Como el ETag depende de ``Accept``,
+    las respuestas (también los 304) llevan ``Vary: Accept``.
+    """
+    vista_condicional = _condicion(vista)
+
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        response = vista_condicional(request, *args, **kwargs)
+        patch_vary_headers(response, ['Accept'])
+        return response
+    return envoltura
+
+
+class ValidadoresMixin:
+    """Aplica ``con_validadores`` a todas las acciones de un ViewSet de solo lectura."""
+
+    def dispatch(self, request, *args, **kwargs):
+        return con_validadores(super().dispatch)(request, *args, **kwargs)
@@ -0,0 +1,122 @@
+import re
+import time
+
+import bleach
+from django.core.management.base import BaseCommand, CommandError
+
+from travel_api.utils import (
+    crear_renderer_markdown, obtener_renderer_markdown, obtener_sanitizador_html,
+    renderizar_markdown, markdown_to_html, ALLOWED_TAGS, ALLOWED_ATTRIBUTES,
+)
+
+TEXTO_EJEMPLO = """# Un día en Cartagena
+
+Caminamos por la **ciudad amurallada** y terminamos en [Getsemaní](https://example.com).
+
+> Las calles tenían más color del que recordaba.
+
+- Café en la plaza
+- Museo del oro
+- Atardecer en las murallas
+"""
+
+
+class Command(BaseCommand):
+    help = """
+    Mide el tiempo por llamada de la conversión Markdown -> HTML.
+
+    Compara crear un procesador de Markdown en cada llamada (comportamiento
+    anterior) con reutilizar el procesador del hilo, y el pipeline completo
+    con y sin la caché de render. También compara el sanitizado seguido de
+    la cadena de re.sub anterior con el sanitizado en una pasada (con
+    PresentacionBlogFilter); usar --repeticiones para posts largos.
+
+    Uso:
+    python manage.py benchmark_markdown
+    python manage.py benchmark_markdown --iteraciones 1000
+    python manage.py benchmark_markdown --archivo post.md --repeticiones 20
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iteraciones',
+            type=int,
+            default=300,
+            help='Número de conversiones por caso (default: 300)'
+        )
+
+        parser.add_argument(
+            '--archivo',
+            type=str,
+            help='Archivo Markdown a convertir (por defecto, un post corto de ejemplo)'
+        )
+
+        parser.add_argument(
+            '--repeticiones',
+            type=int,
+            default=1,
+            help='Repite el texto N veces para simular posts largos (default: 1)'
+        )
+
+    def handle(self, *args, **options):
+        if options['archivo']:
+            try:
+                with open(options['archivo'], encoding='utf-8') as f:
+                    texto = f.read()
+            except OSError as e:
+                raise CommandError(f"No se pudo leer {options['archivo']}: {e}")
+        else:
+            texto = TEXTO_EJEMPLO
+        texto = '\n\n'.join([texto] * max(1, options['repeticiones']))
+        iteraciones = max(1, options['iteraciones'])
+
+        self.stdout.write(f"📝 {len(texto)} caracteres, {iteraciones} iteraciones")
+
+        def renderer_nuevo():
+            crear_renderer_markdown().convert(texto)
+
+        def renderer_del_hilo():
+            md = obtener_renderer_markdown()
+            try:
+                md.convert(texto)
+            finally:
+                md.reset()
+
+        nuevo = self._medir(renderer_nuevo, iteraciones)
+        reutilizado = self._medir(renderer_del_hilo, iteraciones)
+        html = crear_renderer_markdown().convert(texto)
+        regex = self._medir(lambda: _post_proceso_regex(bleach.clean(
+            html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, strip=True,
+        )), iteraciones)
+        una_pasada = self._medir(lambda: obtener_sanitizador_html().clean(html), iteraciones)
+        completo = self._medir(lambda: renderizar_markdown(texto), iteraciones)
+        cacheado = self._medir(lambda: markdown_to_html(texto), iteraciones)
+
+        self.stdout.write(f"   Renderer nuevo por llamada:  {nuevo * 1000:.3f} ms")
+        self.stdout.write(f"   Renderer del hilo (reset):   {reutilizado * 1000:.3f} ms")
+        self.stdout.write(f"   Sanitizado + cadena re.sub:  {regex * 1000:.3f} ms")
+        self.stdout.write(f"   Sanitizado en una pasada:    {una_pasada * 1000:.3f} ms")
+        self.stdout.write(f"   Pipeline completo sin caché: {completo * 1000:.3f} ms")
+        self.stdout.write(f"   markdown_to_html (en caché): {cacheado * 1000:.3f} ms")
+        self.stdout.write(self.style.SUCCESS(f"✅ Aceleración de la conversión: {nuevo / reutilizado:.1f}x"))
+
+    def _medir(self, funcion, iteraciones):
+        """Tiempo medio por llamada, en segundos (tras una llamada de calentamiento)."""
+        funcion()
+        inicio = time.perf_counter()
+        for _ in range(iteraciones):
+            funcion()
+        return (time.perf_counter() - inicio) / iteraciones
+
+
+def _post_proceso_regex(html):
+    """Post-proceso anterior a PresentacionBlogFilter, solo como referencia."""
+    html = re.sub(r'<blockquote>', '<blockquote class="blog-quote">', html)
+    html = re.sub(r'<table>', '<table class="blog-table">', html)
+    html = re.sub(r'<pre>', '<pre class="blog-code">', html)
+    html = re.sub(r'<img', '<img class="blog-image"', html)
+    return re.sub(
+        r'<a href="(https?://[^"]*)"([^>]*)>',
+        r'<a href="\1" target="_blank" rel="noopener noreferrer"\2>',
+        html
+    )
@@ -0,0 +1,103 @@
+import time
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from travel_api.rendiciones import abrir_original, abrir_reducida, TAMANO_MINIATURA
+
+
+class Command(BaseCommand):
+    help = """
+    Mide el tiempo y la memoria por foto al generar un thumbnail.
+
+    Compara decodificar el original completo antes de reducirlo con LANCZOS
+    (comportamiento anterior) con decodificar ya reducido a escala DCT
+    (Image.draft, ver rendiciones.abrir_reducida). La memoria es el tamaño
+    de la imagen decodificada, que es el pico del proceso.
+
+    Uso:
+    python manage.py benchmark_miniaturas                  # JPEG sintético de 4000x3000
+    python manage.py benchmark_miniaturas --archivo foto.jpg --archivo otra.jpg
+    python manage.py benchmark_miniaturas --iteraciones 20 --tamano 150
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--archivo',
+            action='append',
+            help='Foto a reducir (se puede repetir; por defecto, un JPEG sintético de 4000x3000)'
+        )
+
+        parser.add_argument(
+            '--iteraciones',
+            type=int,
+            default=10,
+            help='Thumbnails por foto y caso (default: 10)'
+        )
+
+        parser.add_argument(
+            '--tamano',
+            type=int,
+            default=TAMANO_MINIATURA[0],
+            help=f'Lado de la caja del thumbnail en px (default: {TAMANO_MINIATURA[0]})'
+        )
+
+    def handle(self, *args, **options):
+        fotos = []
+        for ruta in options['archivo'] or []:
+            try:
+                with open(ruta, 'rb') as f:
+                    fotos.append((ruta, f.read()))
+            except OSError as e:
+                raise CommandError(f"No se pudo leer {ruta}: {e}")
+        if not fotos:
+            fotos.append(('sintética 4000x3000', _jpeg_sintetico((4000, 3000))))
+
+        iteraciones = max(1, options['iteraciones'])
+        tamano = (options['tamano'], options['tamano'])
+        casos = [
+            ('Decodificación completa', lambda datos: abrir_original(BytesIO(datos))),
+            ('Draft DCT (reducida)   ', lambda datos: abrir_reducida(BytesIO(datos), tamano)),
+        ]
+
+        self.stdout.write(f"🖼️  {len(fotos)} foto(s), {iteraciones} iteraciones, thumbnail de {tamano[0]}px")
+        tiempos = {}
+        for nombre, abrir in casos:
+            tiempo = memoria = 0
+            for _, datos in fotos:
+                segundos, decodificada = self._medir(abrir, datos, tamano, iteraciones)
+                tiempo += segundos
+                memoria = max(memoria, decodificada)
+            tiempos[nombre] = tiempo / len(fotos)
+            self.stdout.write(
+                f"   {nombre}: {tiempos[nombre] * 1000:.1f} ms/foto, "
+                f"pico {memoria / 1024 / 1024:.1f} MB"
+            )
+
+        completa, reducida = tiempos.values()
+        self.stdout.write(self.style.SUCCESS(f"✅ Aceleración por foto: {completa / reducida:.1f}x"))
+
+    def _medir(self, abrir, datos, tamano, iteraciones):
+        """
+        Tiempo medio por thumbnail (tras uno de calentamiento) y bytes de la
+        imagen decodificada antes de reducirla.
+        """
+        imagen = abrir(datos)
+        decodificada = imagen.width * imagen.height * len(imagen.getbands())
+        inicio = time.perf_counter()
+        for _ in range(iteraciones):
+            abrir(datos).thumbnail(tamano, Image.Resampling.LANCZOS)
+        return (time.perf_counter() - inicio) / iteraciones, decodificada
+
+
+def _jpeg_sintetico(tamano):
+    """JPEG de degradados con algo de ruido: pesa y se decodifica como una foto."""
+    canales = (
+        Image.linear_gradient('L').resize(tamano),
+        Image.radial_gradient('L').resize(tamano),
+        Image.effect_noise(tamano, 20),
+    )
+    contenido = BytesIO()
+    Image.merge('RGB', canales).save(contenido, format='JPEG', quality=90)
+    return contenido.getvalue()
@@ -1,22 +1,34 @@
 import os
+from concurrent.futures import wait, FIRST_COMPLETED
 from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
-from PIL import Image
+from django.utils import timezone
 from pathlib import Path
 import logging
 
-from travel_api.models import Fotografia
+from travel_api.models import Fotografia, MapaSnapshot
+from travel_api.paralelo import pool_de_procesos
+from travel_api.rendiciones import guardar_miniatura
+from travel_api.tiles import coordenadas_de_fotos, invalidar_tiles
 
 logger = logging.getLogger(__name__)
 
+# Fotos por cada bulk_update de thumbnail_url
+TAMANO_LOTE = 200
+
 class Command(BaseCommand):
     help = """
     Genera thumbnails para todas las fotografías que no los tienen o los tienen rotos.
     
+    Con --workers N la decodificación, el redimensionado y la codificación se
+    reparten entre N procesos; este proceso solo revisa las fotos, informa
+    del progreso y guarda las URLs en lotes.
+    
     Uso:
     python manage.py generate_missing_thumbnails
     python manage.py generate_missing_thumbnails --force  # Regenerar todos
     python manage.py generate_missing_thumbnails --entrada-id 6  # Solo una entrada
+    python manage.py generate_missing_thumbnails --force --workers 8  # En paralelo
     """
 
     def add_arguments(self, parser):
@@ -38,6 +50,13 @@ class Command(BaseCommand):
             default='300x300',
             help='Tamaño del thumbnail en formato "WIDTHxHEIGHT" (default: 300x300)'
         )
+        
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Procesos que generan thumbnails en paralelo (default: 1, sin procesos extra)'
+        )
 
     def handle(self, *args, **options):
         # Parsear tamaño
@@ -65,79 +84,88 @@ class Command(BaseCommand):
             return
         
         # Contadores
-        thumbnails_creados = 0
-        thumbnails_regenerados = 0
-        errores = 0
+        self.conteo = {'creados': 0, 'regenerados': 0, 'errores': 0}
         sin_archivo = 0
         ya_existen = 0
+        self.por_guardar = []  # Fotos con thumbnail_url nuevo, se guardan en lotes
         
         # Crear directorio de thumbnails si no existe
         thumbnail_base_dir = Path(settings.MEDIA_ROOT) / 'photos' / 'thumbnails'
         thumbnail_base_dir.mkdir(parents=True, exist_ok=True)
         
+        workers = max(1, options['workers'])
+        if workers > 1:
+            self.stdout.write(f"⚙️  Usando {workers} procesos")
+        
         # Procesar cada foto
-        for i, foto in enumerate(queryset, 1):
-            try:
-                self.stdout.write(f"\n📸 [{i}/{total_fotos}] ID {foto.id}: ", ending='')
-                
-                # Verificar que existe la imagen original
-                if not foto.url_imagen:
-                    self.stdout.write("❌ Sin URL de imagen")
-                    sin_archivo += 1
-                    continue
-                
-                # Construir ruta de la imagen original
-                if foto.url_imagen.startswith('photos/'):
-                    imagen_path = Path(settings.MEDIA_ROOT) / foto.url_imagen
-                else:
-                    imagen_path = Path(foto.url_imagen)
+        with pool_de_procesos(workers) as ejecutor:
+            en_curso = {}
+            for i, foto in enumerate(queryset, 1):
+                # Informar de los terminados sin dejar más de 4 tareas por proceso en cola
+                terminados = [futuro for futuro in en_curso if futuro.done()]
+                if not terminados and len(en_curso) >= workers * 4:
+                    terminados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+                for futuro in terminados:
+                    self._resultado(futuro, *en_curso.pop(futuro))
                 
-                if not imagen_path.exists():
-                    self.stdout.write(f"❌ Archivo no encontrado: {imagen_path}")
-                    sin_archivo += 1
-                    continue
-                
-                # Determinar ruta del thumbnail
-                filename = imagen_path.name
-                thumbnail_filename = f"{imagen_path.stem}_thumb{imagen_path.suffix}"
-                thumbnail_path = thumbnail_base_dir / thumbnail_filename
-                thumbnail_url = f"photos/thumbnails/{thumbnail_filename}"
-                
-                # Verificar si ya existe el thumbnail
-                thumbnail_exists = thumbnail_path.exists()
-                
-                if thumbnail_exists and not options['force']:
-                    self.stdout.write("⏩ Ya existe")
-                    ya_existen += 1
+                try:
+                    # Verificar que existe la imagen original
+                    if not foto.url_imagen:
+                        self._encabezado(i, total_fotos, foto)
+                        self.stdout.write("❌ Sin URL de imagen")
+                        sin_archivo += 1
+                        continue
+                    
+                    # Construir ruta de la imagen original
+                    if foto.url_imagen.startswith('photos/'):
+                        imagen_path = Path(settings.MEDIA_ROOT) / foto.url_imagen
+                    else:
+                        imagen_path = Path(foto.url_imagen)
                     
-                    # Actualizar URL en la base de datos si no está establecida
-                    if not foto.thumbnail_url:
-                        foto.thumbnail_url = thumbnail_url
-                        foto.save(update_fields=['thumbnail_url'])
-                        self.stdout.write(" (URL actualizada)")
+                    if not imagen_path.exists():
+                        self._encabezado(i, total_fotos, foto)
+                        self.stdout.write(f"❌ Archivo no encontrado: {imagen_path}")
+                        sin_archivo += 1
+                        continue
                     
-                    continue
-                
-                # Crear/regenerar thumbnail
-                success = self._create_thumbnail(imagen_path, thumbnail_path, thumbnail_size)
-                
-                if success:
-                    # Actualizar base de datos
-                    foto.thumbnail_url = thumbnail_url
-                    foto.save(update_fields=['thumbnail_url'])
+                    # Determinar ruta del thumbnail
+                    thumbnail_filename = f"{imagen_path.stem}_thumb{imagen_path.suffix}"
+                    thumbnail_path = thumbnail_base_dir / thumbnail_filename
+                    thumbnail_url = f"photos/thumbnails/{thumbnail_filename}"
                     
-                    if thumbnail_exists:
-                        self.stdout.write("🔄 Regenerado")
-                        thumbnails_regenerados += 1
-                    else:
-                        self.stdout.write("✅ Creado")
-                        thumbnails_creados += 1
-                else:
-                    errores += 1
+                    # Verificar si ya existe el thumbnail
+                    thumbnail_exists = thumbnail_path.exists()
                     
-            except Exception as e:
-                self.stdout.write(f"❌ Error: {str(e)}")
-                errores += 1
+                    if thumbnail_exists and not options['force']:
+                        self._encabezado(i, total_fotos, foto)
+                        self.stdout.write("⏩ Ya existe")
+                        ya_existen += 1
+                        
+                        # Actualizar URL en la base de datos si no está establecida
+                        if not foto.thumbnail_url:
+                            self._actualizar_url(foto, thumbnail_url)
+                            self.stdout.write(" (URL actualizada)")
+                        
+                        continue
+                    
+                    # Crear/regenerar thumbnail (en otro proceso si hay workers)
+                    futuro = ejecutor.submit(_generar_thumbnail, str(imagen_path), str(thumbnail_path), thumbnail_size)
+                    en_curso[futuro] = (i, total_fotos, foto, thumbnail_url, thumbnail_exists)
+                    
+                except Exception as e:
+                    self._encabezado(i, total_fotos, foto)
+                    self.stdout.write(f"❌ Error: {str(e)}")
+                    self.conteo['errores'] += 1
+            
+            while en_curso:
+                terminados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+                for futuro in terminados:
+                    self._resultado(futuro, *en_curso.pop(futuro))
+        
+        self._guardar_lote()
+        thumbnails_creados = self.conteo['creados']
+        thumbnails_regenerados = self.conteo['regenerados']
+        errores = self.conteo['errores']
         
         # Resumen final
         self.stdout.write(f"\n{'='*60}")
@@ -154,30 +182,49 @@ class Command(BaseCommand):
             self.stdout.write(f"\n🔗 Revisa el admin:")
             self.stdout.write(f"   http://localhost:8000/admin/travel_api/fotografia/")
 
-    def _create_thumbnail(self, source_path, thumbnail_path, size):
-        """Crea un thumbnail de la imagen"""
+    def _encabezado(self, i, total_fotos, foto):
+        self.stdout.write(f"\n📸 [{i}/{total_fotos}] ID {foto.id}: ", ending='')
+
+    def _resultado(self, futuro, i, total_fotos, foto, thumbnail_url, thumbnail_exists):
+        """Informa de un thumbnail terminado y deja su URL para el próximo lote."""
+        self._encabezado(i, total_fotos, foto)
         try:
-            with Image.open(source_path) as img:
-                # Convertir a RGB si es necesario (para JPEGs)
-                if img.mode in ('RGBA', 'LA'):
-                    # Crear fondo blanco para imágenes con transparencia
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    if img.mode == 'RGBA':
-                        background.paste(img, mask=img.split()[-1])
-                    else:
-                        background.paste(img)
-                    img = background
-                elif img.mode not in ('RGB', 'L'):
-                    img = img.convert('RGB')
-                
-                # Crear thumbnail manteniendo proporción
-                img.thumbnail(size, Image.Resampling.LANCZOS)
-                
-                # Guardar como JPEG con buena calidad
-                img.save(thumbnail_path, 'JPEG', quality=85, optimize=True)
-                
-                return True
-                
+            futuro.result()
         except Exception as e:
             self.stdout.write(f"❌ Error creando thumbnail: {str(e)}")
-            return False 
\ No newline at end of file
+            self.conteo['errores'] += 1
+            return
+        
+        self._actualizar_url(foto, thumbnail_url)
+        if thumbnail_exists:
+            self.stdout.write("🔄 Regenerado")
+            self.conteo['regenerados'] += 1
+        else:
+            self.stdout.write("✅ Creado")
+            self.conteo['creados'] += 1
+
+    def _actualizar_url(self, foto, thumbnail_url):
+        foto.thumbnail_url = thumbnail_url
+        self.por_guardar.append(foto)
+        if len(self.por_guardar) >= TAMANO_LOTE:
+            self._guardar_lote()
+
+    def _guardar_lote(self):
+        """
+        Guarda las URLs pendientes con un solo bulk_update. No se disparan
+        signals: updated_at, el snapshot y los tiles del mapa se actualizan a mano.
+        """
+        if not self.por_guardar:
+            return
+        ahora = timezone.now()
+        for foto in self.por_guardar:
+            foto.updated_at = ahora
+        Fotografia.all_objects.bulk_update(self.por_guardar, ['thumbnail_url', 'updated_at'])
+        MapaSnapshot.invalidar()
+        invalidar_tiles(coordenadas_de_fotos(self.por_guardar))
+        self.por_guardar = []
+
+
+def _generar_thumbnail(origen, destino, tamano):
+    """Tarea de los workers: JPEG (y WebP/AVIF al lado) manteniendo proporción."""
+    guardar_miniatura(origen, destino, tamano)
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from travel_api.models import Fotografia
+from travel_api.rendiciones import guardar_variantes
 from travel_api.utils import create_thumbnail
 
 class Command(BaseCommand):
@@ -36,6 +37,7 @@ class Command(BaseCommand):
                         thumbnail_file,
                         save=False  # No activar signals
                     )
+                    guardar_variantes(foto.thumbnail.path, thumbnail_file.variantes)
                     
                     # Actualizar URLs
                     foto.url_imagen = foto.imagen.url
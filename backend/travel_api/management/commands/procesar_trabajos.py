@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from travel_api.trabajos import tomar_trabajo, procesar_trabajo, encolar_faltantes
+
+
+class Command(BaseCommand):
+    help = """
+    Worker de la cola de trabajos de imagen (thumbnails y renditions de fotos recién subidas).
+
+    Se pueden ejecutar varios a la vez; cada trabajo lo toma un solo worker.
+
+    Uso:
+    python manage.py procesar_trabajos               # Se queda esperando trabajos
+    python manage.py procesar_trabajos --una-vez     # Vacía la cola y termina
+    python manage.py procesar_trabajos --intervalo 2 # Segundos entre consultas con la cola vacía
+    python manage.py procesar_trabajos --encolar-faltantes --una-vez  # Renditions de fotos antiguas
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Procesar los trabajos pendientes y terminar'
+        )
+
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=5.0,
+            help='Segundos de espera cuando no hay trabajos (default: 5)'
+        )
+
+        parser.add_argument(
+            '--encolar-faltantes',
+            action='store_true',
+            help='Encolar antes las fotos que aún no tienen renditions'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("🛠️  Worker de trabajos de imagen iniciado")
+        if options['encolar_faltantes']:
+            self.stdout.write(f"📥 Fotos encoladas: {encolar_faltantes()}")
+        completados = fallidos = 0
+
+        try:
+            while True:
+                close_old_connections()
+                trabajo = tomar_trabajo()
+                if trabajo is None:
+                    if options['una_vez']:
+                        break
+                    time.sleep(options['intervalo'])
+                    continue
+
+                if procesar_trabajo(trabajo):
+                    completados += 1
+                    self.stdout.write(f"✅ Foto {trabajo.fotografia_id}: imágenes generadas")
+                else:
+                    fallidos += 1
+                    self.stdout.write(self.style.ERROR(f"❌ Foto {trabajo.fotografia_id}: error (intento {trabajo.intentos})"))
+        except KeyboardInterrupt:
+            self.stdout.write("\n⏹️  Worker detenido")
+
+        self.stdout.write(f"📊 Completados: {completados}, con error: {fallidos}")
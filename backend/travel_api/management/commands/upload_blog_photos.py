@@ -1,7 +1,9 @@
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from django.db import transaction
 from django.core.files import File
 from django.core.files.base import ContentFile
 from PIL import Image, ExifTags
@@ -11,8 +13,11 @@ import uuid
 from pathlib import Path
 import shutil
 
-from travel_api.models import Lugar, EntradaDeBlog, Fotografia
+from travel_api.models import Lugar, EntradaDeBlog, Fotografia, MapaSnapshot, TrabajoImagen, EstadoImagen
 from travel_api.utils import create_thumbnail
+from travel_api.paralelo import pool_de_procesos
+from travel_api.rendiciones import guardar_miniatura
+from travel_api.tiles import coordenadas_afectadas, invalidar_tiles
 
 # Intentar importar exifread para mejor extracción de metadatos
 try:
@@ -25,11 +30,16 @@ class Command(BaseCommand):
     help = """
     Carga fotos de una carpeta específica para una entrada de blog.
     
+    Las copias a media/ van en un pool de hilos y, con --workers N, la
+    lectura de EXIF y los thumbnails en un pool de procesos, a la vez; las
+    fotos se insertan en lotes (un bulk_create por lote, en una transacción).
+    
     Uso:
     python manage.py upload_blog_photos --source-folder "/ruta/a/las/fotos" --blog-entry-id 1
     python manage.py upload_blog_photos --source-folder "/Users/mauro/Fotos/Santiago_Chile" --blog-slug "santiago"
     python manage.py upload_blog_photos --source-folder "/Users/mauro/Fotos/Santiago_Chile" --blog-title "Mi Aventura en Santiago"
     python manage.py upload_blog_photos --source-folder "./fotos_temp/Madrid_2024" --create-blog --place-name "Madrid" --blog-title "Descubriendo Madrid"
+    python manage.py upload_blog_photos --source-folder "./fotos" --blog-entry-id 1 --workers 8 --batch-size 200
     """
 
     def add_arguments(self, parser):
@@ -104,6 +114,27 @@ class Command(BaseCommand):
             default='jpg,jpeg,png,tiff,raw',
             help='Extensiones de archivo soportadas (separadas por comas)'
         )
+        
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Procesos para EXIF y thumbnails (default: 1, sin procesos extra)'
+        )
+        
+        parser.add_argument(
+            '--io-threads',
+            type=int,
+            default=8,
+            help='Hilos para copiar archivos a media (default: 8)'
+        )
+        
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Fotos por bulk_create (default: 100)'
+        )
 
     def handle(self, *args, **options):
         # Validar carpeta fuente
@@ -135,37 +166,52 @@ class Command(BaseCommand):
         fotos_saltadas = 0
         errores = 0
         
-        for orden, image_file in enumerate(sorted(image_files), start=1):
-            try:
+        # Una sola consulta para saber qué archivos ya están cargados
+        existentes = [] if options['force_overwrite'] else list(
+            Fotografia.objects.filter(entrada_blog=entrada_blog).values_list('url_imagen', flat=True)
+        )
+        
+        media_photos_dir = Path(settings.MEDIA_ROOT) / 'photos'
+        thumbnail_dir = media_photos_dir / 'thumbnails'
+        if options['copy_to_media']:
+            thumbnail_dir.mkdir(parents=True, exist_ok=True)
+        
+        workers = max(1, options['workers'])
+        batch_size = max(1, options['batch_size'])
+        self.stdout.write(f"⚙️  {workers} procesos, {options['io_threads']} hilos de copia, lotes de {batch_size}")
+        
+        with ThreadPoolExecutor(max_workers=max(1, options['io_threads'])) as hilos, \
+                pool_de_procesos(workers) as procesos:
+            # Se encola todo: copias e imágenes avanzan en paralelo mientras se guardan los lotes
+            tareas = []
+            for orden, image_file in enumerate(sorted(image_files), start=1):
+                if any(image_file.name in url for url in existentes):
+                    tareas.append((orden, image_file, None))
+                else:
+                    tareas.append((orden, image_file, self._encolar(image_file, hilos, procesos, options['copy_to_media'])))
+            
+            lote = []
+            for orden, image_file, tarea in tareas:
                 self.stdout.write(f"\n📸 Procesando [{orden}/{len(image_files)}]: {image_file.name}")
                 
                 # Verificar si ya existe
-                if not options['force_overwrite']:
-                    if Fotografia.objects.filter(
-                        entrada_blog=entrada_blog,
-                        url_imagen__contains=image_file.name
-                    ).exists():
-                        self.stdout.write(f"  ⏩ Ya existe, saltando...")
-                        fotos_saltadas += 1
-                        continue
-                
-                # Crear fotografía
-                foto = self._create_fotografia(
-                    image_file, 
-                    entrada_blog, 
-                    orden, 
-                    options['copy_to_media']
-                )
+                if tarea is None:
+                    self.stdout.write(f"  ⏩ Ya existe, saltando...")
+                    fotos_saltadas += 1
+                    continue
                 
+                # Crear fotografía (se guarda con su lote)
+                foto = self._create_fotografia(entrada_blog, orden, *tarea)
                 if foto:
-                    fotos_creadas += 1
-                    self.stdout.write(f"  ✅ Creada foto ID {foto.id}")
+                    lote.append(foto)
                 else:
                     errores += 1
-                    
-            except Exception as e:
-                self.stdout.write(f"  ❌ Error: {str(e)}")
-                errores += 1
+                
+                if len(lote) >= batch_size:
+                    fotos_creadas += self._guardar_lote(lote)
+                    lote = []
+            
+            fotos_creadas += self._guardar_lote(lote)
         
         # Resumen final
         self.stdout.write(f"\n{'='*50}")
@@ -277,41 +323,45 @@ class Command(BaseCommand):
         self.stdout.write(f"🌍 Nuevo lugar creado: {lugar.nombre}")
         return lugar
 
-    def _create_fotografia(self, image_file, entrada_blog, orden, copy_to_media=True):
-        """Crea un objeto Fotografia desde un archivo de imagen"""
-        
-        try:
-            # Extraer metadatos EXIF
-            metadata = self._extract_metadata(image_file)
+    def _encolar(self, image_file, hilos, procesos, copy_to_media=True):
+        """
+        Lanza la copia (hilos) y la lectura de EXIF + thumbnail (procesos) de
+        un archivo. Ambas leen el original, así que no se esperan entre sí.
+        """
+        # Determinar nombre final del archivo
+        filename = f"{uuid.uuid4().hex}_{image_file.name}"
+        
+        if copy_to_media:
+            # Copiar archivo a media/photos/ y crear thumbnail
+            dest_path = Path(settings.MEDIA_ROOT) / 'photos' / filename
+            thumbnail_filename = f"{Path(filename).stem}_thumb{Path(filename).suffix}"
+            thumbnail_path = Path(settings.MEDIA_ROOT) / 'photos' / 'thumbnails' / thumbnail_filename
             
-            # Determinar nombre final del archivo
-            filename = f"{uuid.uuid4().hex}_{image_file.name}"
+            copia = hilos.submit(shutil.copy2, image_file, dest_path)
+            imagen = procesos.submit(_procesar_imagen, str(image_file), str(thumbnail_path))
             
-            if copy_to_media:
-                # Copiar archivo a media/photos/
-                media_photos_dir = Path(settings.MEDIA_ROOT) / 'photos'
-                media_photos_dir.mkdir(parents=True, exist_ok=True)
-                
-                dest_path = media_photos_dir / filename
-                shutil.copy2(image_file, dest_path)
-                
-                # Crear thumbnail
-                thumbnail_dir = media_photos_dir / 'thumbnails'
-                thumbnail_dir.mkdir(parents=True, exist_ok=True)
-                
-                thumbnail_filename = f"{Path(filename).stem}_thumb{Path(filename).suffix}"
-                self._create_thumbnail_file(dest_path, thumbnail_dir / thumbnail_filename)
-                
-                # URLs relativas
-                imagen_url = f"photos/{filename}"
-                thumbnail_url = f"photos/thumbnails/{thumbnail_filename}"
-            else:
-                # Usar archivo en ubicación original
-                imagen_url = str(image_file)
-                thumbnail_url = str(image_file)  # Por simplicidad
+            # URLs relativas
+            urls = (f"photos/{filename}", f"photos/thumbnails/{thumbnail_filename}")
+        else:
+            # Usar archivo en ubicación original
+            copia = None
+            imagen = procesos.submit(_procesar_imagen, str(image_file), None)
+            urls = (str(image_file), str(image_file))  # Por simplicidad
+        
+        return copia, imagen, urls
+
+    def _create_fotografia(self, entrada_blog, orden, copia, imagen, urls):
+        """Espera la copia y el thumbnail de un archivo y arma su Fotografia (sin guardar)"""
+        
+        try:
+            if copia is not None:
+                copia.result()
+            metadata, mensajes = imagen.result()
+            for mensaje in mensajes:
+                self.stdout.write(mensaje)
             
-            # Crear objeto Fotografia
-            foto = Fotografia.objects.create(
+            imagen_url, thumbnail_url = urls
+            return Fotografia(
                 lugar=entrada_blog.lugar_asociado,
                 entrada_blog=entrada_blog,
                 url_imagen=imagen_url,
@@ -320,110 +370,118 @@ class Command(BaseCommand):
                 autor_fotografia=metadata.get('author', 'mauribarrev'),
                 fecha_toma=metadata.get('date_taken'),
                 orden_en_entrada=orden,
-                direccion_captura=metadata.get('location_description', '')
+                direccion_captura=metadata.get('location_description', ''),
+                estado_imagen=EstadoImagen.PENDIENTE,
             )
             
-            return foto
-            
         except Exception as e:
             self.stdout.write(f"  ❌ Error creando fotografía: {str(e)}")
             return None
 
-    def _extract_metadata(self, image_file):
-        """Extrae metadatos de la imagen"""
-        metadata = {
-            'author': 'mauribarrev',  # Autor por defecto
-            'description': image_file.stem.replace('_', ' ').replace('-', ' ').title()
-        }
-        
-        # Intentar extraer fecha con exifread (más robusto)
-        if EXIFREAD_AVAILABLE:
-            try:
-                with open(image_file, 'rb') as f:
-                    tags = exifread.process_file(f)
-                    
-                    # Campos de fecha en orden de preferencia
-                    date_fields = [
-                        'EXIF DateTimeOriginal',
-                        'EXIF DateTimeDigitized', 
-                        'EXIF DateTime',
-                        'Image DateTime'
-                    ]
-                    
-                    for field in date_fields:
-                        if field in tags:
+    def _guardar_lote(self, fotos):
+        """
+        Inserta las fotos con un solo bulk_create. No se disparan signals: los
+        trabajos de renditions, el snapshot y los tiles del mapa se actualizan
+        aquí. Devuelve cuántas fotos se crearon.
+        """
+        if not fotos:
+            return 0
+        
+        with transaction.atomic():
+            Fotografia.objects.bulk_create(fotos)
+            TrabajoImagen.objects.bulk_create([TrabajoImagen(fotografia=foto) for foto in fotos])
+            MapaSnapshot.invalidar()
+        # Todas son de la misma entrada y del mismo lugar
+        invalidar_tiles(coordenadas_afectadas(fotos[0]))
+        
+        self.stdout.write(f"\n💾 Lote guardado: {len(fotos)} fotos (ID {fotos[0].id}–{fotos[-1].id})")
+        return len(fotos)
+
+
+def _extract_metadata(image_file, mensajes):
+    """Extrae metadatos de la imagen (los avisos van a ``mensajes``)"""
+    metadata = {
+        'author': 'mauribarrev',  # Autor por defecto
+        'description': image_file.stem.replace('_', ' ').replace('-', ' ').title()
+    }
+    
+    # Intentar extraer fecha con exifread (más robusto)
+    if EXIFREAD_AVAILABLE:
+        try:
+            with open(image_file, 'rb') as f:
+                tags = exifread.process_file(f)
+                
+                # Campos de fecha en orden de preferencia
+                date_fields = [
+                    'EXIF DateTimeOriginal',
+                    'EXIF DateTimeDigitized', 
+                    'EXIF DateTime',
+                    'Image DateTime'
+                ]
+                
+                for field in date_fields:
+                    if field in tags:
+                        try:
+                            date_str = str(tags[field])
+                            parsed_date = datetime.strptime(date_str, '%Y:%m:%d %H:%M:%S')
+                            metadata['date_taken'] = parsed_date.date()
+                            mensajes.append(f"  📅 Fecha EXIF extraída: {metadata['date_taken']} ({field})")
+                            break
+                        except ValueError as e:
+                            mensajes.append(f"  ⚠️  Error parseando {field}: {date_str}")
+                            continue
+                            
+        except Exception as e:
+            mensajes.append(f"  ⚠️  Error con exifread: {str(e)}")
+    
+    # Si no se extrajo con exifread, intentar con PIL
+    if 'date_taken' not in metadata:
+        try:
+            with Image.open(image_file) as img:
+                exif = img._getexif()
+                if exif:
+                    # Buscar fecha de toma en diferentes campos EXIF
+                    date_fields = ['DateTimeOriginal', 'DateTimeDigitized', 'DateTime']
+                    for tag, value in exif.items():
+                        decoded = ExifTags.TAGS.get(tag, tag)
+                        if decoded in date_fields:
                             try:
-                                date_str = str(tags[field])
-                                parsed_date = datetime.strptime(date_str, '%Y:%m:%d %H:%M:%S')
+                                parsed_date = datetime.strptime(str(value), '%Y:%m:%d %H:%M:%S')
                                 metadata['date_taken'] = parsed_date.date()
-                                self.stdout.write(f"  📅 Fecha EXIF extraída: {metadata['date_taken']} ({field})")
+                                mensajes.append(f"  📅 Fecha PIL extraída: {metadata['date_taken']} ({decoded})")
                                 break
-                            except ValueError as e:
-                                self.stdout.write(f"  ⚠️  Error parseando {field}: {date_str}")
+                            except ValueError:
                                 continue
                                 
-            except Exception as e:
-                self.stdout.write(f"  ⚠️  Error con exifread: {str(e)}")
-        
-        # Si no se extrajo con exifread, intentar con PIL
-        if 'date_taken' not in metadata:
-            try:
-                with Image.open(image_file) as img:
-                    exif = img._getexif()
-                    if exif:
-                        # Buscar fecha de toma en diferentes campos EXIF
-                        date_fields = ['DateTimeOriginal', 'DateTimeDigitized', 'DateTime']
-                        for tag, value in exif.items():
-                            decoded = ExifTags.TAGS.get(tag, tag)
-                            if decoded in date_fields:
-                                try:
-                                    parsed_date = datetime.strptime(str(value), '%Y:%m:%d %H:%M:%S')
-                                    metadata['date_taken'] = parsed_date.date()
-                                    self.stdout.write(f"  📅 Fecha PIL extraída: {metadata['date_taken']} ({decoded})")
-                                    break
-                                except ValueError:
-                                    continue
-                                    
-            except Exception as e:
-                self.stdout.write(f"  ⚠️  Error con PIL EXIF: {str(e)}")
-        
-        # Como último recurso, usar fecha de modificación del archivo
-        if 'date_taken' not in metadata:
-            try:
-                file_stat = image_file.stat()
-                file_date = datetime.fromtimestamp(file_stat.st_mtime).date()
-                metadata['date_taken'] = file_date
-                self.stdout.write(f"  📅 Fecha de archivo: {metadata['date_taken']}")
-            except Exception as e:
-                self.stdout.write(f"  ⚠️  Error obteniendo fecha de archivo: {str(e)}")
-        
-        return metadata
+        except Exception as e:
+            mensajes.append(f"  ⚠️  Error con PIL EXIF: {str(e)}")
+    
+    # Como último recurso, usar fecha de modificación del archivo
+    if 'date_taken' not in metadata:
+        try:
+            file_stat = image_file.stat()
+            file_date = datetime.fromtimestamp(file_stat.st_mtime).date()
+            metadata['date_taken'] = file_date
+            mensajes.append(f"  📅 Fecha de archivo: {metadata['date_taken']}")
+        except Exception as e:
+            mensajes.append(f"  ⚠️  Error obteniendo fecha de archivo: {str(e)}")
+    
+    return metadata
+
 
-    def _create_thumbnail_file(self, source_path, thumbnail_path):
-        """Crea un archivo thumbnail"""
+def _procesar_imagen(origen, thumbnail_path):
+    """
+    Tarea de los procesos: metadatos EXIF y thumbnail (JPEG y WebP/AVIF al
+    lado) de un archivo. Devuelve ``(metadata, mensajes)``.
+    """
+    mensajes = []
+    metadata = _extract_metadata(Path(origen), mensajes)
+    
+    if thumbnail_path:
         try:
-            with Image.open(source_path) as img:
-                # Convertir a RGB si es necesario (para JPEGs)
-                if img.mode in ('RGBA', 'LA'):
-                    # Crear fondo blanco para imágenes con transparencia
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    if img.mode == 'RGBA':
-                        background.paste(img, mask=img.split()[-1])
-                    else:
-                        background.paste(img)
-                    img = background
-                elif img.mode not in ('RGB', 'L'):
-                    img = img.convert('RGB')
-                
-                # Crear thumbnail manteniendo proporción
-                img.thumbnail((300, 300), Image.Resampling.LANCZOS)
-                
-                # Guardar como JPEG con buena calidad
-                img.save(thumbnail_path, 'JPEG', quality=85, optimize=True)
-                self.stdout.write(f"  📷 Thumbnail creado: {thumbnail_path.name}")
-                
+            guardar_miniatura(origen, thumbnail_path)
+            mensajes.append(f"  📷 Thumbnail creado: {Path(thumbnail_path).name}")
         except Exception as e:
-            self.stdout.write(f"  ⚠️  Error creando thumbnail: {str(e)}")
-            return False
-        
-        return True 
\ No newline at end of file
+            mensajes.append(f"  ⚠️  Error creando thumbnail: {str(e)}")
+    
+    return metadata, mensajes
@@ -0,0 +1,384 @@
+"""
+Construcción de los marcadores del mapa (``/api/mapa-data/``).
+
+En lugar de recorrer lugares → entradas → fotos con consultas anidadas, el
+payload completo se arma con un número fijo de consultas ``values()`` y se
+agrupa en Python. El número de consultas no depende de cuántos lugares,
+entradas o fotografías existan.
+
+El resultado se guarda en ``MapaSnapshot`` y se sirve desde ahí hasta que
+un cambio en los modelos lo invalida. Para los zooms bajos el snapshot
+incluye además los marcadores agrupados por cuadrícula.
+"""
+import math
+from collections import defaultdict
+
+from django.db.models import Q
+
+from .models import Lugar, Fotografia, EntradaDeBlog, MapaSnapshot
+
+# Columnas necesarias de cada modelo para construir los marcadores
+CAMPOS_LUGAR = ('id', 'nombre', 'ciudad', 'pais', 'latitud', 'longitud', 'descripcion_corta')
+CAMPOS_ENTRADA = ('id', 'slug', 'titulo', 'lugar_asociado_id')
+CAMPOS_FOTO = (
+    'id', 'lugar_id', 'entrada_blog_id', 'thumbnail_url', 'url_imagen',
+    'orden_en_entrada', 'descripcion', 'es_foto_principal_lugar',
+)
+
+# Agrupación (clustering) en zooms bajos
+ZOOM_MAX_AGRUPACION = 9       # A partir de zoom 10 se envían marcadores individuales
+CELDA_AGRUPACION_PX = 60      # Tamaño de celda de la cuadrícula en píxeles de pantalla
+LATITUD_MAX_MERCATOR = 85.05112878
+
+# Datos de lugar que los formatos compacto/GeoJSON guardan una sola vez
+CAMPOS_COMPACTO_LUGAR = ('lugar_id', 'nombre', 'ciudad', 'pais', 'descripcion', 'coordinates')
+
+
+def construir_marcadores(lugares=None):
+    """
+    Devuelve la lista de marcadores del mapa usando tres consultas en total.
+
+    - Lugares con entradas de blog: un marcador ``foto_blog`` por cada foto
+      de cada entrada.
+    - Lugares sin entradas: un marcador ``lugar_simple`` con su foto principal
+      (o la primera foto del lugar si no hay principal).
+
+    Args:
+        lugares: QuerySet de Lugar opcional para limitar los marcadores
+            (p. ej. a un bounding box). Por defecto, todos los lugares activos.
+    """
+    entradas_qs = EntradaDeBlog.objects.filter(lugar_asociado__isnull=False)
+    fotos_qs = Fotografia.objects.all()
+    if lugares is None:
+        lugares = Lugar.objects.all()
+    else:
+        # Subconsultas: solo entradas y fotos de los lugares pedidos
+        entradas_qs = entradas_qs.filter(lugar_asociado__in=lugares.values('id'))
+        fotos_qs = fotos_qs.filter(
+            Q(entrada_blog__lugar_asociado__in=lugares.values('id')) | Q(lugar__in=lugares.values('id'))
+        )
+
+    lugares = list(lugares.order_by('id').values(*CAMPOS_LUGAR))
+
+    # Entradas activas agrupadas por lugar (orden por defecto: más recientes primero)
+    entradas_por_lugar = defaultdict(list)
+    for entrada in entradas_qs.values(*CAMPOS_ENTRADA):
+        entradas_por_lugar[entrada['lugar_asociado_id']].append(entrada)
+
+    # Fotos activas agrupadas por entrada y por lugar, respetando el orden del modelo
+    fotos_por_entrada = defaultdict(list)
+    fotos_por_lugar = defaultdict(list)
+    for foto in fotos_qs.values(*CAMPOS_FOTO):
+        if foto['entrada_blog_id'] is not None:
+            fotos_por_entrada[foto['entrada_blog_id']].append(foto)
+        fotos_por_lugar[foto['lugar_id']].append(foto)
+
+    resultado = []
+    for lugar in lugares:
+        entradas = entradas_por_lugar.get(lugar['id'])
+        if entradas:
+            for entrada in entradas:
+                fotos = sorted(fotos_por_entrada.get(entrada['id'], ()), key=lambda f: f['orden_en_entrada'])
+                for foto in fotos:
+                    resultado.append(_marcador_foto_blog(lugar, entrada, foto))
+        else:
+            resultado.append(_marcador_lugar_simple(lugar, fotos_por_lugar.get(lugar['id'], ())))
+
+    return resultado
+
+
+def parsear_bbox(valor):
+    """
+    Convierte ``"minLon,minLat,maxLon,maxLat"`` en una tupla de floats.
+
+    Si ``minLon > maxLon`` el recuadro cruza el antimeridiano.
+
+    Raises:
+        ValueError: si el formato o los rangos no son válidos.
+    """
+    partes = valor.split(',')
+    if len(partes) != 4:
+        raise ValueError("bbox debe tener el formato minLon,minLat,maxLon,maxLat")
+    min_lon, min_lat, max_lon, max_lat = (float(p) for p in partes)
+    if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        raise ValueError("La longitud debe estar entre -180 y 180")
+    if not (-90 <= min_lat <= max_lat <= 90):
+        raise ValueError("La latitud debe estar entre -90 y 90 y minLat <= maxLat")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def lugares_en_bbox(bbox):
+    """QuerySet de lugares activos dentro del bounding box (usa el índice lat/lon)."""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    lugares = Lugar.objects.filter(latitud__gte=min_lat, latitud__lte=max_lat)
+    if min_lon <= max_lon:
+        return lugares.filter(longitud__gte=min_lon, longitud__lte=max_lon)
+    # Cruza el antimeridiano: dos rangos de longitud
+    return lugares.filter(Q(longitud__gte=min_lon) | Q(longitud__lte=max_lon))
+
+
+def en_bbox(coordenadas, bbox):
+    """Indica si ``[lon, lat]`` cae dentro del bounding box (admite antimeridiano)."""
+    lon, lat = coordenadas
+    min_lon, min_lat, max_lon, max_lat = bbox
+    if not min_lat <= lat <= max_lat:
+        return False
+    if min_lon <= max_lon:
+        return min_lon <= lon <= max_lon
+    return lon >= min_lon or lon <= max_lon
+
+
+def marcador_en_bbox(marcador, bbox):
+    """
+    Indica si el marcador se ve en el bounding box. Los ``cluster`` cuentan
+    si su propio bbox se cruza con el recuadro, aunque su centro quede fuera.
+    """
+    if marcador['tipo_marcador'] != 'cluster':
+        return en_bbox(marcador['coordinates'], bbox)
+    c_min_lon, c_min_lat, c_max_lon, c_max_lat = marcador['bbox']
+    min_lon, min_lat, max_lon, max_lat = bbox
+    if c_min_lat > max_lat or c_max_lat < min_lat:
+        return False
+    if min_lon <= max_lon:
+        return c_min_lon <= max_lon and c_max_lon >= min_lon
+    return c_max_lon >= min_lon or c_min_lon <= max_lon
+
+
+def agrupar_marcadores(marcadores, zoom):
+    """
+    Agrupa marcadores en una cuadrícula de ``CELDA_AGRUPACION_PX`` píxeles
+    (proyección Web Mercator) para el nivel de zoom dado.
+
+    Las celdas con un solo marcador lo devuelven tal cual; las demás se
+    reemplazan por un objeto ``cluster`` con el número de marcadores, su
+    bounding box y una miniatura representativa.
+    """
+    celdas = defaultdict(list)
+    for marcador in marcadores:
+        x, y = proyectar(marcador['coordinates'], zoom)
+        celdas[(int(x // CELDA_AGRUPACION_PX), int(y // CELDA_AGRUPACION_PX))].append(marcador)
+
+    resultado = []
+    for (cx, cy), grupo in celdas.items():
+        if len(grupo) == 1:
+            resultado.append(grupo[0])
+            continue
+        lons = [m['coordinates'][0] for m in grupo]
+        lats = [m['coordinates'][1] for m in grupo]
+        resultado.append({
+            'id': f"cluster-{zoom}-{cx}-{cy}",
+            'coordinates': [sum(lons) / len(lons), sum(lats) / len(lats)],
+            'cantidad': len(grupo),
+            'cantidad_lugares': len({m['lugar_id'] for m in grupo}),
+            'thumbnail': next((m['thumbnail'] for m in grupo if m.get('thumbnail')), None),
+            'bbox': [min(lons), min(lats), max(lons), max(lats)],
+            'tipo_marcador': 'cluster'  # Identificador del tipo
+        })
+    return resultado
+
+
+def precalcular_agrupaciones(marcadores):
+    """Agrupaciones para cada zoom de 0 a ``ZOOM_MAX_AGRUPACION`` (claves como texto, para JSON)."""
+    return {str(zoom): agrupar_marcadores(marcadores, zoom) for zoom in range(ZOOM_MAX_AGRUPACION + 1)}
+
+
+def marcadores_para_zoom(snapshot, zoom):
+    """
+    Marcadores del snapshot para el zoom pedido: agrupados en zooms bajos,
+    individuales en el resto. Si el snapshot no trae la agrupación de ese
+    zoom (p. ej. guardado antes de cambiar ``ZOOM_MAX_AGRUPACION``) se
+    calcula a partir de los marcadores.
+    """
+    if zoom is None or zoom > ZOOM_MAX_AGRUPACION:
+        return snapshot.marcadores
+    agrupados = (snapshot.agrupaciones or {}).get(str(zoom))
+    if agrupados is None:
+        agrupados = agrupar_marcadores(snapshot.marcadores, zoom)
+    return agrupados
+
+
+def obtener_snapshot():
+    """
+    Devuelve el ``MapaSnapshot`` con los marcadores y agrupaciones precalculados.
+
+    Si el snapshot fue invalidado se reconstruye y se guarda, salvo que otra
+    invalidación haya ocurrido mientras se construía (en ese caso se sirve lo
+    construido sin guardarlo y la siguiente petición lo reintenta).
+    """
+    snapshot, _ = MapaSnapshot.objects.get_or_create(pk=MapaSnapshot.SINGLETON_ID)
+    if snapshot.marcadores is not None:
+        return snapshot
+
+    snapshot.marcadores = construir_marcadores()
+    snapshot.agrupaciones = precalcular_agrupaciones(snapshot.marcadores)
+    # ``actualizado`` no se toca: refleja el último cambio de datos, no la reconstrucción
+    MapaSnapshot.objects.filter(pk=snapshot.pk, version=snapshot.version).update(
+        marcadores=snapshot.marcadores,
+        agrupaciones=snapshot.agrupaciones,
+    )
+    return snapshot
+
+
+def marcadores_compactos(marcadores):
+    """
+    Formato compacto (``?format=compact``): lugares y entradas aparecen una
+    sola vez y las fotos los referencian por índice.
+
+    Los marcadores ``lugar_simple`` van en ``simples`` y los ``cluster`` se
+    copian sin cambios.
+    """
+    lugares, entradas = [], []
+    indice_lugar, indice_entrada = {}, {}
+    fotos, simples, clusters = [], [], []
+
+    def _indice_lugar(marcador):
+        if marcador['lugar_id'] not in indice_lugar:
+            indice_lugar[marcador['lugar_id']] = len(lugares)
+            lugares.append({campo: marcador[campo] for campo in CAMPOS_COMPACTO_LUGAR})
+        return indice_lugar[marcador['lugar_id']]
+
+    for marcador in marcadores:
+        tipo = marcador['tipo_marcador']
+        if tipo == 'cluster':
+            clusters.append(marcador)
+        elif tipo == 'lugar_simple':
+            simples.append({
+                'lugar': _indice_lugar(marcador),
+                'thumbnail': marcador['thumbnail'],
+                'imagen_completa': marcador['imagen_completa'],
+            })
+        else:
+            lugar = _indice_lugar(marcador)
+            if marcador['entrada_id'] not in indice_entrada:
+                indice_entrada[marcador['entrada_id']] = len(entradas)
+                entradas.append({
+                    'id': marcador['entrada_id'],
+                    'slug': marcador['entrada_slug'],
+                    'titulo': marcador['entrada_titulo'],
+                })
+            fotos.append({
+                'id': marcador['foto_id'],
+                'lugar': lugar,
+                'entrada': indice_entrada[marcador['entrada_id']],
+                'thumbnail': marcador['thumbnail'],
+                'imagen_completa': marcador['imagen_completa'],
+                'orden': marcador['foto_orden'],
+                'descripcion': marcador['foto_descripcion'],
+            })
+
+    return {
+        'lugares': lugares,
+        'entradas': entradas,
+        'fotos': fotos,
+        'simples': simples,
+        'clusters': clusters,
+    }
+
+
+def marcadores_geojson(marcadores):
+    """
+    FeatureCollection GeoJSON (``?format=geojson``) con un Feature por lugar.
+
+    Las entradas y sus fotos van anidadas en las propiedades del lugar, así
+    que nombre, ciudad, etc. no se repiten por cada foto.
+    """
+    features = []
+    por_lugar = {}
+    for marcador in marcadores:
+        if marcador['tipo_marcador'] == 'cluster':
+            propiedades = {k: v for k, v in marcador.items() if k != 'coordinates'}
+            features.append(_feature(marcador['coordinates'], propiedades))
+            continue
+
+        lugar = por_lugar.get(marcador['lugar_id'])
+        if lugar is None:
+            propiedades = {campo: marcador[campo] for campo in CAMPOS_COMPACTO_LUGAR if campo != 'coordinates'}
+            propiedades.update(tipo_marcador=marcador['tipo_marcador'], entradas=[])
+            lugar = por_lugar[marcador['lugar_id']] = _feature(marcador['coordinates'], propiedades)
+            features.append(lugar)
+
+        if marcador['tipo_marcador'] == 'lugar_simple':
+            lugar['properties']['thumbnail'] = marcador['thumbnail']
+            lugar['properties']['imagen_completa'] = marcador['imagen_completa']
+            continue
+
+        entradas = lugar['properties']['entradas']
+        if not entradas or entradas[-1]['id'] != marcador['entrada_id']:
+            entradas.append({
+                'id': marcador['entrada_id'],
+                'slug': marcador['entrada_slug'],
+                'titulo': marcador['entrada_titulo'],
+                'fotos': [],
+            })
+        entradas[-1]['fotos'].append({
+            'id': marcador['foto_id'],
+            'thumbnail': marcador['thumbnail'],
+            'imagen_completa': marcador['imagen_completa'],
+            'orden': marcador['foto_orden'],
+            'descripcion': marcador['foto_descripcion'],
+        })
+
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def _feature(coordenadas, propiedades):
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': coordenadas},
+        'properties': propiedades,
+    }
+
+
+def proyectar(coordenadas, zoom):
+    """Coordenadas ``[lon, lat]`` → píxeles Web Mercator en el zoom dado."""
+    lon, lat = coordenadas
+    lat = max(min(lat, LATITUD_MAX_MERCATOR), -LATITUD_MAX_MERCATOR)
+    tamano_mundo = 256 * 2 ** zoom
+    x = (lon + 180) / 360 * tamano_mundo
+    sen_lat = math.sin(math.radians(lat))
+    y = (0.5 - math.log((1 + sen_lat) / (1 - sen_lat)) / (4 * math.pi)) * tamano_mundo
+    return x, y
+
+
+def _coordenadas(lugar):
+    return [float(lugar['longitud']), float(lugar['latitud'])]
+
+
+def _marcador_foto_blog(lugar, entrada, foto):
+    return {
+        'id': f"{lugar['id']}-{entrada['id']}-{foto['id']}",  # ID único combinado
+        'lugar_id': lugar['id'],
+        'entrada_id': entrada['id'],
+        'entrada_slug': entrada['slug'],
+        'foto_id': foto['id'],
+        'coordinates': _coordenadas(lugar),
+        'nombre': lugar['nombre'],
+        'ciudad': lugar['ciudad'],
+        'pais': lugar['pais'],
+        'thumbnail': foto['thumbnail_url'],
+        'imagen_completa': foto['url_imagen'],
+        'descripcion': lugar['descripcion_corta'],
+        'entrada_titulo': entrada['titulo'],
+        'foto_orden': foto['orden_en_entrada'],
+        'foto_descripcion': foto['descripcion'],
+        'tipo_marcador': 'foto_blog'  # Identificador del tipo
+    }
+
+
+def _marcador_lugar_simple(lugar, fotos_lugar):
+    foto_principal = next((f for f in fotos_lugar if f['es_foto_principal_lugar']), None)
+    if not foto_principal and fotos_lugar:
+        foto_principal = fotos_lugar[0]
+
+    return {
+        'id': lugar['id'],
+        'lugar_id': lugar['id'],
+        'coordinates': _coordenadas(lugar),
+        'nombre': lugar['nombre'],
+        'ciudad': lugar['ciudad'],
+        'pais': lugar['pais'],
+        'thumbnail': foto_principal['thumbnail_url'] if foto_principal else None,
+        'imagen_completa': foto_principal['url_imagen'] if foto_principal else None,
+        'descripcion': lugar['descripcion_corta'],
+        'tipo_marcador': 'lugar_simple'  # Identificador del tipo
+    }
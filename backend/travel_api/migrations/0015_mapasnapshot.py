@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_api', '0014_populate_slugs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MapaSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=1, help_text='Se incrementa con cada cambio en los datos del mapa.')),
+                ('marcadores', models.JSONField(blank=True, help_text='Marcadores serializados. Vacío si hay que reconstruirlos.', null=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Snapshot del mapa',
+                'verbose_name_plural': 'Snapshots del mapa',
+            },
+        ),
+    ]
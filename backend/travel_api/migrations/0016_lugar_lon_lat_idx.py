@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_api', '0015_mapasnapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lugar',
+            index=models.Index(fields=['longitud', 'latitud'], name='lugar_lon_lat_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_api', '0016_lugar_lon_lat_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mapasnapshot',
+            name='agrupaciones',
+            field=models.JSONField(blank=True, help_text='Marcadores agrupados por nivel de zoom (clave: zoom).', null=True),
+        ),
+    ]
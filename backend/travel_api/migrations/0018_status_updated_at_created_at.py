@@ -0,0 +1,81 @@
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def rellenar_fechas(apps, schema_editor):
+    """
+    Las filas existentes no tienen historial: se usa la fecha de publicación
+    en las entradas y el momento de la migración en el resto.
+    """
+    ahora = timezone.now()
+    Lugar = apps.get_model('travel_api', 'Lugar')
+    Fotografia = apps.get_model('travel_api', 'Fotografia')
+    EntradaDeBlog = apps.get_model('travel_api', 'EntradaDeBlog')
+
+    Lugar.objects.update(created_at=ahora, updated_at=ahora)
+    Fotografia.objects.update(created_at=ahora, updated_at=ahora)
+    EntradaDeBlog.objects.update(updated_at=models.F('fecha_publicacion'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_api', '0017_mapasnapshot_agrupaciones'),
+    ]
+
+    operations = [
+        # 1. Columnas nulas para poder rellenar las filas existentes
+        migrations.AddField(
+            model_name='lugar',
+            name='created_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='lugar',
+            name='updated_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='fotografia',
+            name='created_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='fotografia',
+            name='updated_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='entradadeblog',
+            name='updated_at',
+            field=models.DateTimeField(null=True),
+        ),
+        # 2. Rellenar
+        migrations.RunPython(rellenar_fechas, migrations.RunPython.noop),
+        # 3. Definición final (no nulas, updated_at indexado)
+        migrations.AlterField(
+            model_name='lugar',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name='lugar',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='fotografia',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name='fotografia',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='entradadeblog',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
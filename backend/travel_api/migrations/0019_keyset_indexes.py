@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_api', '0018_status_updated_at_created_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='entradadeblog',
+            index=models.Index(fields=['-fecha_publicacion', '-id'], name='entrada_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fotografia',
+            index=models.Index(fields=['entrada_blog', 'orden_en_entrada', 'id'], name='foto_keyset_idx'),
+        ),
+    ]
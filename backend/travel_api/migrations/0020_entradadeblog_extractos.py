@@ -0,0 +1,43 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:21
+
+from django.db import migrations, models
+
+# Copia de EntradaDeBlog.LONGITUDES_EXTRACTO al crear la migración
+LONGITUDES_EXTRACTO = {
+    'extracto_lista': 150,
+    'extracto_detalle': 200,
+}
+
+
+def calcular_extractos(apps, schema_editor):
+    """Rellena los extractos de las entradas existentes."""
+    from travel_api.utils import extract_excerpt
+
+    EntradaDeBlog = apps.get_model('travel_api', 'EntradaDeBlog')
+    entradas = list(EntradaDeBlog.objects.only('id', 'contenido_markdown'))
+    for entrada in entradas:
+        for campo, longitud in LONGITUDES_EXTRACTO.items():
+            setattr(entrada, campo, extract_excerpt(entrada.contenido_markdown, max_length=longitud))
+    # bulk_update no toca updated_at: los datos visibles no cambian
+    EntradaDeBlog.objects.bulk_update(entradas, list(LONGITUDES_EXTRACTO), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_api', '0019_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entradadeblog',
+            name='extracto_detalle',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Extracto largo para el detalle de la entrada.'),
+        ),
+        migrations.AddField(
+            model_name='entradadeblog',
+            name='extracto_lista',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Extracto corto para los listados.'),
+        ),
+        migrations.RunPython(calcular_extractos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:26
+
+from django.db import migrations, models
+
+
+def calcular_secciones(apps, schema_editor):
+    """Divide en secciones el HTML de las entradas existentes."""
+    from travel_api.utils import dividir_secciones
+
+    EntradaDeBlog = apps.get_model('travel_api', 'EntradaDeBlog')
+    entradas = list(EntradaDeBlog.objects.only('id', 'contenido_html'))
+    for entrada in entradas:
+        entrada.secciones, entrada.toc = dividir_secciones(entrada.contenido_html)
+    # bulk_update no toca updated_at: los datos visibles no cambian
+    EntradaDeBlog.objects.bulk_update(entradas, ['secciones', 'toc'], batch_size=200)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_api', '0020_entradadeblog_extractos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entradadeblog',
+            name='secciones',
+            field=models.JSONField(blank=True, default=list, editable=False, help_text='Secciones del HTML por títulos h1/h2: [{id, titulo, html}].'),
+        ),
+        migrations.AddField(
+            model_name='entradadeblog',
+            name='toc',
+            field=models.JSONField(blank=True, default=list, editable=False, help_text='Tabla de contenidos: [{nivel, id, titulo}].'),
+        ),
+        migrations.RunPython(calcular_secciones, migrations.RunPython.noop),
+    ]
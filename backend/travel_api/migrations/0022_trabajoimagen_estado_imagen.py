@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_api', '0021_entradadeblog_secciones_toc'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fotografia',
+            name='estado_imagen',
+            field=models.CharField(choices=[('pendiente', 'Pendiente'), ('lista', 'Lista'), ('error', 'Error')], default='lista', help_text='Pendiente mientras un worker genera el thumbnail (ver TrabajoImagen).', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='TrabajoImagen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_proceso', 'En proceso'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=12)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('ultimo_error', models.TextField(blank=True, default='')),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('iniciado', models.DateTimeField(blank=True, null=True)),
+                ('terminado', models.DateTimeField(blank=True, null=True)),
+                ('fotografia', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trabajos_imagen', to='travel_api.fotografia')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de imagen',
+                'verbose_name_plural': 'Trabajos de imagen',
+                'indexes': [models.Index(fields=['estado', 'creado'], name='trabajo_imagen_cola_idx')],
+            },
+        ),
+    ]
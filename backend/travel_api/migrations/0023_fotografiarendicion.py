@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('travel_api', '0022_trabajoimagen_estado_imagen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FotografiaRendicion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ancho', models.PositiveIntegerField()),
+                ('alto', models.PositiveIntegerField()),
+                ('formato', models.CharField(default='jpeg', max_length=10)),
+                ('archivo', models.CharField(help_text='Ruta relativa a MEDIA_ROOT.', max_length=500)),
+                ('bytes', models.PositiveIntegerField(default=0)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('fotografia', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rendiciones', to='travel_api.fotografia')),
+            ],
+            options={
+                'verbose_name': 'Rendición de fotografía',
+                'verbose_name_plural': 'Rendiciones de fotografías',
+                'ordering': ['ancho'],
+                'constraints': [models.UniqueConstraint(fields=('fotografia', 'ancho', 'formato'), name='rendicion_unica')],
+            },
+        ),
+    ]
@@ -1,10 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings # Para referenciar al User model
 import uuid # Add this import
 from django.db.models.signals import pre_save
 from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 from django.utils.text import slugify
+from django.utils import timezone
 import logging
 
 # Configurar logger para este módulo
@@ -20,12 +21,26 @@ class StatusChoices(models.TextChoices):
     DISABLED = 'disabled', _('Disabled')
 
 
+class EstadoImagen(models.TextChoices):
+    PENDIENTE = 'pendiente', _('Pendiente')
+    LISTA = 'lista', _('Lista')
+    ERROR = 'error', _('Error')
+
+
 class StatusQuerySet(models.QuerySet):
     def active(self):
         return self.filter(status=StatusChoices.ACTIVE)
 
+    def changed_since(self, ts):
+        """Filas creadas, modificadas o deshabilitadas después de ``ts``."""
+        return self.filter(updated_at__gt=ts)
+
+    def changed_between(self, desde, hasta):
+        """Filas modificadas en el intervalo ``(desde, hasta]``."""
+        return self.filter(updated_at__gt=desde, updated_at__lte=hasta)
 
-class StatusManager(models.Manager):
+
+class StatusManager(models.Manager.from_queryset(StatusQuerySet)):
     def get_queryset(self):
         # Por defecto solo elementos activos
         return StatusQuerySet(self.model, using=self._db).filter(status=StatusChoices.ACTIVE)
@@ -35,13 +50,15 @@ class StatusManager(models.Manager):
 
 
 class StatusModel(models.Model):
-    """Modelo abstracto que añade un campo 'status'."""
+    """Modelo abstracto que añade un campo 'status' y la fecha de última modificación."""
 
     status = models.CharField(max_length=10, choices=StatusChoices.choices, default=StatusChoices.ACTIVE)
+    # Indexado para validación de caché, sincronización incremental y exportaciones
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     # Managers
     objects = StatusManager()      # Solo activos
-    all_objects = models.Manager() # Todos
+    all_objects = models.Manager.from_queryset(StatusQuerySet)() # Todos
 
     class Meta:
         abstract = True
@@ -59,6 +76,7 @@ class Lugar(StatusModel):
     longitud = models.DecimalField(max_digits=18, decimal_places=15)
     descripcion_corta = models.TextField(blank=True, null=True, help_text="Descripción breve para el pop-up del mapa.")
     foto_iconica_url = models.URLField(max_length=500, blank=True, null=True, help_text="URL/path de la foto icónica para el pop-up.")
+    created_at = models.DateTimeField(auto_now_add=True)
     # Podríamos añadir un campo para el tipo de marcador si fuera necesario diferenciarlo en la DB
     # tipo_marcador = models.CharField(max_length=50, blank=True, null=True, help_text="Ej: solo_fotos, blog, favorito")
 
@@ -68,6 +86,9 @@ class Lugar(StatusModel):
     class Meta:
         verbose_name_plural = "Lugares"
         unique_together = ['latitud', 'longitud'] # No deberían existir dos lugares exactamente en el mismo punto.
+        # unique_together ya indexa (latitud, longitud); este índice cubre las
+        # consultas por bounding box que filtran primero por longitud.
+        indexes = [models.Index(fields=['longitud', 'latitud'], name='lugar_lon_lat_idx')]
 
 class Fotografia(StatusModel):
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, help_text="Identificador único universal para la fotografía.")
@@ -85,12 +106,16 @@ class Fotografia(StatusModel):
     es_foto_principal_lugar = models.BooleanField(default=False, help_text="Indica si esta es la foto icónica principal del Lugar (para el pop-up). Considerar lógica para asegurar solo una.")
     direccion_captura = models.TextField(blank=True, null=True, help_text="Dirección textual o descripción de la ubicación donde se tomó la foto.")
     orden_en_entrada = models.PositiveIntegerField(default=0, help_text="Orden de la fotografía dentro de la entrada de blog.")
+    estado_imagen = models.CharField(max_length=10, choices=EstadoImagen.choices, default=EstadoImagen.LISTA, help_text="Pendiente mientras un worker genera el thumbnail (ver TrabajoImagen).")
+    created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Foto de {self.lugar.nombre} ({self.id})"
     
     class Meta:
         ordering = ['entrada_blog', 'orden_en_entrada', '-fecha_toma']
+        # Paginación keyset de /api/fotografias/ (ver pagination.py)
+        indexes = [models.Index(fields=['entrada_blog', 'orden_en_entrada', 'id'], name='foto_keyset_idx')]
 
 class EntradaDeBlog(StatusModel):
     titulo = models.CharField(max_length=255)
@@ -109,9 +134,32 @@ class EntradaDeBlog(StatusModel):
     contenido_html = models.TextField(blank=True, null=True, help_text="Contenido convertido automáticamente a HTML desde Markdown. No editar manualmente.")
     # Campo temporal para migración - mantener compatibilidad
     contenido = models.TextField(blank=True, null=True, help_text="Campo temporal para migración. Usar contenido_markdown.")
+    # Extractos en texto plano, calculados al guardar (ver convert_markdown_to_html)
+    extracto_lista = models.TextField(blank=True, default='', editable=False, help_text="Extracto corto para los listados.")
+    extracto_detalle = models.TextField(blank=True, default='', editable=False, help_text="Extracto largo para el detalle de la entrada.")
+    # HTML dividido por títulos y tabla de contenidos, calculados al guardar
+    secciones = models.JSONField(default=list, blank=True, editable=False, help_text="Secciones del HTML por títulos h1/h2: [{id, titulo, html}].")
+    toc = models.JSONField(default=list, blank=True, editable=False, help_text="Tabla de contenidos: [{nivel, id, titulo}].")
     # Campo slug para URLs amigables
     slug = models.SlugField(max_length=255, unique=True, null=True, blank=True, help_text="URL amigable generada automáticamente desde el título. Ej: catedral-colonia")
     
+    # Campo de extracto -> longitud máxima
+    LONGITUDES_EXTRACTO = {
+        'extracto_lista': 150,
+        'extracto_detalle': 200,
+    }
+
+    def actualizar_extractos(self):
+        """Recalcula los extractos desde ``contenido_markdown``."""
+        from .utils import extract_excerpt
+        for campo, longitud in self.LONGITUDES_EXTRACTO.items():
+            setattr(self, campo, extract_excerpt(self.contenido_markdown, max_length=longitud))
+
+    def actualizar_secciones(self):
+        """Recalcula ``secciones`` y ``toc`` desde ``contenido_html``."""
+        from .utils import dividir_secciones
+        self.secciones, self.toc = dividir_secciones(self.contenido_html)
+
     # Mantener compatibilidad temporal con el campo anterior
     def get_contenido_procesado(self):
         """Retorna el contenido HTML procesado, priorizando contenido_html"""
@@ -149,18 +197,126 @@ class EntradaDeBlog(StatusModel):
     class Meta:
         ordering = ['-fecha_publicacion']
         verbose_name_plural = "Entradas de Blog"
+        # Paginación keyset de /api/entradas-blog/ (ver pagination.py)
+        indexes = [models.Index(fields=['-fecha_publicacion', '-id'], name='entrada_keyset_idx')]
+
+class MapaSnapshot(models.Model):
+    """
+    Documento precalculado con los marcadores de ``/api/mapa-data/``.
+
+    Existe una sola fila. Los signals de Lugar, Fotografia y EntradaDeBlog
+    incrementan ``version`` y descartan ``marcadores``; la siguiente petición
+    al mapa lo reconstruye (ver ``mapa.obtener_snapshot``).
+    """
+    SINGLETON_ID = 1
+
+    version = models.PositiveBigIntegerField(default=1, help_text="Se incrementa con cada cambio en los datos del mapa.")
+    marcadores = models.JSONField(blank=True, null=True, help_text="Marcadores serializados. Vacío si hay que reconstruirlos.")
+    agrupaciones = models.JSONField(blank=True, null=True, help_text="Marcadores agrupados por nivel de zoom (clave: zoom).")
+    actualizado = models.DateTimeField(auto_now=True)  # Último cambio en los datos publicados
+
+    @classmethod
+    def invalidar(cls):
+        """Incrementa la versión y marca el snapshot para reconstrucción."""
+        actualizados = cls.objects.filter(pk=cls.SINGLETON_ID).update(
+            version=models.F('version') + 1,
+            marcadores=None,
+            agrupaciones=None,
+            actualizado=timezone.now(),
+        )
+        if not actualizados:
+            cls.objects.get_or_create(pk=cls.SINGLETON_ID)
+
+    def __str__(self):
+        return f"Snapshot del mapa v{self.version}"
+
+    @classmethod
+    def estado(cls):
+        """Devuelve ``(version, actualizado)`` con una sola consulta ligera."""
+        estado = cls.objects.filter(pk=cls.SINGLETON_ID).values_list('version', 'actualizado').first()
+        if estado is None:
+            snapshot, _ = cls.objects.get_or_create(pk=cls.SINGLETON_ID)
+            estado = (snapshot.version, snapshot.actualizado)
+        return estado
+
+    class Meta:
+        verbose_name = "Snapshot del mapa"
+        verbose_name_plural = "Snapshots del mapa"
+
+class FotografiaRendicion(models.Model):
+    """Versión redimensionada de una Fotografia para ``srcset`` (ver rendiciones.py)."""
+    fotografia = models.ForeignKey(Fotografia, related_name='rendiciones', on_delete=models.CASCADE)
+    ancho = models.PositiveIntegerField()
+    alto = models.PositiveIntegerField()
+    formato = models.CharField(max_length=10, default='jpeg')
+    archivo = models.CharField(max_length=500, help_text="Ruta relativa a MEDIA_ROOT.")
+    bytes = models.PositiveIntegerField(default=0)
+    creado = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Foto {self.fotografia_id} a {self.ancho}px ({self.formato})"
+
+    class Meta:
+        ordering = ['ancho']
+        verbose_name = "Rendición de fotografía"
+        verbose_name_plural = "Rendiciones de fotografías"
+        constraints = [
+            models.UniqueConstraint(fields=['fotografia', 'ancho', 'formato'], name='rendicion_unica'),
+        ]
+
+class EstadoTrabajo(models.TextChoices):
+    PENDIENTE = 'pendiente', _('Pendiente')
+    EN_PROCESO = 'en_proceso', _('En proceso')
+    COMPLETADO = 'completado', _('Completado')
+    ERROR = 'error', _('Error')
+
+
+class TrabajoImagen(models.Model):
+    """
+    Trabajo de procesamiento de imagen en cola (sin broker externo).
+
+    Se crea en la misma transacción que guarda la Fotografia y lo ejecuta un
+    worker (``manage.py procesar_trabajos``). Los workers toman los trabajos
+    con un UPDATE condicional, así que pueden ejecutarse varios a la vez
+    (ver ``trabajos.tomar_trabajo``).
+    """
+    fotografia = models.ForeignKey(Fotografia, related_name='trabajos_imagen', on_delete=models.CASCADE)
+    estado = models.CharField(max_length=12, choices=EstadoTrabajo.choices, default=EstadoTrabajo.PENDIENTE)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    ultimo_error = models.TextField(blank=True, default='')
+    creado = models.DateTimeField(auto_now_add=True)
+    iniciado = models.DateTimeField(blank=True, null=True)
+    terminado = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Trabajo {self.pk} de la foto {self.fotografia_id} ({self.estado})"
+
+    class Meta:
+        verbose_name = "Trabajo de imagen"
+        verbose_name_plural = "Trabajos de imagen"
+        indexes = [models.Index(fields=['estado', 'creado'], name='trabajo_imagen_cola_idx')]
 
 # Signal para auto-convertir Markdown a HTML y generar slug
 @receiver(pre_save, sender=EntradaDeBlog)
 def convert_markdown_to_html(sender, instance, **kwargs):
     """
-    Signal que convierte automáticamente el contenido Markdown a HTML
-    y genera el slug antes de guardar la entrada de blog.
+    Signal que convierte automáticamente el contenido Markdown a HTML,
+    calcula los extractos y las secciones, y genera el slug antes de guardar
+    la entrada de blog. Si el Markdown no cambió respecto a la fila guardada
+    no se vuelve a procesar.
     """
     from .utils import markdown_to_html
-    
-    if instance.contenido_markdown:
-        instance.contenido_html = markdown_to_html(instance.contenido_markdown)
+
+    guardado = None
+    if instance.pk:
+        guardado = sender.all_objects.filter(pk=instance.pk).values_list('contenido_markdown', flat=True).first()
+    sin_cambios = guardado == instance.contenido_markdown and (instance.contenido_html or not guardado)
+
+    if not sin_cambios:
+        if instance.contenido_markdown:
+            instance.contenido_html = markdown_to_html(instance.contenido_markdown)
+        instance.actualizar_extractos()
+        instance.actualizar_secciones()
     
     # Generar slug automáticamente si no existe
     if not instance.slug and instance.titulo:
@@ -172,34 +328,57 @@ from django.db.models.signals import post_save
 @receiver(post_save, sender=Fotografia)
 def generate_image_urls_and_thumbnail(sender, instance, created, **kwargs):
     """
-    Signal que genera automáticamente las URLs de las imágenes
-    y crea thumbnails después de guardar.
+    Signal que genera automáticamente las URLs de las imágenes y encola la
+    creación del thumbnail y de las renditions después de guardar (las genera
+    un worker, ver trabajos.py, para no bloquear la petición).
     """
-    if instance.imagen and not instance.thumbnail:
-        try:
-            # Crear thumbnail
-            from .utils import create_thumbnail
-            thumbnail_file = create_thumbnail(instance.imagen)
-            
-            if thumbnail_file:
-                # Guardar el thumbnail sin activar signals infinitos
-                instance.thumbnail.save(
-                    thumbnail_file.name,
-                    thumbnail_file,
-                    save=False
-                )
-                
-                # Actualizar URLs sin activar signals
-                Fotografia.objects.filter(pk=instance.pk).update(
-                    url_imagen=instance.imagen.url,
-                    thumbnail_url=instance.thumbnail.url
-                )
-        except Exception as e:
-            # Registrar el error usando logging para evitar prints en producción
-            logger.exception("Error generando thumbnail: %s", e)
+    falta_thumbnail = instance.imagen and not instance.thumbnail
+    if falta_thumbnail or (created and (instance.imagen or instance.url_imagen)):
+        from .trabajos import encolar_imagen
+        encolar_imagen(instance)
     
     # Actualizar URLs si no están establecidas
     if instance.imagen and not instance.url_imagen:
         Fotografia.objects.filter(pk=instance.pk).update(
-            url_imagen=instance.imagen.url
+            url_imagen=instance.imagen.url,
+            updated_at=timezone.now()
         )
+
+# Signals para invalidar el snapshot del mapa cuando cambian sus datos.
+# Se registran al final para ejecutarse después de la generación de thumbnails.
+from django.db.models.signals import post_delete
+
+@receiver(post_save, sender=Lugar)
+@receiver(post_delete, sender=Lugar)
+@receiver(post_save, sender=Fotografia)
+@receiver(post_delete, sender=Fotografia)
+@receiver(post_save, sender=EntradaDeBlog)
+@receiver(post_delete, sender=EntradaDeBlog)
+def invalidar_snapshot_mapa(sender, **kwargs):
+    """Marca el snapshot del mapa como obsoleto."""
+    MapaSnapshot.invalidar()
+
+
+# Signals para invalidar los tiles del mapa en disco. Antes de guardar se
+# recuerdan las coordenadas previas (p. ej. si un Lugar se movió) y, tras el
+# commit, se borran los tiles de las posiciones anterior y nueva.
+@receiver(pre_save, sender=Lugar)
+@receiver(pre_save, sender=Fotografia)
+@receiver(pre_save, sender=EntradaDeBlog)
+def recordar_coordenadas_tiles(sender, instance, **kwargs):
+    from .tiles import coordenadas_afectadas
+
+    previa = sender.all_objects.filter(pk=instance.pk).first() if instance.pk else None
+    instance._coordenadas_tiles_previas = coordenadas_afectadas(previa) if previa else set()
+
+@receiver(post_save, sender=Lugar)
+@receiver(post_delete, sender=Lugar)
+@receiver(post_save, sender=Fotografia)
+@receiver(post_delete, sender=Fotografia)
+@receiver(post_save, sender=EntradaDeBlog)
+@receiver(post_delete, sender=EntradaDeBlog)
+def invalidar_tiles_mapa(sender, instance, **kwargs):
+    from .tiles import coordenadas_afectadas, invalidar_tiles
+
+    coordenadas = coordenadas_afectadas(instance) | getattr(instance, '_coordenadas_tiles_previas', set())
+    transaction.on_commit(lambda: invalidar_tiles(coordenadas))
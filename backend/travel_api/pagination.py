@@ -0,0 +1,126 @@
+"""
+Paginación por cursor (keyset) para los listados grandes.
+
+A diferencia de ``PageNumberPagination`` (OFFSET) y de ``CursorPagination``
+de DRF (que solo usa el primer campo del orden y recurre a un desplazamiento
+en los empates), aquí el cursor guarda los valores de *todos* los campos del
+orden de la última fila y la página siguiente se obtiene con una comparación
+lexicográfica ``WHERE (a, b, c) > (...)``, que aprovecha el índice compuesto.
+"""
+import base64
+import datetime
+import json
+import operator
+from functools import reduce
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    Como DjangoJSONEncoder, pero con los microsegundos de fechas y horas:
+    recortados a milisegundos, el cursor quedaría por debajo del valor real
+    y la comparación estricta saltaría las filas de ese mismo milisegundo.
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginación hacia adelante por los campos de ``ordering``.
+
+    El último campo debe ser único (p. ej. ``id``) para que el orden sea total.
+    Los campos que admiten NULL se ordenan con los NULL al final.
+    """
+    ordering = ('id',)
+    page_size = api_settings.PAGE_SIZE or 20
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.campos = [campo.lstrip('-') for campo in self.ordering]
+        self.descendente = [campo.startswith('-') for campo in self.ordering]
+        self.nulables = [queryset.model._meta.get_field(campo).null for campo in self.campos]
+
+        queryset = queryset.order_by(*self._expresiones_orden())
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            try:
+                queryset = queryset.filter(self._despues_de(self._decodificar(cursor)))
+            except (ValueError, TypeError, ValidationError):
+                raise NotFound('Cursor inválido')
+
+        filas = list(queryset[:self.page_size + 1])
+        self.hay_siguiente = len(filas) > self.page_size
+        filas = filas[:self.page_size]
+        self.ultima = filas[-1] if filas else None
+        return filas
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.hay_siguiente:
+            return None
+        valores = [getattr(self.ultima, campo) for campo in self.campos]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self._codificar(valores))
+
+    def _expresiones_orden(self):
+        expresiones = []
+        for campo, desc, nulable in zip(self.campos, self.descendente, self.nulables):
+            extra = {'nulls_last': True} if nulable else {}
+            expresiones.append(F(campo).desc(**extra) if desc else F(campo).asc(**extra))
+        return expresiones
+
+    def _despues_de(self, valores):
+        """Filas estrictamente posteriores a ``valores`` en el orden compuesto."""
+        ramas = []
+        iguales = Q()
+        for campo, desc, nulable, valor in zip(self.campos, self.descendente, self.nulables, valores):
+            if valor is None:
+                # Los NULL van al final: nada es posterior en este campo
+                iguales &= Q(**{f"{campo}__isnull": True})
+                continue
+            posterior = Q(**{f"{campo}__{'lt' if desc else 'gt'}": valor})
+            if nulable:
+                posterior |= Q(**{f"{campo}__isnull": True})
+            ramas.append(iguales & posterior)
+            iguales &= Q(**{campo: valor})
+        return reduce(operator.or_, ramas, Q(pk__in=[]))
+
+    def _codificar(self, valores):
+        datos = json.dumps(valores, cls=CursorEncoder).encode()
+        return base64.urlsafe_b64encode(datos).decode().rstrip('=')
+
+    def _decodificar(self, cursor):
+        try:
+            relleno = '=' * (-len(cursor) % 4)
+            valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        except (ValueError, TypeError):
+            raise NotFound('Cursor inválido')
+        if not isinstance(valores, list) or len(valores) != len(self.campos):
+            raise NotFound('Cursor inválido')
+        return valores
+
+
+class FotografiaCursorPagination(KeysetPagination):
+    ordering = ('entrada_blog_id', 'orden_en_entrada', 'id')
+
+
+class EntradaDeBlogCursorPagination(KeysetPagination):
+    ordering = ('-fecha_publicacion', '-id')
@@ -0,0 +1,41 @@
+"""
+Ejecutores para repartir trabajo de imagen entre procesos en los comandos
+de carga y regeneración (ver generate_missing_thumbnails y upload_blog_photos).
+
+Los procesos se crean con ``spawn`` e inicializan Django por su cuenta: con
+``fork`` heredarían la conexión a la base de datos del proceso principal y
+al terminar la cerrarían también para él.
+"""
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import django
+
+
+def pool_de_procesos(workers):
+    """``ProcessPoolExecutor`` de ``workers`` procesos, o ``EjecutorEnLinea`` si es 1."""
+    if workers <= 1:
+        return EjecutorEnLinea()
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup,
+    )
+
+
+class EjecutorEnLinea:
+    """Misma interfaz que ProcessPoolExecutor, pero ejecuta cada tarea al enviarla."""
+
+    def submit(self, funcion, *args, **kwargs):
+        futuro = Future()
+        try:
+            futuro.set_result(funcion(*args, **kwargs))
+        except Exception as e:
+            futuro.set_exception(e)
+        return futuro
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
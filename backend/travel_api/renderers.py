@@ -0,0 +1,30 @@
+from rest_framework.renderers import JSONRenderer
+
+from .mapa import marcadores_compactos, marcadores_geojson
+
+
+class MarcadoresCompactosRenderer(JSONRenderer):
+    """
+    Renderiza la lista de marcadores del mapa en formato compacto.
+    Se selecciona con ``?format=compact``.
+    """
+    format = 'compact'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, list):
+            data = marcadores_compactos(data)
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+class MarcadoresGeoJSONRenderer(JSONRenderer):
+    """
+    Renderiza la lista de marcadores del mapa como FeatureCollection GeoJSON.
+    Se selecciona con ``?format=geojson`` o ``Accept: application/geo+json``.
+    """
+    media_type = 'application/geo+json'
+    format = 'geojson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, list):
+            data = marcadores_geojson(data)
+        return super().render(data, accepted_media_type, renderer_context)
@@ -0,0 +1,345 @@
+"""
+Versiones redimensionadas (renditions) de cada fotografía.
+
+Por cada ancho de ``settings.FOTOS_ANCHOS_RENDICION`` y cada formato de
+``settings.FOTOS_FORMATOS_RENDICION`` (JPEG, WebP y AVIF si Pillow lo
+soporta) se guarda ``MEDIA_ROOT/photos/r/{uuid}/{ancho}.{extension}`` y una
+fila ``FotografiaRendicion``.
+Todas salen de una sola decodificación del original: se redimensiona de la
+más grande a la más pequeña, cada una a partir de la anterior. Nunca se
+amplía: los anchos mayores que el original se reducen a su ancho real.
+
+La API las expone como listas listas para ``srcset`` (ver ``srcset``), para
+que la galería y los popups descarguen solo el tamaño que muestran: en JPEG
+en ``srcset`` y por formato en ``fuentes`` para los ``<source>`` de
+``<picture>``, que el navegador elige sin depender del header ``Accept`` de
+la petición a la API (fetch/axios no anuncian formatos de imagen).
+Los thumbnails guardan sus variantes junto al JPEG (``foto_thumb.jpg.webp``)
+y ``servir_media`` elige entre ellas según el ``Accept`` de la imagen (ver
+``formato_preferido``).
+
+Los thumbnails de todos los comandos y del worker salen de ``crear_miniatura``:
+en los JPEG se decodifica ya reducido con ``Image.draft`` (escala DCT 1/2,
+1/4 o 1/8) en lugar de decodificar los 12 Mpx del original para quedarse
+con 300 px (ver ``abrir_reducida`` y ``manage.py benchmark_miniaturas``).
+
+Además, ``/media/r/{ancho}x{alto}/{uuid}.{formato}`` genera bajo demanda una
+versión que cabe en la caja pedida (solo tamaños de
+``settings.FOTOS_TAMANOS_BAJO_DEMANDA``). Se guarda en
+``settings.FOTOS_RENDICIONES_CACHE_ROOT`` con un nombre derivado del
+contenido (ver ``ruta_bajo_demanda``) y las peticiones simultáneas de la misma
+imagen esperan a una sola generación (bloqueo de archivo). Sin extensión
+(``/media/r/{ancho}x{alto}/{uuid}``) el formato se negocia con ``Accept``.
+"""
+import fcntl
+import hashlib
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.db import transaction
+from PIL import Image, ImageOps, features
+
+from .models import FotografiaRendicion
+from .utils import escribir_atomico
+
+FORMATO_RENDICION = 'jpeg'
+CALIDAD_JPEG = 85
+TAMANO_MINIATURA = (300, 300)
+
+# Cuánto más grande que la caja final se decodifica antes de LANCZOS
+MARGEN_DRAFT = 2.0
+ORIENTACION_EXIF = 0x0112
+
+# Formato -> (formato de PIL, content type, extensión, opciones de guardado)
+FORMATOS_SALIDA = {
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg', {'quality': CALIDAD_JPEG, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', 'image/webp', 'webp', {'quality': 80, 'method': 4}),
+}
+if features.check('avif'):
+    FORMATOS_SALIDA['avif'] = ('AVIF', 'image/avif', 'avif', {'quality': 60, 'speed': 6})
+
+EXTENSIONES = {datos[2]: formato for formato, datos in FORMATOS_SALIDA.items()}
+
+# De mejor a peor compresión; JPEG es el que entiende cualquier cliente
+PREFERENCIA_FORMATOS = ('avif', 'webp', 'jpeg')
+TIPOS_MIME = {'jpeg': 'image/jpeg', 'webp': 'image/webp', 'avif': 'image/avif'}
+
+# Incrementar al cambiar cómo se generan las imágenes bajo demanda
+VERSION_BAJO_DEMANDA = 1
+
+
+def ruta_original(foto):
+    """Ruta en disco de la imagen original de ``foto`` (o ``None`` si no tiene)."""
+    if foto.imagen:
+        return foto.imagen.path
+    if foto.url_imagen:
+        # Las fotos cargadas por comando solo guardan la URL (/media/photos/...)
+        return os.path.join(settings.MEDIA_ROOT, 'photos', os.path.basename(foto.url_imagen))
+    return None
+
+
+def formatos_rendicion():
+    """Formatos configurados que Pillow puede escribir, siempre con JPEG primero."""
+    formatos = [f for f in settings.FOTOS_FORMATOS_RENDICION if f in FORMATOS_SALIDA and f != FORMATO_RENDICION]
+    return [FORMATO_RENDICION, *formatos]
+
+
+def formato_preferido(accept, disponibles=PREFERENCIA_FORMATOS):
+    """
+    Mejor formato de ``disponibles`` que el cliente declara en su header
+    ``Accept``. Comodines como ``image/*`` no cuentan: los navegadores que
+    soportan WebP o AVIF los nombran explícitamente.
+    """
+    aceptados = set()
+    for parte in (accept or '').split(','):
+        tipo, *parametros = [p.strip() for p in parte.split(';')]
+        calidad = 1.0
+        for parametro in parametros:
+            nombre, _, valor = parametro.partition('=')
+            if nombre.strip() == 'q':
+                try:
+                    calidad = float(valor)
+                except ValueError:
+                    pass
+        if calidad > 0:
+            aceptados.add(tipo.lower())
+    for formato in PREFERENCIA_FORMATOS:
+        if formato in disponibles and (formato == FORMATO_RENDICION or TIPOS_MIME[formato] in aceptados):
+            return formato
+    return FORMATO_RENDICION
+
+
+def codificar(imagen, formato):
+    """Bytes de ``imagen`` (PIL) en ``formato``."""
+    formato_pil, _, _, opciones = FORMATOS_SALIDA[formato]
+    if imagen.mode not in ('RGB', 'RGBA') or (formato == 'jpeg' and imagen.mode != 'RGB'):
+        imagen = imagen.convert('RGB')
+    contenido = BytesIO()
+    imagen.save(contenido, format=formato_pil, **opciones)
+    return contenido.getvalue()
+
+
+def variantes_modernas(imagen):
+    """``{formato: bytes}`` de ``imagen`` en los formatos configurados además de JPEG."""
+    return {formato: codificar(imagen, formato) for formato in formatos_rendicion()[1:]}
+
+
+def ruta_variante(ruta, formato):
+    """Variante de un thumbnail: ``foto_thumb.jpg`` -> ``foto_thumb.jpg.webp``."""
+    return f"{ruta}.{FORMATOS_SALIDA[formato][2]}"
+
+
+def guardar_variantes(ruta, variantes):
+    """Escribe junto a ``ruta`` las variantes de ``variantes_modernas``."""
+    for formato, contenido in variantes.items():
+        escribir_atomico(ruta_variante(ruta, formato), contenido)
+
+
+def archivo_rendicion(foto, ancho, formato=FORMATO_RENDICION):
+    """Ruta relativa a MEDIA_ROOT de una rendición."""
+    extension = 'jpg' if formato == 'jpeg' else formato
+    return f"photos/r/{foto.uuid}/{ancho}.{extension}"
+
+
+def abrir_original(ruta):
+    """Decodifica la imagen en RGB y con la orientación EXIF aplicada."""
+    with Image.open(ruta) as imagen:
+        return _a_rgb(imagen)
+
+
+def abrir_reducida(origen, tamano, margen=MARGEN_DRAFT):
+    """
+    Como ``abrir_original``, pero los JPEG se decodifican directamente a la
+    menor escala DCT que siga midiendo al menos ``margen`` veces ``tamano``;
+    el resto lo hace LANCZOS. Para un thumbnail de 300 px de una foto de
+    4000x3000 se decodifican 1000x750 píxeles en lugar de 4000x3000.
+    """
+    with Image.open(origen) as imagen:
+        ancho, alto = tamano
+        if imagen.getexif().get(ORIENTACION_EXIF) in (5, 6, 7, 8):
+            # Se rota después: la caja tiene que ir en la orientación del archivo
+            ancho, alto = alto, ancho
+        imagen.draft('RGB', (int(ancho * margen), int(alto * margen)))
+        return _a_rgb(imagen)
+
+
+def _a_rgb(imagen):
+    """Aplica la orientación EXIF y pasa a RGB (transparencias sobre fondo blanco)."""
+    imagen = ImageOps.exif_transpose(imagen)
+    if imagen.mode in ('RGBA', 'LA') or (imagen.mode == 'P' and 'transparency' in imagen.info):
+        imagen = imagen.convert('RGBA')
+        fondo = Image.new('RGB', imagen.size, (255, 255, 255))
+        fondo.paste(imagen, mask=imagen.getchannel('A'))
+        imagen = fondo
+    elif imagen.mode != 'RGB':
+        imagen = imagen.convert('RGB')
+    imagen.load()
+    return imagen
+
+
+def crear_miniatura(origen, tamano=TAMANO_MINIATURA):
+    """Imagen (PIL) de ``origen`` reducida para caber en ``tamano``, sin ampliar."""
+    imagen = abrir_reducida(origen, tamano)
+    imagen.thumbnail(tamano, Image.Resampling.LANCZOS)
+    return imagen
+
+
+def guardar_miniatura(origen, destino, tamano=TAMANO_MINIATURA):
+    """Escribe en ``destino`` el thumbnail JPEG de ``origen`` y sus variantes WebP/AVIF."""
+    imagen = crear_miniatura(origen, tamano)
+    escribir_atomico(str(destino), codificar(imagen, FORMATO_RENDICION))
+    guardar_variantes(str(destino), variantes_modernas(imagen))
+    return imagen
+
+
+def generar_rendiciones(foto):
+    """
+    Genera (o regenera) todas las renditions de ``foto``.
+
+    Returns:
+        list: las ``FotografiaRendicion`` guardadas, de menor a mayor ancho
+
+    Raises:
+        FileNotFoundError: si no se encuentra la imagen original.
+    """
+    ruta = ruta_original(foto)
+    if not ruta:
+        raise FileNotFoundError(f"La foto {foto.pk} no tiene imagen original")
+    original = abrir_original(ruta)
+
+    anchos = sorted({min(ancho, original.width) for ancho in settings.FOTOS_ANCHOS_RENDICION}, reverse=True)
+    formatos = formatos_rendicion()
+    actual = original
+    rendiciones = []
+    for ancho in anchos:
+        alto = max(1, round(original.height * ancho / original.width))
+        if actual.size != (ancho, alto):
+            actual = actual.resize((ancho, alto), Image.Resampling.LANCZOS)
+        for formato in formatos:
+            contenido = codificar(actual, formato)
+            archivo = archivo_rendicion(foto, ancho, formato)
+            escribir_atomico(os.path.join(settings.MEDIA_ROOT, archivo), contenido)
+            rendiciones.append(FotografiaRendicion(
+                fotografia=foto, ancho=ancho, alto=alto, formato=formato,
+                archivo=archivo, bytes=len(contenido),
+            ))
+
+    with transaction.atomic():
+        anteriores = list(FotografiaRendicion.objects.filter(fotografia=foto))
+        FotografiaRendicion.objects.filter(fotografia=foto).delete()
+        FotografiaRendicion.objects.bulk_create(rendiciones)
+
+    # Archivos de anchos o formatos que ya no se generan
+    vigentes = {r.archivo for r in rendiciones}
+    for rendicion in anteriores:
+        if rendicion.archivo not in vigentes:
+            try:
+                os.remove(os.path.join(settings.MEDIA_ROOT, rendicion.archivo))
+            except FileNotFoundError:
+                pass
+
+    return sorted(rendiciones, key=lambda r: r.ancho)
+
+
+def tamano_permitido(ancho, alto):
+    return (ancho, alto) in {tuple(tamano) for tamano in settings.FOTOS_TAMANOS_BAJO_DEMANDA}
+
+
+def version_original(foto):
+    """
+    Huella corta del original (uuid, tamaño y fecha de modificación del
+    archivo). Cambia si se reemplaza el original, así que sirve de ETag y de
+    ``?v=`` en la URL bajo demanda.
+
+    Raises:
+        FileNotFoundError: si no se encuentra la imagen original.
+    """
+    origen = ruta_original(foto)
+    if not origen:
+        raise FileNotFoundError(f"La foto {foto.pk} no tiene imagen original")
+    estado = os.stat(origen)
+    clave = f"{VERSION_BAJO_DEMANDA}:{foto.uuid}:{estado.st_size}:{estado.st_mtime_ns}"
+    return hashlib.sha256(clave.encode('utf-8')).hexdigest()[:16]
+
+
+def ruta_bajo_demanda(foto, ancho, alto, formato):
+    """
+    Ruta en disco de la imagen bajo demanda. El nombre es un hash de la
+    versión del original y de los parámetros, así que cambia si se reemplaza
+    el original.
+
+    Raises:
+        FileNotFoundError: si no se encuentra la imagen original.
+    """
+    clave = f"{version_original(foto)}:{ancho}x{alto}:{formato}"
+    huella = hashlib.sha256(clave.encode('utf-8')).hexdigest()
+    return os.path.join(settings.FOTOS_RENDICIONES_CACHE_ROOT, huella[:2], f"{huella}.{FORMATOS_SALIDA[formato][2]}")
+
+
+def obtener_bajo_demanda(foto, ancho, alto, formato):
+    """
+    Devuelve la ruta de la imagen de ``foto`` que cabe en ``ancho`` x ``alto``,
+    generándola si aún no existe.
+
+    Un bloqueo exclusivo sobre ``<ruta>.lock`` hace que las peticiones
+    simultáneas (de cualquier hilo o proceso) esperen a la primera en lugar
+    de generar la misma imagen varias veces.
+    """
+    ruta = ruta_bajo_demanda(foto, ancho, alto, formato)
+    if os.path.exists(ruta):
+        return ruta
+
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    candado = f"{ruta}.lock"
+    with open(candado, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            # Si otra petición la generó mientras esperábamos, no se repite
+            if not os.path.exists(ruta):
+                escribir_atomico(ruta, generar_bajo_demanda(ruta_original(foto), ancho, alto, formato))
+                os.remove(candado)
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    return ruta
+
+
+def generar_bajo_demanda(origen, ancho, alto, formato):
+    """Bytes de la imagen ``origen`` reducida para caber en ``ancho`` x ``alto`` (sin ampliar)."""
+    return codificar(crear_miniatura(origen, (ancho, alto)), formato)
+
+
+def url_rendicion(rendicion, request=None):
+    url = f"{settings.MEDIA_URL}{rendicion.archivo}"
+    return request.build_absolute_uri(url) if request else url
+
+
+def datos_rendiciones(rendiciones, request=None, formato=FORMATO_RENDICION):
+    """
+    Lista ``[{'ancho', 'alto', 'url'}]`` de menor a mayor ancho en ``formato``
+    (en JPEG si la foto no tiene renditions en ese formato).
+    """
+    rendiciones = sorted(rendiciones, key=lambda r: r.ancho)
+    if not any(r.formato == formato for r in rendiciones):
+        formato = FORMATO_RENDICION
+    return [
+        {'ancho': r.ancho, 'alto': r.alto, 'url': url_rendicion(r, request)}
+        for r in rendiciones
+        if r.formato == formato
+    ]
+
+
+def srcset(rendiciones, request=None, formato=FORMATO_RENDICION):
+    """Valor del atributo ``srcset``: ``"url 150w, url 300w, ..."``."""
+    return ', '.join(f"{d['url']} {d['ancho']}w" for d in datos_rendiciones(rendiciones, request, formato))
+
+
+def fuentes(rendiciones, request=None):
+    """``[{'tipo', 'srcset'}]`` por formato, del mejor al peor, para ``<source>`` de ``<picture>``."""
+    rendiciones = list(rendiciones)
+    presentes = {r.formato for r in rendiciones}
+    return [
+        {'tipo': TIPOS_MIME[formato], 'srcset': srcset(rendiciones, request, formato)}
+        for formato in PREFERENCIA_FORMATOS
+        if formato in presentes
+    ]
@@ -1,18 +1,104 @@
 from rest_framework import serializers
+from django.db.models import Prefetch
 from .models import Lugar, Fotografia, EntradaDeBlog
+from .rendiciones import datos_rendiciones, srcset, fuentes
 from django.contrib.auth.models import User
 
-class UserSerializer(serializers.ModelSerializer):
+
+def _lista_parametro(request, nombre):
+    valor = request.query_params.get(nombre)
+    if not valor:
+        return None
+    return {campo.strip() for campo in valor.split(',') if campo.strip()}
+
+
+# Secciones que devuelve ?secciones= si el valor no es un entero válido
+SECCIONES_INICIALES = 1
+
+
+def secciones_pedidas(request):
+    """Número de secciones pedidas con ``?secciones=N``."""
+    try:
+        return max(0, int(request.query_params.get('secciones')))
+    except (TypeError, ValueError):
+        return SECCIONES_INICIALES
+
+
+def campo_visible(nombre, request):
+    """Indica si ``nombre`` debe incluirse según ``?fields=`` y ``?omit=``."""
+    pedidos = _lista_parametro(request, 'fields')
+    omitidos = _lista_parametro(request, 'omit') or set()
+    return (pedidos is None or nombre in pedidos) and nombre not in omitidos
+
+
+class CamposDinamicosMixin:
+    """
+    Permite elegir los campos de la respuesta desde la URL:
+    ``?fields=id,titulo`` (solo esos) u ``?omit=contenido_markdown`` (todos menos esos).
+
+    Solo se aplica al serializer raíz de la respuesta; los anidados se
+    devuelven completos. Los nombres desconocidos se ignoran.
+
+    ``columnas_diferibles`` relaciona columnas pesadas del modelo con los
+    campos del serializer que las usan, para que la vista no las cargue
+    cuando no se piden (ver ``columnas_no_usadas``, y ``columnas_sin_campos``
+    para los serializers anidados).
+
+    ``campos_excluidos`` permite a cada serializer quitar campos según otros
+    parámetros de la petición (``request`` es ``None`` si está anidado).
+    """
+    columnas_diferibles = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is not None and not self._es_raiz():
+            request = None
+        return {nombre: campo for nombre, campo in fields.items() if self.campo_incluido(nombre, request)}
+
+    def _es_raiz(self):
+        padre = self.parent
+        return padre is None or (isinstance(padre, serializers.ListSerializer) and padre.parent is None)
+
+    @classmethod
+    def campos_excluidos(cls, request):
+        return set()
+
+    @classmethod
+    def campo_incluido(cls, nombre, request):
+        if nombre in cls.campos_excluidos(request):
+            return False
+        return request is None or campo_visible(nombre, request)
+
+    @classmethod
+    def columnas_no_usadas(cls, request):
+        """Columnas que ningún campo pedido necesita (para ``QuerySet.defer``)."""
+        return [
+            columna for columna, campos in cls.columnas_diferibles.items()
+            if not any(cls.campo_incluido(campo, request) for campo in campos)
+        ]
+
+    @classmethod
+    def columnas_sin_campos(cls):
+        """
+        Columnas que ningún campo usa cuando el serializer va anidado o sin
+        petición (p. ej. para un Prefetch o un queryset a nivel de módulo).
+        """
+        excluidos = cls.campos_excluidos(None)
+        return [columna for columna, campos in cls.columnas_diferibles.items() if not set(campos) - excluidos]
+
+
+class UserSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'first_name', 'last_name']
 
-class LugarSerializer(serializers.ModelSerializer):
+class LugarSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = Lugar
         fields = ['id', 'nombre', 'ciudad', 'pais', 'latitud', 'longitud', 'descripcion_corta', 'foto_iconica_url']
 
-class FotografiaSerializer(serializers.ModelSerializer):
+class FotografiaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     # Campos del lugar
     lugar_nombre = serializers.CharField(source='lugar.nombre', read_only=True)
     lugar_ciudad = serializers.CharField(source='lugar.ciudad', read_only=True)
@@ -28,6 +114,21 @@ class FotografiaSerializer(serializers.ModelSerializer):
     imagen_url = serializers.SerializerMethodField()
     thumbnail_url_absoluta = serializers.SerializerMethodField()
     imagen_alta_calidad_url = serializers.SerializerMethodField()  # Nueva URL para imagen de alta calidad
+
+    # Versiones redimensionadas (ver rendiciones.py): [{ancho, alto, url}] y srcset
+    # en el mejor formato que acepte el cliente, y fuentes por formato para <picture>
+    rendiciones = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+    fuentes = serializers.SerializerMethodField()
+
+    # De la entrada (select_related) solo se leen titulo, id y slug
+    columnas_diferibles = {
+        'entrada_blog__contenido_markdown': (),
+        'entrada_blog__contenido_html': (),
+        'entrada_blog__contenido': (),
+        'entrada_blog__secciones': (),
+        'entrada_blog__toc': (),
+    }
     
     class Meta:
         model = Fotografia
@@ -35,9 +136,22 @@ class FotografiaSerializer(serializers.ModelSerializer):
             'id', 'uuid', 'lugar', 'lugar_nombre', 'lugar_ciudad', 'lugar_pais',
             'entrada_blog', 'entrada_blog_titulo', 'entrada_blog_id', 'entrada_blog_slug', 'orden_en_entrada',
             'imagen_url', 'thumbnail_url_absoluta', 'imagen_alta_calidad_url', 'autor_fotografia', 'fecha_toma',
-            'descripcion', 'palabras_clave', 'coordenadas', 'direccion_captura'
+            'descripcion', 'palabras_clave', 'coordenadas', 'direccion_captura', 'estado_imagen',
+            'rendiciones', 'srcset', 'fuentes'
         ]
     
+    def get_rendiciones(self, obj):
+        """Renditions JPEG de menor a mayor ancho (precargar ``rendiciones``)"""
+        return datos_rendiciones(obj.rendiciones.all(), self.context.get('request'))
+
+    def get_srcset(self, obj):
+        """Valor listo para el atributo ``srcset`` de <img> (JPEG; WebP/AVIF en ``fuentes``)"""
+        return srcset(obj.rendiciones.all(), self.context.get('request'))
+
+    def get_fuentes(self, obj):
+        """[{tipo, srcset}] del mejor al peor formato, para los <source> de <picture>"""
+        return fuentes(obj.rendiciones.all(), self.context.get('request'))
+
     def get_coordenadas(self, obj):
         """Devuelve las coordenadas del lugar como un array [longitud, latitud]"""
         return [float(obj.lugar.longitud), float(obj.lugar.latitud)]
@@ -89,17 +203,32 @@ class FotografiaSerializer(serializers.ModelSerializer):
         # Si no hay información suficiente, devolvemos None
         return None
 
-class EntradaDeBlogConFotosSerializer(serializers.ModelSerializer):
+class EntradaDeBlogConFotosSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer para mostrar una entrada de blog con todas sus fotografías"""
     fotografias = FotografiaSerializer(many=True, read_only=True)
     autor_info = UserSerializer(source='autor', read_only=True)
     lugar_asociado_info = LugarSerializer(source='lugar_asociado', read_only=True)
     contenido_procesado = serializers.CharField(source='contenido_html', read_only=True)
-    extracto = serializers.SerializerMethodField()
+    extracto = serializers.CharField(source='extracto_detalle', read_only=True)
     
     # Campos para fechas flexibles
     fecha_display = serializers.SerializerMethodField()
     mostrar_solo_mes_anio = serializers.BooleanField(read_only=True)
+
+    # Lectura por secciones (?secciones=N): TOC y primeras N secciones en lugar
+    # del contenido completo; el resto se pide a /entradas-blog/{id}/secciones/
+    toc = serializers.JSONField(read_only=True)
+    secciones = serializers.SerializerMethodField()
+    total_secciones = serializers.SerializerMethodField()
+
+    # Columnas de texto largo y los campos que las necesitan
+    columnas_diferibles = {
+        'contenido_markdown': ('contenido_markdown',),
+        'contenido_html': ('contenido_procesado',),
+        'contenido': (),  # Campo heredado que no se serializa
+        'secciones': ('secciones', 'total_secciones'),
+        'toc': ('toc',),
+    }
     
     class Meta:
         model = EntradaDeBlog
@@ -107,22 +236,42 @@ class EntradaDeBlogConFotosSerializer(serializers.ModelSerializer):
             'id', 'slug', 'titulo', 'descripcion', 'lugar_asociado', 'lugar_asociado_info',
             'fecha_publicacion', 'fecha_evento', 'fecha_display', 'mostrar_solo_mes_anio',
             'autor', 'autor_info', 'contenido_markdown', 
-            'contenido_procesado', 'extracto', 'fotografias'
+            'contenido_procesado', 'extracto', 'fotografias',
+            'toc', 'secciones', 'total_secciones'
         ]
-    
-    def get_extracto(self, obj):
-        """Genera un extracto del contenido"""
-        from .utils import extract_excerpt
-        return extract_excerpt(obj.contenido_markdown, max_length=200)
+
+    @classmethod
+    def campos_excluidos(cls, request):
+        if request is not None and 'secciones' in request.query_params:
+            return {'contenido_markdown', 'contenido_procesado'}
+        return {'toc', 'secciones', 'total_secciones'}
     
     def get_fecha_display(self, obj):
         """Retorna la fecha formateada según la configuración"""
         return obj.get_fecha_display().isoformat()
 
-class LugarDetalleSerializer(serializers.ModelSerializer):
+    def get_secciones(self, obj):
+        return obj.secciones[:secciones_pedidas(self.context['request'])]
+
+    def get_total_secciones(self, obj):
+        return len(obj.secciones)
+
+class LugarDetalleSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer para mostrar un lugar con todas sus entradas de blog y fotografías"""
     entradas_blog = EntradaDeBlogConFotosSerializer(many=True, read_only=True)
     fotografias = FotografiaSerializer(many=True, read_only=True)
+
+    # Árbol de precarga que espera este serializer. Las fotos se cargan sin
+    # JOINs: su lugar y su entrada se enlazan en memoria (ver _enlazar_padres).
+    prefetch_related = (
+        Prefetch('entradas_blog', queryset=EntradaDeBlog.objects.select_related('autor').defer(
+            *EntradaDeBlogConFotosSerializer.columnas_sin_campos()
+        )),
+        Prefetch('entradas_blog__fotografias', queryset=Fotografia.objects.all()),
+        Prefetch('fotografias', queryset=Fotografia.objects.all()),
+        'entradas_blog__fotografias__rendiciones',
+        'fotografias__rendiciones',
+    )
     
     class Meta:
         model = Lugar
@@ -131,16 +280,61 @@ class LugarDetalleSerializer(serializers.ModelSerializer):
             'descripcion_corta', 'foto_iconica_url', 'entradas_blog', 'fotografias'
         ]
 
-class EntradaDeBlogSerializer(serializers.ModelSerializer):
+    def to_representation(self, instance):
+        if 'entradas_blog' in getattr(instance, '_prefetched_objects_cache', {}):
+            _enlazar_padres(instance)
+        return super().to_representation(instance)
+
+
+def _enlazar_padres(lugar):
+    """
+    Asigna a entradas y fotos precargadas los padres que ya están en memoria
+    (el propio lugar y sus entradas) para que los serializers anidados no los
+    vuelvan a consultar. Los padres que no están cargados (fotos de otro lugar
+    o de entradas ajenas) se traen con una consulta por modelo.
+    """
+    entradas = {entrada.pk: entrada for entrada in lugar.entradas_blog.all()}
+    fotos = list(lugar.fotografias.all())
+    for entrada in entradas.values():
+        entrada.lugar_asociado = lugar
+        for foto in entrada.fotografias.all():
+            foto.entrada_blog = entrada
+            fotos.append(foto)
+
+    lugares_faltantes = {f.lugar_id for f in fotos if f.lugar_id != lugar.pk}
+    entradas_faltantes = {
+        f.entrada_blog_id for f in fotos
+        if f.entrada_blog_id and f.entrada_blog_id not in entradas
+    }
+    lugares = Lugar.all_objects.in_bulk(lugares_faltantes) if lugares_faltantes else {}
+    lugares[lugar.pk] = lugar
+    if entradas_faltantes:
+        entradas.update(EntradaDeBlog.all_objects.in_bulk(entradas_faltantes))
+
+    for foto in fotos:
+        foto.lugar = lugares[foto.lugar_id]
+        if foto.entrada_blog_id:
+            foto.entrada_blog = entradas[foto.entrada_blog_id]
+
+class EntradaDeBlogSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     autor_info = UserSerializer(source='autor', read_only=True)
     lugar_asociado_info = LugarSerializer(source='lugar_asociado', read_only=True)
     contenido_procesado = serializers.CharField(source='contenido_html', read_only=True)
-    extracto = serializers.SerializerMethodField()
+    extracto = serializers.CharField(source='extracto_lista', read_only=True)
     
     # Campos para fechas flexibles
     fecha_display = serializers.SerializerMethodField()
     mostrar_solo_mes_anio = serializers.BooleanField(read_only=True)
 
+    # Columnas de texto largo y los campos que las necesitan
+    columnas_diferibles = {
+        'contenido_markdown': ('contenido_markdown',),
+        'contenido_html': ('contenido_procesado',),
+        'contenido': (),  # Campo heredado que no se serializa
+        'secciones': (),
+        'toc': (),
+    }
+
     class Meta:
         model = EntradaDeBlog
         fields = [
@@ -162,11 +356,6 @@ class EntradaDeBlogSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['autor_info', 'lugar_asociado_info', 'contenido_procesado']
     
-    def get_extracto(self, obj):
-        """Genera un extracto del contenido"""
-        from .utils import extract_excerpt
-        return extract_excerpt(obj.contenido_markdown, max_length=150) 
-    
     def get_fecha_display(self, obj):
         """Retorna la fecha formateada según la configuración"""
         return obj.get_fecha_display().isoformat() 
\ No newline at end of file
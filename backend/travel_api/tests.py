@@ -1,3 +1,1170 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import cambios, rendiciones, trabajos, utils
+from .models import (
+    Lugar, Fotografia, EntradaDeBlog, StatusChoices, TrabajoImagen, EstadoImagen, EstadoTrabajo, MapaSnapshot,
+    FotografiaRendicion,
+)
+
+
+class DatosMixin:
+    """Utilidades para crear lugares, entradas y fotos de prueba."""
+
+    _contador = 0
+
+    @classmethod
+    def crear_lugar(cls, **kwargs):
+        cls._contador += 1
+        datos = {
+            'nombre': f'Lugar {cls._contador}',
+            'ciudad': 'Bogotá',
+            'pais': 'Colombia',
+            'latitud': Decimal('4.6') + Decimal(cls._contador) / 1000,
+            'longitud': Decimal('-74.08') - Decimal(cls._contador) / 1000,
+        }
+        datos.update(kwargs)
+        return Lugar.objects.create(**datos)
+
+    @classmethod
+    def crear_entrada(cls, lugar, autor, **kwargs):
+        cls._contador += 1
+        datos = {
+            'titulo': f'Entrada {cls._contador}',
+            'lugar_asociado': lugar,
+            'autor': autor,
+            'contenido_markdown': '# Título\n\nTexto de **prueba**.',
+        }
+        datos.update(kwargs)
+        return EntradaDeBlog.objects.create(**datos)
+
+    @staticmethod
+    def crear_imagen(nombre='foto.jpg', tamano=(1200, 800)):
+        """Imagen JPEG en memoria lista para asignar a ``Fotografia.imagen``."""
+        contenido = BytesIO()
+        Image.new('RGB', tamano, (200, 120, 40)).save(contenido, format='JPEG')
+        return SimpleUploadedFile(nombre, contenido.getvalue(), content_type='image/jpeg')
+
+    @classmethod
+    def crear_foto(cls, lugar, entrada=None, **kwargs):
+        cls._contador += 1
+        datos = {
+            'lugar': lugar,
+            'entrada_blog': entrada,
+            'url_imagen': f'/media/photos/foto_{cls._contador}.jpg',
+            'thumbnail_url': f'/media/photos/thumbnails/foto_{cls._contador}_thumb.jpg',
+        }
+        datos.update(kwargs)
+        return Fotografia.objects.create(**datos)
+
+
+class MapaDataTests(DatosMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='x')
+
+    def poblar(self, lugares, entradas_por_lugar, fotos_por_entrada):
+        for _ in range(lugares):
+            lugar = self.crear_lugar()
+            for _ in range(entradas_por_lugar):
+                entrada = self.crear_entrada(lugar, self.autor)
+                for orden in range(fotos_por_entrada):
+                    self.crear_foto(lugar, entrada, orden_en_entrada=orden)
+            # Lugar sin entradas con una foto suelta
+            self.crear_foto(self.crear_lugar())
+
+    def contar_consultas(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('mapa-data'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.json()
+
+    def test_numero_de_consultas_constante(self):
+        self.poblar(lugares=1, entradas_por_lugar=1, fotos_por_entrada=1)
+        consultas_pocos, marcadores = self.contar_consultas()
+        self.assertEqual(len(marcadores), 2)
+
+        self.poblar(lugares=4, entradas_por_lugar=3, fotos_por_entrada=5)
+        consultas_muchos, marcadores = self.contar_consultas()
+        self.assertEqual(len(marcadores), 2 + 4 * 3 * 5 + 4)
+        self.assertEqual(consultas_pocos, consultas_muchos)
+
+    def test_marcadores_foto_blog_y_lugar_simple(self):
+        lugar = self.crear_lugar(nombre='Cartagena')
+        entrada = self.crear_entrada(lugar, self.autor, titulo='Murallas')
+        segunda = self.crear_foto(lugar, entrada, orden_en_entrada=2)
+        primera = self.crear_foto(lugar, entrada, orden_en_entrada=1)
+        self.crear_foto(lugar, entrada, status=StatusChoices.DISABLED)
+
+        solo = self.crear_lugar(nombre='Villa de Leyva')
+        self.crear_foto(solo)
+        principal = self.crear_foto(solo, es_foto_principal_lugar=True)
+
+        _, marcadores = self.contar_consultas()
+        foto_blog = [m for m in marcadores if m['tipo_marcador'] == 'foto_blog']
+        self.assertEqual([m['foto_id'] for m in foto_blog], [primera.id, segunda.id])
+        self.assertEqual(foto_blog[0]['id'], f'{lugar.id}-{entrada.id}-{primera.id}')
+        self.assertEqual(foto_blog[0]['entrada_slug'], entrada.slug)
+        self.assertEqual(foto_blog[0]['coordinates'], [float(lugar.longitud), float(lugar.latitud)])
+
+        simple = [m for m in marcadores if m['tipo_marcador'] == 'lugar_simple']
+        self.assertEqual(len(simple), 1)
+        self.assertEqual(simple[0]['id'], solo.id)
+        self.assertEqual(simple[0]['thumbnail'], principal.thumbnail_url)
+
+
+class MapaSnapshotTests(DatosMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='x')
+
+    def pedir_mapa(self, **params):
+        return self.client.get(reverse('mapa-data'), params)
+
+    def test_se_sirve_desde_el_snapshot(self):
+        lugar = self.crear_lugar()
+        self.crear_foto(lugar)
+        primera = self.pedir_mapa()
+
+        with CaptureQueriesContext(connection) as ctx:
+            segunda = self.pedir_mapa()
+        # Versión para el ETag + lectura del snapshot
+        self.assertEqual(len(ctx.captured_queries), 2)
+        self.assertEqual(primera.json(), segunda.json())
+        self.assertEqual(primera['X-Mapa-Version'], segunda['X-Mapa-Version'])
+
+    def test_cambios_invalidan_el_snapshot(self):
+        lugar = self.crear_lugar(nombre='Antes')
+        version = int(self.pedir_mapa()['X-Mapa-Version'])
+
+        lugar.nombre = 'Después'
+        lugar.save()
+        response = self.pedir_mapa()
+        self.assertGreater(int(response['X-Mapa-Version']), version)
+        self.assertEqual(response.json()[0]['nombre'], 'Después')
+
+        entrada = self.crear_entrada(lugar, self.autor)
+        foto = self.crear_foto(lugar, entrada)
+        self.assertEqual(self.pedir_mapa().json()[0]['foto_id'], foto.id)
+
+        foto.delete()
+        self.assertEqual(self.pedir_mapa().json(), [])
+
+    def test_version_en_la_url_permite_cache_largo(self):
+        version = self.pedir_mapa()['X-Mapa-Version']
+        self.assertNotIn('immutable', self.pedir_mapa().get('Cache-Control', ''))
+        self.assertIn('immutable', self.pedir_mapa(v=version)['Cache-Control'])
+
+
+class MapaBboxTests(DatosMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='x')
+        cls.bogota = cls.crear_lugar(nombre='Bogotá', latitud=Decimal('4.6'), longitud=Decimal('-74.08'))
+        cls.madrid = cls.crear_lugar(nombre='Madrid', latitud=Decimal('40.41'), longitud=Decimal('-3.70'))
+        cls.fiyi = cls.crear_lugar(nombre='Suva', latitud=Decimal('-18.14'), longitud=Decimal('178.44'))
+        entrada = cls.crear_entrada(cls.bogota, cls.autor)
+        cls.foto_bogota = cls.crear_foto(cls.bogota, entrada)
+        cls.crear_foto(cls.madrid)
+
+    def pedir(self, **params):
+        return self.client.get(reverse('mapa-data'), params)
+
+    def test_solo_marcadores_dentro_del_bbox(self):
+        response = self.pedir(bbox='-80,0,-70,10', zoom='6')
+        self.assertEqual(response.status_code, 200)
+        marcadores = response.json()
+        self.assertEqual([m['lugar_id'] for m in marcadores], [self.bogota.id])
+        self.assertEqual(marcadores[0]['foto_id'], self.foto_bogota.id)
+
+    def test_bbox_que_cruza_el_antimeridiano(self):
+        marcadores = self.pedir(bbox='170,-30,-170,0').json()
+        self.assertEqual([m['lugar_id'] for m in marcadores], [self.fiyi.id])
+
+    def test_bbox_invalido(self):
+        self.assertEqual(self.pedir(bbox='1,2,3').status_code, 400)
+        self.assertEqual(self.pedir(bbox='0,10,5,0').status_code, 400)
+        self.assertEqual(self.pedir(bbox='0,0,5,5', zoom='40').status_code, 400)
+
+
+class MapaAgrupacionTests(DatosMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='x')
+        cls.bogota = cls.crear_lugar(latitud=Decimal('4.60'), longitud=Decimal('-74.08'))
+        cls.chia = cls.crear_lugar(latitud=Decimal('4.86'), longitud=Decimal('-74.05'))
+        entrada = cls.crear_entrada(cls.bogota, cls.autor)
+        for orden in range(3):
+            cls.crear_foto(cls.bogota, entrada, orden_en_entrada=orden)
+        cls.crear_foto(cls.chia)
+        cls.madrid = cls.crear_lugar(latitud=Decimal('40.41'), longitud=Decimal('-3.70'))
+
+    def pedir(self, **params):
+        return self.client.get(reverse('mapa-data'), params).json()
+
+    def test_zoom_bajo_devuelve_clusters(self):
+        marcadores = self.pedir(zoom=3)
+        clusters = [m for m in marcadores if m['tipo_marcador'] == 'cluster']
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(clusters[0]['cantidad'], 4)
+        self.assertEqual(clusters[0]['cantidad_lugares'], 2)
+        self.assertIsNotNone(clusters[0]['thumbnail'])
+        # Madrid queda sola en su celda y se envía como marcador normal
+        self.assertIn(self.madrid.id, [m.get('lugar_id') for m in marcadores])
+
+    def test_zoom_alto_devuelve_marcadores_individuales(self):
+        marcadores = self.pedir(zoom=15)
+        self.assertEqual(len(marcadores), 5)
+        self.assertNotIn('cluster', {m['tipo_marcador'] for m in marcadores})
+
+    def test_clusters_filtrados_por_bbox(self):
+        marcadores = self.pedir(zoom=3, bbox='-10,30,10,50')
+        self.assertEqual([m['lugar_id'] for m in marcadores], [self.madrid.id])
+
+    def test_cluster_que_entra_en_el_bbox_sin_su_centro(self):
+        # Solo Chía queda dentro; el centro del cluster (más cerca de Bogotá) no
+        marcadores = self.pedir(zoom=3, bbox='-75,4.8,-73,5')
+        self.assertEqual([m['tipo_marcador'] for m in marcadores], ['cluster'])
+        self.assertEqual(marcadores[0]['cantidad'], 4)
+
+    def test_snapshot_sin_agrupaciones(self):
+        self.pedir(zoom=3)
+        MapaSnapshot.objects.update(agrupaciones=None)
+        marcadores = self.pedir(zoom=3)
+        self.assertIn('cluster', {m['tipo_marcador'] for m in marcadores})
+        self.assertEqual(sum(m.get('cantidad', 1) for m in marcadores), 5)
+
+
+class MapaTilesTests(DatosMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='x')
+        cls.lugar = cls.crear_lugar(latitud=Decimal('4.60'), longitud=Decimal('-74.08'))
+        cls.crear_foto(cls.lugar)
+
+    def setUp(self):
+        self.tiles_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tiles_root, ignore_errors=True)
+        ajustes = override_settings(MAPA_TILES_ROOT=self.tiles_root)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def pedir_tile(self, z, x, y):
+        return self.client.get(reverse('mapa-tile', args=[z, x, y]))
+
+    def test_tile_con_marcadores_y_tile_vacio(self):
+        # Bogotá en zoom 12 cae en el tile (1205, 1995)
+        response = self.pedir_tile(12, 1205, 1995)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([m['lugar_id'] for m in response.json()], [self.lugar.id])
+        self.assertEqual(self.pedir_tile(12, 0, 0).json(), [])
+        self.assertEqual(self.pedir_tile(3, 9, 0).status_code, 404)
+
+    def test_tile_se_sirve_desde_disco(self):
+        self.pedir_tile(12, 1205, 1995)
+        self.assertTrue(os.path.exists(os.path.join(self.tiles_root, '12', '1205', '1995.json')))
+        with CaptureQueriesContext(connection) as ctx:
+            self.pedir_tile(12, 1205, 1995)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_tile_vacio_no_se_guarda(self):
+        self.assertEqual(self.pedir_tile(22, 0, 0).json(), [])
+        self.assertEqual(self.pedir_tile(12, 0, 0).json(), [])
+        self.assertEqual(os.listdir(self.tiles_root), [])
+
+    def test_cambios_invalidan_solo_sus_tiles(self):
+        otro = self.crear_lugar(latitud=Decimal('40.41'), longitud=Decimal('-3.70'))
+        self.pedir_tile(12, 1205, 1995)
+        self.pedir_tile(0, 0, 0)
+        ruta_otro = os.path.join(self.tiles_root, '12', '2005', '1544.json')
+        self.pedir_tile(12, 2005, 1544)
+        self.assertTrue(os.path.exists(ruta_otro))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lugar.nombre = 'Renombrado'
+            self.lugar.save()
+
+        self.assertFalse(os.path.exists(os.path.join(self.tiles_root, '12', '1205', '1995.json')))
+        self.assertFalse(os.path.exists(os.path.join(self.tiles_root, '0', '0', '0.json')))
+        self.assertTrue(os.path.exists(ruta_otro))
+        self.assertEqual(self.pedir_tile(12, 1205, 1995).json()[0]['nombre'], 'Renombrado')
+        self.assertEqual(self.pedir_tile(12, 2005, 1544).json()[0]['lugar_id'], otro.id)
+
+    def test_mover_un_lugar_invalida_el_tile_anterior(self):
+        self.pedir_tile(12, 1205, 1995)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lugar.latitud = Decimal('40.41')
+            self.lugar.longitud = Decimal('-3.70')
+            self.lugar.save()
+        self.assertEqual(self.pedir_tile(12, 1205, 1995).json(), [])
+
+
+class MapaFormatosTests(DatosMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='x')
+        cls.lugar = cls.crear_lugar(nombre='Cartagena')
+        cls.entrada = cls.crear_entrada(cls.lugar, cls.autor)
+        cls.fotos = [cls.crear_foto(cls.lugar, cls.entrada, orden_en_entrada=i) for i in range(3)]
+        cls.simple = cls.crear_lugar(nombre='Barichara')
+        cls.crear_foto(cls.simple)
+
+    def pedir(self, **params):
+        return self.client.get(reverse('mapa-data'), params)
+
+    def test_formato_compacto(self):
+        response = self.pedir(format='compact')
+        self.assertEqual(response.status_code, 200)
+        datos = response.json()
+        self.assertEqual([l['nombre'] for l in datos['lugares']], ['Cartagena', 'Barichara'])
+        self.assertEqual(len(datos['entradas']), 1)
+        self.assertEqual([f['id'] for f in datos['fotos']], [f.id for f in self.fotos])
+        self.assertEqual({(f['lugar'], f['entrada']) for f in datos['fotos']}, {(0, 0)})
+        self.assertEqual(datos['simples'][0]['lugar'], 1)
+        self.assertLess(len(response.content), len(self.pedir().content))
+
+    def test_formato_geojson(self):
+        response = self.pedir(format='geojson')
+        self.assertEqual(response['Content-Type'], 'application/geo+json')
+        datos = response.json()
+        self.assertEqual(datos['type'], 'FeatureCollection')
+        self.assertEqual(len(datos['features']), 2)
+        cartagena = datos['features'][0]
+        self.assertEqual(cartagena['geometry']['coordinates'], [float(self.lugar.longitud), float(self.lugar.latitud)])
+        self.assertEqual(len(cartagena['properties']['entradas'][0]['fotos']), 3)
+
+    def test_formato_por_defecto_sin_cambios(self):
+        self.assertIsInstance(self.pedir().json(), list)
+
+
+class PeticionesCondicionalesTests(DatosMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='x')
+        cls.lugar = cls.crear_lugar()
+        cls.entrada = cls.crear_entrada(cls.lugar, cls.autor)
+        cls.foto = cls.crear_foto(cls.lugar, cls.entrada)
+
+    def urls(self):
+        return [
+            reverse('mapa-data'),
+            reverse('lugar-list'),
+            reverse('lugar-detail', args=[self.lugar.id]),
+            reverse('fotografia-list'),
+            reverse('entradadeblog-list'),
+            reverse('entrada-blog-slug', args=[self.entrada.slug]),
+            reverse('entrada-blog-galeria', args=[self.entrada.id]),
+            reverse('entrada-blog-galeria-slug', args=[self.entrada.slug]),
+        ]
+
+    def test_304_si_el_cliente_esta_al_dia(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('Last-Modified', response)
+                self.assertIn('Accept', response['Vary'])
+                with CaptureQueriesContext(connection) as ctx:
+                    revalidacion = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(revalidacion.status_code, 304)
+                self.assertIn('Accept', revalidacion['Vary'])
+                self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_cambios_generan_un_etag_nuevo(self):
+        url = reverse('entrada-blog-slug', args=[self.entrada.slug])
+        etag = self.client.get(url)['ETag']
+        self.entrada.titulo = 'Nuevo título'
+        self.entrada.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['titulo'], 'Nuevo título')
+
+
+class CambiosTests(DatosMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='x')
+
+    def test_changed_since_incluye_creados_modificados_y_deshabilitados(self):
+        viejo = self.crear_lugar()
+        intacto = self.crear_lugar()
+        corte = timezone.now()
+
+        nuevo = self.crear_lugar()
+        viejo.nombre = 'Modificado'
+        viejo.save()
+        deshabilitado = self.crear_lugar()
+        deshabilitado.status = StatusChoices.DISABLED
+        deshabilitado.save()
+
+        self.assertEqual(
+            set(Lugar.all_objects.changed_since(corte).values_list('id', flat=True)),
+            {viejo.id, nuevo.id, deshabilitado.id},
+        )
+        self.assertNotIn(intacto.id, Lugar.objects.all().changed_since(corte).values_list('id', flat=True))
+        self.assertNotIn(deshabilitado.id, Lugar.objects.changed_since(corte).values_list('id', flat=True))
+
+
+
+@mock.patch.object(cambios, 'MARGEN_COMMIT', timedelta(0))
+class FeedDeCambiosTests(DatosMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='x')
+        cls.lugar = cls.crear_lugar()
+        cls.entrada = cls.crear_entrada(cls.lugar, cls.autor)
+        cls.foto = cls.crear_foto(cls.lugar, cls.entrada)
+
+    def pedir(self, **params):
+        return self.client.get(reverse('cambios'), params)
+
+    def test_sincronizacion_inicial_y_delta(self):
+        inicial = self.pedir().json()
+        self.assertEqual([l['id'] for l in inicial['lugares']['actualizados']], [self.lugar.id])
+        self.assertEqual([f['id'] for f in inicial['fotografias']['actualizados']], [self.foto.id])
+        self.assertEqual([e['id'] for e in inicial['entradas_blog']['actualizados']], [self.entrada.id])
+
+        vacio = self.pedir(since=inicial['cursor']).json()
+        self.assertEqual(vacio['lugares'], {'actualizados': [], 'deshabilitados': []})
+
+        nueva = self.crear_foto(self.lugar, self.entrada)
+        self.entrada.status = StatusChoices.DISABLED
+        self.entrada.save()
+
+        delta = self.pedir(since=vacio['cursor']).json()
+        self.assertEqual([f['id'] for f in delta['fotografias']['actualizados']], [nueva.id])
+        self.assertEqual(delta['entradas_blog'], {'actualizados': [], 'deshabilitados': [self.entrada.id]})
+        self.assertEqual(delta['lugares']['actualizados'], [])
+
+    def test_cursor_invalido(self):
+        self.assertEqual(self.pedir(since='no-es-un-cursor').status_code, 400)
+
+    def test_no_carga_secciones_ni_toc(self):
+        for url in (reverse('cambios'), reverse('lugar-detail', args=[self.lugar.id])):
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as ctx:
+                    self.assertEqual(self.client.get(url).status_code, 200)
+                sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+                self.assertNotIn('"travel_api_entradadeblog"."secciones"', sql)
+                self.assertNotIn('"travel_api_entradadeblog"."toc"', sql)
+
+
+class ConsultasAcotadasTests(DatosMixin, TestCase):
+    """El número de consultas de cada endpoint no crece con los datos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='x')
+        cls.lugar = cls.crear_lugar()
+        cls.entrada = cls.crear_entrada(cls.lugar, cls.autor)
+        cls.crear_foto(cls.lugar, cls.entrada)
+        # Fotos cuyos padres no son el lugar/entradas consultados
+        otro = cls.crear_lugar()
+        cls.crear_foto(otro, cls.entrada)
+        cls.crear_foto(cls.lugar, cls.crear_entrada(otro, cls.autor))
+
+    def agregar_datos(self):
+        otro_autor = User.objects.create_user(f'autor{self._contador}', password='x')
+        for _ in range(3):
+            entrada = self.crear_entrada(self.lugar, otro_autor)
+            for orden in range(4):
+                self.crear_foto(self.lugar, entrada, orden_en_entrada=orden)
+            self.crear_foto(self.crear_lugar(), entrada)
+            self.crear_foto(self.lugar, self.entrada)
+
+    def contar(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def assertConsultasConstantes(self, url_func):
+        antes = self.contar(url_func())
+        self.agregar_datos()
+        self.assertEqual(self.contar(url_func()), antes)
+
+    def test_fotografias_list(self):
+        self.assertConsultasConstantes(lambda: reverse('fotografia-list'))
+
+    def test_fotografias_retrieve(self):
+        foto = Fotografia.objects.first()
+        self.assertConsultasConstantes(lambda: reverse('fotografia-detail', args=[foto.id]))
+
+    def test_entradas_list(self):
+        self.assertConsultasConstantes(lambda: reverse('entradadeblog-list'))
+
+    def test_entradas_retrieve(self):
+        self.assertConsultasConstantes(lambda: reverse('entradadeblog-detail', args=[self.entrada.id]))
+
+    def test_entrada_por_slug(self):
+        self.assertConsultasConstantes(lambda: reverse('entrada-blog-slug', args=[self.entrada.slug]))
+
+    def test_lugares_list(self):
+        self.assertConsultasConstantes(lambda: reverse('lugar-list'))
+
+    def test_lugares_retrieve(self):
+        self.assertConsultasConstantes(lambda: reverse('lugar-detail', args=[self.lugar.id]))
+
+
+class LugarDetalleTests(DatosMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='x')
+        cls.lugar = cls.crear_lugar(nombre='Medellín')
+        cls.otro = cls.crear_lugar(nombre='Guatapé')
+        cls.entrada = cls.crear_entrada(cls.lugar, cls.autor, titulo='Comuna 13')
+        cls.ajena = cls.crear_entrada(cls.otro, cls.autor, titulo='La Piedra')
+        for orden in range(5):
+            cls.crear_foto(cls.lugar, cls.entrada, orden_en_entrada=orden)
+        cls.foto_de_otro_lugar = cls.crear_foto(cls.otro, cls.entrada)
+        cls.foto_de_otra_entrada = cls.crear_foto(cls.lugar, cls.ajena)
+
+    def test_reutiliza_los_padres_cargados(self):
+        url = reverse('lugar-detail', args=[self.lugar.id])
+        # versión (ETag), lugar, entradas+autor, fotos de entradas, fotos del
+        # lugar, renditions de cada grupo de fotos y los padres que no estaban
+        # cargados (un lugar y una entrada)
+        with self.assertNumQueries(9):
+            datos = self.client.get(url).json()
+
+        entrada = datos['entradas_blog'][0]
+        self.assertEqual(entrada['lugar_asociado_info']['nombre'], 'Medellín')
+        self.assertEqual(entrada['autor_info']['username'], 'autor')
+        por_id = {f['id']: f for f in entrada['fotografias']}
+        self.assertEqual(por_id[self.foto_de_otro_lugar.id]['lugar_nombre'], 'Guatapé')
+        self.assertEqual({f['entrada_blog_titulo'] for f in entrada['fotografias']}, {'Comuna 13'})
+
+        fotos_lugar = {f['id']: f for f in datos['fotografias']}
+        self.assertEqual(fotos_lugar[self.foto_de_otra_entrada.id]['entrada_blog_titulo'], 'La Piedra')
+        self.assertEqual({f['lugar_nombre'] for f in datos['fotografias']}, {'Medellín'})
+
+
+class PaginacionKeysetTests(DatosMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='x')
+        lugar = cls.crear_lugar()
+        entradas = [cls.crear_entrada(lugar, cls.autor) for _ in range(3)]
+        for entrada in entradas:
+            for orden in (2, 1, 1, 0):
+                cls.crear_foto(lugar, entrada, orden_en_entrada=orden)
+        for _ in range(3):
+            cls.crear_foto(lugar)  # Sin entrada (NULL al final)
+        for _ in range(22):
+            cls.crear_entrada(lugar, cls.autor)
+
+    def recorrer(self, url, page_size):
+        vistos = []
+        with mock.patch('travel_api.pagination.KeysetPagination.page_size', page_size):
+            while url:
+                datos = self.client.get(url).json()
+                self.assertLessEqual(len(datos['results']), page_size)
+                vistos.extend(r['id'] for r in datos['results'])
+                url = datos['next']
+        return vistos
+
+    def test_fotografias_en_orden_sin_repetir_ni_saltar(self):
+        esperado = sorted(
+            Fotografia.objects.all(),
+            key=lambda f: (f.entrada_blog_id is None, f.entrada_blog_id or 0, f.orden_en_entrada, f.id),
+        )
+        self.assertEqual(self.recorrer(reverse('fotografia-list'), 4), [f.id for f in esperado])
+
+    def test_entradas_mas_recientes_primero(self):
+        esperado = EntradaDeBlog.objects.order_by('-fecha_publicacion', '-id').values_list('id', flat=True)
+        vistos = self.recorrer(reverse('entradadeblog-list'), 20)
+        self.assertEqual(vistos, list(esperado))
+
+    def test_entradas_en_el_mismo_milisegundo(self):
+        base = timezone.now().replace(microsecond=0) + timedelta(days=1)
+        primera, segunda = EntradaDeBlog.objects.order_by('id')[:2]
+        EntradaDeBlog.objects.filter(pk=primera.pk).update(fecha_publicacion=base + timedelta(microseconds=900))
+        EntradaDeBlog.objects.filter(pk=segunda.pk).update(fecha_publicacion=base + timedelta(microseconds=400))
+        vistos = self.recorrer(reverse('entradadeblog-list'), 1)
+        self.assertEqual(vistos[:2], [primera.pk, segunda.pk])
+        self.assertEqual(len(vistos), EntradaDeBlog.objects.count())
+
+    def test_la_pagina_siguiente_no_usa_offset(self):
+        siguiente = self.client.get(reverse('fotografia-list')).json()['next']
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(siguiente)
+        self.assertFalse(any('OFFSET' in q['sql'].upper() for q in ctx.captured_queries))
+
+    def test_cursor_invalido(self):
+        response = self.client.get(reverse('fotografia-list'), {'cursor': 'basura'})
+        self.assertEqual(response.status_code, 404)
+
+
+class CamposDinamicosTests(DatosMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        autor = User.objects.create_user('autor', password='x')
+        lugar = cls.crear_lugar()
+        cls.entrada = cls.crear_entrada(lugar, autor)
+        cls.crear_foto(lugar, cls.entrada)
+
+    def sql_entradas(self, params):
+        with CaptureQueriesContext(connection) as ctx:
+            datos = self.client.get(reverse('entradadeblog-list'), params).json()
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries if 'travel_api_entradadeblog' in q['sql'])
+        return datos['results'][0], sql
+
+    def test_fields_limita_los_campos_y_no_carga_el_contenido(self):
+        entrada, sql = self.sql_entradas({'fields': 'id,titulo,slug'})
+        self.assertEqual(set(entrada), {'id', 'titulo', 'slug'})
+        self.assertNotIn('contenido_markdown', sql)
+        self.assertNotIn('contenido_html', sql)
+
+    def test_omit_quita_campos(self):
+        entrada, sql = self.sql_entradas({'omit': 'contenido_procesado'})
+        self.assertNotIn('contenido_procesado', entrada)
+        self.assertIn('extracto', entrada)
+        self.assertNotIn('contenido_html', sql)
+        self.assertIn('contenido_markdown', sql)
+
+    def test_sin_parametros_devuelve_todo(self):
+        entrada, _ = self.sql_entradas({})
+        self.assertIn('contenido_procesado', entrada)
+        self.assertIn('autor_info', entrada)
+
+    def test_solo_afecta_al_serializer_raiz(self):
+        datos = self.client.get(
+            reverse('entrada-blog-slug', args=[self.entrada.slug]), {'fields': 'id,fotografias'}
+        ).json()
+        self.assertEqual(set(datos), {'id', 'fotografias'})
+        self.assertIn('imagen_url', datos['fotografias'][0])
+
+    def test_fotografias_no_cargan_el_contenido_de_la_entrada(self):
+        with CaptureQueriesContext(connection) as ctx:
+            datos = self.client.get(reverse('fotografia-list')).json()
+        self.assertEqual(datos['results'][0]['entrada_blog_titulo'], self.entrada.titulo)
+        self.assertFalse(any('contenido_markdown' in q['sql'] for q in ctx.captured_queries))
+
+
+class ExtractosTests(DatosMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='x')
+        cls.lugar = cls.crear_lugar()
+
+    def test_se_calculan_al_guardar(self):
+        entrada = self.crear_entrada(self.lugar, self.autor, contenido_markdown='# Hola\n\n**Mundo** ' + 'palabra ' * 40)
+        self.assertTrue(entrada.extracto_lista.startswith('Hola Mundo'))
+        self.assertLessEqual(len(entrada.extracto_lista), 153)
+        self.assertGreater(len(entrada.extracto_detalle), len(entrada.extracto_lista))
+
+        entrada.contenido_markdown = 'Otro texto'
+        entrada.save()
+        entrada.refresh_from_db()
+        self.assertEqual((entrada.extracto_lista, entrada.extracto_detalle), ('Otro texto', 'Otro texto'))
+
+    def test_la_api_sirve_el_extracto_guardado(self):
+        entrada = self.crear_entrada(self.lugar, self.autor)
+        EntradaDeBlog.objects.filter(pk=entrada.pk).update(extracto_lista='corto', extracto_detalle='largo')
+        with mock.patch('travel_api.utils.extract_excerpt') as extract_excerpt:
+            lista = self.client.get(reverse('entradadeblog-list')).json()['results']
+            detalle = self.client.get(reverse('entradadeblog-detail', args=[entrada.pk])).json()
+        extract_excerpt.assert_not_called()
+        self.assertEqual(lista[0]['extracto'], 'corto')
+        self.assertEqual(detalle['extracto'], 'largo')
+
+
+class RendererMarkdownTests(SimpleTestCase):
+    TEXTO = '# Título\n\nTexto con nota[^1].\n\n[^1]: La nota.'
+
+    def test_reutilizar_el_renderer_no_arrastra_estado(self):
+        md = utils.crear_renderer_markdown()
+        esperado = utils.obtener_sanitizador_html().clean(md.convert(self.TEXTO))
+        primero = utils.renderizar_markdown(self.TEXTO)
+        utils.renderizar_markdown('## Otro\n\nTexto[^a].\n\n[^a]: Otra nota.')
+        self.assertEqual(primero, esperado)
+        self.assertEqual(utils.renderizar_markdown(self.TEXTO), esperado)
+
+    def test_un_renderer_por_hilo(self):
+        principal = utils.obtener_renderer_markdown()
+        self.assertIs(utils.obtener_renderer_markdown(), principal)
+
+        otros = []
+        hilo = threading.Thread(target=lambda: otros.append(utils.obtener_renderer_markdown()))
+        hilo.start()
+        hilo.join()
+        self.assertIsNot(otros[0], principal)
+
+
+class PresentacionHTMLTests(SimpleTestCase):
+    def test_clases_y_enlaces_externos_en_una_pasada(self):
+        html = utils.renderizar_markdown(
+            '> cita\n\n![foto](/f.jpg){: .grande }\n\n'
+            '[fuera](https://ejemplo.com) y [dentro](/blog/otra)'
+        )
+        self.assertIn('<blockquote class="blog-quote">', html)
+        self.assertIn('class="blog-image grande"', html)
+        self.assertIn('<a href="https://ejemplo.com" target="_blank" rel="noopener noreferrer">', html)
+        self.assertIn('<a href="/blog/otra">', html)
+
+    def test_no_duplica_atributos_ni_deja_pasar_etiquetas(self):
+        html = utils.renderizar_markdown('<img src="/a.jpg" class="blog-image">\n\n<script>x()</script>')
+        self.assertEqual(html.count('class='), 1)
+        self.assertNotIn('<script', html)
+
+
+class CacheRenderTests(DatosMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_aciertos_y_fallos(self):
+        antes = utils.estadisticas_cache_render()
+        html = utils.markdown_to_html('Texto *único* de la prueba de caché')
+        self.assertEqual(utils.markdown_to_html('Texto *único* de la prueba de caché'), html)
+        despues = utils.estadisticas_cache_render()
+        self.assertEqual(despues['fallos'] - antes['fallos'], 1)
+        self.assertEqual(despues['aciertos'] - antes['aciertos'], 1)
+
+    def test_la_clave_depende_de_la_configuracion(self):
+        clave = utils.clave_cache_render('Hola')
+        with mock.patch.object(utils, '_HUELLA_CONFIGURACION', 'otra configuración'):
+            self.assertNotEqual(utils.clave_cache_render('Hola'), clave)
+
+    def test_guardar_sin_cambiar_el_contenido_no_renderiza(self):
+        autor = User.objects.create_user('autor', password='x')
+        entrada = self.crear_entrada(self.crear_lugar(), autor)
+        with mock.patch('travel_api.utils.markdown_to_html') as convertir, \
+                mock.patch.object(EntradaDeBlog, 'actualizar_secciones') as secciones:
+            entrada.fecha_evento = timezone.now().date()
+            entrada.save()
+        convertir.assert_not_called()
+        secciones.assert_not_called()
+
+        entrada.contenido_markdown = 'Texto *nuevo*'
+        entrada.save()
+        self.assertIn('<em>nuevo</em>', entrada.contenido_html)
+        self.assertTrue(entrada.extracto_lista.startswith('Texto nuevo'))
+
+
+class SeccionesTests(DatosMixin, TestCase):
+    MARKDOWN = (
+        'Introducción.\n\n# Día 1\n\nMañana.\n\n> ## Cita\n> dentro\n\n'
+        '### Tarde\n\nTexto.\n\n## Día 2\n\nFin.'
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        autor = User.objects.create_user('autor', password='x')
+        cls.entrada = cls.crear_entrada(cls.crear_lugar(), autor, contenido_markdown=cls.MARKDOWN)
+
+    def test_se_dividen_al_guardar(self):
+        secciones = self.entrada.secciones
+        self.assertEqual([s['id'] for s in secciones], [None, 'dia-1', 'dia-2'])
+        self.assertEqual(secciones[1]['titulo'], 'Día 1')
+        # Un título dentro de una cita no abre sección
+        self.assertIn('</blockquote>', secciones[1]['html'])
+        self.assertEqual(
+            [(t['nivel'], t['id']) for t in self.entrada.toc],
+            [(1, 'dia-1'), (2, 'cita'), (3, 'tarde'), (2, 'dia-2')],
+        )
+        self.assertEqual(''.join(s['html'] for s in secciones).replace('\n', ''),
+                         self.entrada.contenido_html.replace('\n', ''))
+
+    def test_detalle_con_primeras_secciones(self):
+        datos = self.client.get(
+            reverse('entrada-blog-slug', args=[self.entrada.slug]), {'secciones': 2}
+        ).json()
+        self.assertEqual([s['id'] for s in datos['secciones']], [None, 'dia-1'])
+        self.assertEqual(datos['total_secciones'], 3)
+        self.assertEqual(len(datos['toc']), 4)
+        self.assertNotIn('contenido_procesado', datos)
+        self.assertNotIn('contenido_markdown', datos)
+
+    def test_sin_parametro_no_cambia_la_respuesta(self):
+        datos = self.client.get(reverse('entradadeblog-detail', args=[self.entrada.pk])).json()
+        self.assertIn('contenido_procesado', datos)
+        self.assertNotIn('secciones', datos)
+        self.assertNotIn('toc', datos)
+
+    def test_resto_de_secciones(self):
+        url = reverse('entradadeblog-secciones', args=[self.entrada.pk])
+        datos = self.client.get(url, {'desde': 2}).json()
+        self.assertEqual(datos['total'], 3)
+        self.assertEqual([s['id'] for s in datos['secciones']], ['dia-2'])
+        self.assertEqual(self.client.get(url, {'desde': 'x'}).status_code, 400)
+
+
+class MediaTemporalMixin:
+    """Guarda los archivos generados en un MEDIA_ROOT temporal."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        ajustes = override_settings(
+            MEDIA_ROOT=self.media_root,
+            MAPA_TILES_ROOT=os.path.join(self.media_root, 'tiles'),
+            FOTOS_RENDICIONES_CACHE_ROOT=os.path.join(self.media_root, 'rendiciones'),
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+
+class TrabajosImagenTests(MediaTemporalMixin, DatosMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.lugar = self.crear_lugar()
+
+    def subir_foto(self):
+        return Fotografia.objects.create(lugar=self.lugar, imagen=self.crear_imagen())
+
+    def test_guardar_encola_y_el_worker_genera_el_thumbnail(self):
+        foto = self.subir_foto()
+        foto.refresh_from_db()
+        self.assertFalse(foto.thumbnail)
+        self.assertEqual(foto.estado_imagen, EstadoImagen.PENDIENTE)
+        self.assertEqual(TrabajoImagen.objects.filter(fotografia=foto, estado=EstadoTrabajo.PENDIENTE).count(), 1)
+
+        version = MapaSnapshot.estado()[0]
+        self.assertEqual(trabajos.procesar_pendientes(), 1)
+        foto.refresh_from_db()
+        self.assertEqual(foto.estado_imagen, EstadoImagen.LISTA)
+        self.assertTrue(os.path.exists(foto.thumbnail.path))
+        self.assertEqual(foto.thumbnail_url, foto.thumbnail.url)
+        self.assertGreater(MapaSnapshot.estado()[0], version)
+        self.assertEqual(TrabajoImagen.objects.get(fotografia=foto).estado, EstadoTrabajo.COMPLETADO)
+
+        # Con el thumbnail ya guardado, volver a guardar no encola nada
+        foto.descripcion = 'Editada'
+        foto.save()
+        self.assertEqual(TrabajoImagen.objects.filter(fotografia=foto).count(), 1)
+
+    def test_encolar_faltantes_actualiza_updated_at(self):
+        foto = self.subir_foto()
+        antes = timezone.now() - timedelta(days=1)
+        Fotografia.objects.filter(pk=foto.pk).update(estado_imagen=EstadoImagen.LISTA, updated_at=antes)
+        TrabajoImagen.objects.all().delete()
+        self.assertEqual(trabajos.encolar_faltantes(), 1)
+        foto.refresh_from_db()
+        self.assertEqual(foto.estado_imagen, EstadoImagen.PENDIENTE)
+        self.assertIn(foto.pk, Fotografia.objects.changed_since(antes + timedelta(seconds=1)).values_list('id', flat=True))
+
+    def test_un_trabajo_solo_lo_toma_un_worker(self):
+        self.subir_foto()
+        self.assertIsNotNone(trabajos.tomar_trabajo())
+        self.assertIsNone(trabajos.tomar_trabajo())
+
+    def test_trabajo_abandonado_vuelve_a_la_cola(self):
+        self.subir_foto()
+        trabajo = trabajos.tomar_trabajo()
+        TrabajoImagen.objects.filter(pk=trabajo.pk).update(
+            iniciado=timezone.now() - trabajos.TIEMPO_MAXIMO_TRABAJO - timedelta(seconds=1)
+        )
+        self.assertEqual(trabajos.tomar_trabajo().pk, trabajo.pk)
+
+    def test_trabajo_que_tumba_al_worker_acaba_en_error(self):
+        foto = self.subir_foto()
+        trabajo = trabajos.tomar_trabajo()
+        # El worker murió en cada intento sin llegar al except de procesar_trabajo
+        TrabajoImagen.objects.filter(pk=trabajo.pk).update(
+            intentos=trabajos.MAX_INTENTOS,
+            iniciado=timezone.now() - trabajos.TIEMPO_MAXIMO_TRABAJO - timedelta(seconds=1),
+        )
+        self.assertIsNone(trabajos.tomar_trabajo())
+        trabajo.refresh_from_db()
+        self.assertEqual((trabajo.estado, trabajo.intentos), (EstadoTrabajo.ERROR, trabajos.MAX_INTENTOS))
+        foto.refresh_from_db()
+        self.assertEqual(foto.estado_imagen, EstadoImagen.ERROR)
+
+    def test_reintentos_y_error(self):
+        foto = self.subir_foto()
+        with mock.patch('travel_api.utils.create_thumbnail', return_value=None), \
+                self.assertLogs('travel_api.trabajos', 'ERROR'):
+            self.assertEqual(trabajos.procesar_pendientes(), trabajos.MAX_INTENTOS)
+        trabajo = TrabajoImagen.objects.get(fotografia=foto)
+        self.assertEqual((trabajo.estado, trabajo.intentos), (EstadoTrabajo.ERROR, trabajos.MAX_INTENTOS))
+        foto.refresh_from_db()
+        self.assertEqual(foto.estado_imagen, EstadoImagen.ERROR)
+
+
+class MiniaturasTests(SimpleTestCase):
+    @staticmethod
+    def jpeg(tamano, orientacion=None):
+        contenido = BytesIO()
+        exif = Image.Exif()
+        if orientacion:
+            exif[rendiciones.ORIENTACION_EXIF] = orientacion
+        Image.new('RGB', tamano, (10, 200, 30)).save(contenido, format='JPEG', exif=exif)
+        contenido.seek(0)
+        return contenido
+
+    def test_decodifica_jpeg_a_escala_reducida(self):
+        imagen = rendiciones.abrir_reducida(self.jpeg((4000, 3000)), (300, 300))
+        self.assertEqual(imagen.size, (1000, 750))
+        self.assertEqual(rendiciones.crear_miniatura(self.jpeg((4000, 3000))).size, (300, 225))
+
+    def test_respeta_la_orientacion_exif(self):
+        miniatura = rendiciones.crear_miniatura(self.jpeg((4000, 3000), orientacion=6))
+        self.assertEqual(miniatura.size, (225, 300))
+
+    def test_transparencia_sobre_fondo_blanco(self):
+        contenido = BytesIO()
+        Image.new('RGBA', (600, 400), (0, 0, 0, 0)).save(contenido, format='PNG')
+        miniatura = rendiciones.crear_miniatura(contenido)
+        self.assertEqual(miniatura.mode, 'RGB')
+        self.assertEqual(miniatura.getpixel((0, 0)), (255, 255, 255))
+
+
+@override_settings(FOTOS_ANCHOS_RENDICION=[150, 300, 800, 1600], FOTOS_FORMATOS_RENDICION=['jpeg', 'webp'])
+class RendicionesTests(MediaTemporalMixin, DatosMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.foto = Fotografia.objects.create(lugar=self.crear_lugar(), imagen=self.crear_imagen(tamano=(1200, 800)))
+        trabajos.procesar_pendientes()
+
+    def test_anchos_configurados_sin_ampliar(self):
+        rendiciones = list(FotografiaRendicion.objects.filter(fotografia=self.foto, formato='jpeg'))
+        self.assertEqual([(r.ancho, r.alto) for r in rendiciones], [(150, 100), (300, 200), (800, 533), (1200, 800)])
+        for rendicion in rendiciones:
+            with Image.open(os.path.join(self.media_root, rendicion.archivo)) as imagen:
+                self.assertEqual(imagen.size, (rendicion.ancho, rendicion.alto))
+
+    def test_cada_ancho_en_cada_formato(self):
+        for rendicion in FotografiaRendicion.objects.filter(fotografia=self.foto):
+            with Image.open(os.path.join(self.media_root, rendicion.archivo)) as imagen:
+                self.assertEqual(imagen.format, {'jpeg': 'JPEG', 'webp': 'WEBP'}[rendicion.formato])
+        webp = FotografiaRendicion.objects.filter(fotografia=self.foto, formato='webp')
+        self.assertEqual([r.ancho for r in webp], [150, 300, 800, 1200])
+
+    def test_regenerar_borra_los_anchos_que_sobran(self):
+        sobrantes = [
+            os.path.join(self.media_root, r.archivo)
+            for r in FotografiaRendicion.objects.filter(fotografia=self.foto).filter(Q(ancho=150) | Q(formato='webp'))
+        ]
+        with self.settings(FOTOS_ANCHOS_RENDICION=[300, 800], FOTOS_FORMATOS_RENDICION=['jpeg']):
+            rendiciones.generar_rendiciones(self.foto)
+        self.assertEqual(
+            list(FotografiaRendicion.objects.filter(fotografia=self.foto).values_list('ancho', 'formato')),
+            [(300, 'jpeg'), (800, 'jpeg')],
+        )
+        self.assertFalse(any(os.path.exists(ruta) for ruta in sobrantes))
+
+    def test_la_api_expone_srcset(self):
+        datos = self.client.get(reverse('fotografia-detail', args=[self.foto.id])).json()
+        self.assertEqual([r['ancho'] for r in datos['rendiciones']], [150, 300, 800, 1200])
+        self.assertEqual(datos['srcset'].count('w,'), 3)
+        self.assertTrue(datos['srcset'].startswith(f'http://testserver/media/photos/r/{self.foto.uuid}/150.jpg 150w'))
+        self.assertEqual([f['tipo'] for f in datos['fuentes']], ['image/webp', 'image/jpeg'])
+        self.assertIn('/150.webp 150w', datos['fuentes'][0]['srcset'])
+
+    def test_srcset_en_jpeg_y_formatos_modernos_en_fuentes(self):
+        url = reverse('fotografia-detail', args=[self.foto.id])
+        datos = self.client.get(url, HTTP_ACCEPT='application/json, image/avif, image/webp').json()
+        self.assertIn('/150.jpg 150w', datos['srcset'])
+        self.assertTrue(datos['rendiciones'][0]['url'].endswith('/150.jpg'))
+        tipos = [fuente['tipo'] for fuente in datos['fuentes']]
+        self.assertIn('image/webp', tipos)
+        self.assertEqual(tipos[-1], 'image/jpeg')
+
+    def test_formato_preferido(self):
+        navegador = 'image/avif,image/webp,image/apng,image/*,*/*;q=0.8'
+        self.assertEqual(rendiciones.formato_preferido(navegador), 'avif')
+        self.assertEqual(rendiciones.formato_preferido(navegador, ('webp', 'jpeg')), 'webp')
+        self.assertEqual(rendiciones.formato_preferido('image/webp;q=0, image/*'), 'jpeg')
+        self.assertEqual(rendiciones.formato_preferido(None), 'jpeg')
+
+    def test_media_sirve_la_variante_del_thumbnail(self):
+        self.foto.refresh_from_db()
+        ruta = self.foto.thumbnail.path
+        self.assertTrue(os.path.exists(rendiciones.ruta_variante(ruta, 'webp')))
+        url = f'/media/{self.foto.thumbnail.name}'
+        webp = self.client.get(url, HTTP_ACCEPT='image/webp,*/*')
+        self.assertEqual(webp['Content-Type'], 'image/webp')
+        self.assertIn('Accept', webp['Vary'])
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT='*/*')['Content-Type'], 'image/jpeg')
+
+
+@override_settings(FOTOS_FORMATOS_RENDICION=['jpeg'])
+class GenerarThumbnailsTests(MediaTemporalMixin, DatosMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.media_root, 'photos'))
+        lugar = self.crear_lugar()
+        self.fotos = []
+        for n in range(3):
+            with open(os.path.join(self.media_root, 'photos', f'original_{n}.jpg'), 'wb') as f:
+                Image.new('RGB', (1200, 900)).save(f, format='JPEG')
+            self.fotos.append(self.crear_foto(lugar, url_imagen=f'photos/original_{n}.jpg', thumbnail_url=''))
+        self.fotos.append(self.crear_foto(lugar, url_imagen='photos/no_existe.jpg', thumbnail_url=''))
+
+    def generar(self, **opciones):
+        salida = StringIO()
+        version = MapaSnapshot.estado()[0]
+        call_command('generate_missing_thumbnails', stdout=salida, **opciones)
+        self.assertGreater(MapaSnapshot.estado()[0], version)
+        return salida.getvalue()
+
+    def comprobar_thumbnails(self):
+        for n, foto in enumerate(self.fotos[:3]):
+            foto.refresh_from_db()
+            self.assertEqual(foto.thumbnail_url, f'photos/thumbnails/original_{n}_thumb.jpg')
+            with Image.open(os.path.join(self.media_root, foto.thumbnail_url)) as imagen:
+                self.assertEqual(imagen.size, (300, 225))
+
+    def test_genera_y_guarda_las_urls_en_un_lote(self):
+        with CaptureQueriesContext(connection) as ctx:
+            salida = self.generar()
+        self.comprobar_thumbnails()
+        self.assertEqual(sum('UPDATE "travel_api_fotografia"' in q['sql'] for q in ctx.captured_queries), 1)
+        # Coordenadas de los tiles a invalidar: una consulta por lote
+        self.assertEqual(sum('FROM "travel_api_lugar"' in q['sql'] for q in ctx.captured_queries), 1)
+        self.assertIn('✅ Thumbnails creados: 3', salida)
+        self.assertIn('📁 Sin archivo original: 1', salida)
+        self.assertIn('📸 [4/4] ID', salida)
+
+    def test_en_paralelo_con_workers(self):
+        salida = self.generar(workers=2)
+        self.comprobar_thumbnails()
+        self.assertIn('✅ Thumbnails creados: 3', salida)
+        salida = self.generar(workers=2, force=True)
+        self.assertIn('🔄 Thumbnails regenerados: 3', salida)
+        self.assertIn('❌ Errores: 0', salida)
+
+
+@override_settings(FOTOS_FORMATOS_RENDICION=['jpeg'])
+class CargarFotosTests(MediaTemporalMixin, DatosMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.autor = User.objects.create_user('autor', password='x')
+        self.entrada = self.crear_entrada(self.crear_lugar(), self.autor)
+        self.carpeta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.carpeta, ignore_errors=True)
+        for n in range(5):
+            exif = Image.Exif()
+            exif[0x0132] = '2023:12:17 10:30:00'  # DateTime
+            Image.new('RGB', (1200, 900)).save(os.path.join(self.carpeta, f'foto_{n}.jpg'), format='JPEG', exif=exif)
+
+    def cargar(self, **opciones):
+        salida = StringIO()
+        call_command(
+            'upload_blog_photos', source_folder=self.carpeta, blog_entry_id=self.entrada.id,
+            stdout=salida, **{'workers': 1, **opciones},
+        )
+        return salida.getvalue()
+
+    def test_carga_en_lotes_y_encola_las_renditions(self):
+        version = MapaSnapshot.estado()[0]
+        with CaptureQueriesContext(connection) as ctx:
+            salida = self.cargar(batch_size=2)
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "travel_api_fotografia"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertGreater(MapaSnapshot.estado()[0], version)
+
+        fotos = list(Fotografia.objects.filter(entrada_blog=self.entrada).order_by('orden_en_entrada'))
+        self.assertEqual([f.orden_en_entrada for f in fotos], [1, 2, 3, 4, 5])
+        self.assertTrue(all(f.estado_imagen == EstadoImagen.PENDIENTE for f in fotos))
+        self.assertEqual(str(fotos[0].fecha_toma), '2023-12-17')
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, fotos[0].url_imagen)))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, fotos[0].thumbnail_url)))
+        self.assertEqual(TrabajoImagen.objects.filter(fotografia__in=fotos).count(), 5)
+        self.assertIn('✅ Fotos creadas: 5', salida)
+
+        self.assertIn('⏩ Fotos saltadas: 5', self.cargar())
+
+    def test_en_paralelo(self):
+        salida = self.cargar(workers=2, io_threads=2)
+        self.assertIn('✅ Fotos creadas: 5', salida)
+        self.assertEqual(salida.count('📷 Thumbnail creado'), 5)
+        for foto in Fotografia.objects.filter(entrada_blog=self.entrada):
+            with Image.open(os.path.join(self.media_root, foto.thumbnail_url)) as imagen:
+                self.assertEqual(imagen.size, (300, 225))
+
+
+@override_settings(FOTOS_TAMANOS_BAJO_DEMANDA=[(300, 300), (800, 800)])
+class RendicionBajoDemandaTests(MediaTemporalMixin, DatosMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.foto = Fotografia.objects.create(lugar=self.crear_lugar(), imagen=self.crear_imagen(tamano=(1200, 800)))
+
+    def url(self, ancho=300, alto=300, formato='jpg'):
+        return reverse('rendicion-bajo-demanda', args=[ancho, alto, self.foto.uuid, formato])
+
+    def test_genera_una_vez_y_sirve_desde_disco(self):
+        generar = rendiciones.generar_bajo_demanda
+        with mock.patch.object(rendiciones, 'generar_bajo_demanda', side_effect=generar) as generada:
+            primera = self.client.get(self.url())
+            segunda = self.client.get(self.url())
+        self.assertEqual(generada.call_count, 1)
+        self.assertEqual(primera.status_code, 200)
+        self.assertEqual(primera['Content-Type'], 'image/jpeg')
+        self.assertEqual(primera['Cache-Control'], 'public, max-age=300')
+        contenido = b''.join(segunda.streaming_content)
+        self.assertEqual(contenido, b''.join(primera.streaming_content))
+        with Image.open(BytesIO(contenido)) as imagen:
+            self.assertEqual(imagen.size, (300, 200))
+
+    def test_inmutable_solo_con_la_version_del_original(self):
+        respuesta = self.client.get(self.url())
+        version = respuesta['X-Imagen-Version']
+        self.assertEqual(self.client.get(self.url(), {'v': version})['Cache-Control'],
+                         'public, max-age=31536000, immutable')
+        no_modificada = self.client.get(self.url(), HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(no_modificada.status_code, 304)
+
+        with open(self.foto.imagen.path, 'wb') as f:
+            Image.new('RGB', (600, 600)).save(f, format='JPEG')
+        reemplazada = self.client.get(self.url(), {'v': version}, HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(reemplazada.status_code, 200)
+        self.assertNotIn('immutable', reemplazada['Cache-Control'])
+        self.assertNotEqual(reemplazada['ETag'], respuesta['ETag'])
+
+    def test_sin_extension_negocia_el_formato(self):
+        url = reverse('rendicion-bajo-demanda-negociada', args=[300, 300, self.foto.uuid])
+        respuesta = self.client.get(url, HTTP_ACCEPT='image/webp,*/*')
+        self.assertEqual(respuesta['Content-Type'], 'image/webp')
+        self.assertIn('Accept', respuesta['Vary'])
+        self.assertEqual(self.client.get(url)['Content-Type'], 'image/jpeg')
+
+    def test_tamano_o_formato_no_permitido(self):
+        self.assertEqual(self.client.get(self.url(ancho=301)).status_code, 404)
+        self.assertEqual(self.client.get(self.url(formato='gif')).status_code, 404)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'rendiciones')))
+
+    def test_reemplazar_el_original_cambia_el_archivo(self):
+        antes = rendiciones.obtener_bajo_demanda(self.foto, 300, 300, 'jpeg')
+        with open(self.foto.imagen.path, 'wb') as f:
+            Image.new('RGB', (600, 600)).save(f, format='JPEG')
+        despues = rendiciones.obtener_bajo_demanda(self.foto, 300, 300, 'jpeg')
+        self.assertNotEqual(antes, despues)
+        with Image.open(despues) as imagen:
+            self.assertEqual(imagen.size, (300, 300))
+
+    def test_peticiones_simultaneas_generan_una_sola_vez(self):
+        generar = rendiciones.generar_bajo_demanda
+        inicio = threading.Barrier(4)
+
+        def pedir():
+            inicio.wait()
+            rendiciones.obtener_bajo_demanda(self.foto, 800, 800, 'jpeg')
+
+        with mock.patch.object(rendiciones, 'generar_bajo_demanda', side_effect=generar) as generada:
+            hilos = [threading.Thread(target=pedir) for _ in range(4)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+        self.assertEqual(generada.call_count, 1)
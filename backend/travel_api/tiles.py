@@ -0,0 +1,157 @@
+"""
+Tiles JSON del mapa (``/api/tiles/{z}/{x}/{y}/``) con caché en disco.
+
+Cada tile contiene los marcadores (o clusters, en zooms bajos) cuyo punto cae
+dentro de él según el esquema XYZ de Mapbox/OSM. Los tiles generados se
+guardan en ``settings.MAPA_TILES_ROOT/{z}/{x}/{y}.json`` y se borran de forma
+individual cuando cambia un Lugar, Fotografia o EntradaDeBlog ubicado en ellos.
+Los tiles vacíos no se guardan: si no, cualquier cliente podría llenar el
+disco recorriendo coordenadas sin marcadores.
+"""
+import json
+import math
+import os
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Lugar, Fotografia, EntradaDeBlog, MapaSnapshot
+from .utils import escribir_atomico
+from .mapa import (
+    obtener_snapshot, construir_marcadores, lugares_en_bbox, marcadores_para_zoom,
+    proyectar, ZOOM_MAX_AGRUPACION, CELDA_AGRUPACION_PX,
+)
+
+TILE_ZOOM_MAX = 22
+TILE_PX = 256
+
+
+def ruta_tile(z, x, y):
+    return os.path.join(settings.MAPA_TILES_ROOT, str(z), str(x), f"{y}.json")
+
+
+def tile_valido(z, x, y):
+    return 0 <= z <= TILE_ZOOM_MAX and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def bbox_tile(z, x, y):
+    """Bounding box ``(minLon, minLat, maxLon, maxLat)`` del tile."""
+    n = 2 ** z
+    min_lon = x / n * 360 - 180
+    max_lon = (x + 1) / n * 360 - 180
+    max_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    min_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def tile_de(coordenadas, z):
+    """Tile ``(x, y)`` que contiene el punto ``[lon, lat]`` en el zoom dado."""
+    px, py = proyectar(coordenadas, z)
+    limite = 2 ** z - 1
+    return (
+        max(0, min(int(px // TILE_PX), limite)),
+        max(0, min(int(py // TILE_PX), limite)),
+    )
+
+
+def contenido_tile(z, x, y):
+    """Bytes JSON del tile, desde disco o generándolo (y guardándolo si tiene marcadores)."""
+    ruta = ruta_tile(z, x, y)
+    try:
+        with open(ruta, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+
+    version = _version_mapa()
+    marcadores = generar_tile(z, x, y)
+    contenido = json.dumps(marcadores).encode('utf-8')
+    # Si los datos cambiaron mientras se generaba, no se guarda una copia vieja
+    if marcadores and version == _version_mapa():
+        escribir_atomico(ruta, contenido)
+    return contenido
+
+
+def generar_tile(z, x, y):
+    """Lista de marcadores/clusters cuyo punto pertenece al tile."""
+    if z <= ZOOM_MAX_AGRUPACION:
+        candidatos = marcadores_para_zoom(obtener_snapshot(), z)
+    else:
+        candidatos = construir_marcadores(lugares_en_bbox(bbox_tile(z, x, y)))
+    # Cada punto pertenece a un único tile, aunque caiga justo en un borde
+    return [m for m in candidatos if tile_de(m['coordinates'], z) == (x, y)]
+
+
+def coordenadas_afectadas(instance):
+    """Coordenadas ``(lon, lat)`` de los marcadores que dependen de ``instance``."""
+    if isinstance(instance, Lugar):
+        return {(float(instance.longitud), float(instance.latitud))}
+
+    if isinstance(instance, Fotografia):
+        lugar_ids = {instance.lugar_id}
+        if instance.entrada_blog_id:
+            lugar_ids.update(
+                EntradaDeBlog.all_objects.filter(pk=instance.entrada_blog_id)
+                .values_list('lugar_asociado_id', flat=True)
+            )
+    elif isinstance(instance, EntradaDeBlog):
+        lugar_ids = {instance.lugar_asociado_id}
+    else:
+        return set()
+
+    lugar_ids.discard(None)
+    return {
+        (float(lon), float(lat))
+        for lat, lon in Lugar.all_objects.filter(pk__in=lugar_ids).values_list('latitud', 'longitud')
+    }
+
+
+def coordenadas_de_fotos(fotos):
+    """
+    Como ``coordenadas_afectadas`` para un lote de fotografías, con una sola
+    consulta (lugares de las fotos y de sus entradas).
+    """
+    lugar_ids = {foto.lugar_id for foto in fotos} - {None}
+    entrada_ids = {foto.entrada_blog_id for foto in fotos} - {None}
+    if not lugar_ids and not entrada_ids:
+        return set()
+    lugares = Lugar.all_objects.filter(Q(pk__in=lugar_ids) | Q(entradas_blog__in=entrada_ids))
+    return {(float(lon), float(lat)) for lat, lon in lugares.values_list('latitud', 'longitud').distinct()}
+
+
+def tiles_afectados(coordenadas):
+    """
+    Tiles de todos los zooms que pueden cambiar si cambia un marcador en ``coordenadas``.
+
+    En zooms con agrupación, un cluster puede acabar en cualquier tile que
+    toque la celda de la cuadrícula del punto, así que se incluyen todos ellos.
+    """
+    tiles = set()
+    for z in range(TILE_ZOOM_MAX + 1):
+        if z <= ZOOM_MAX_AGRUPACION:
+            px, py = proyectar(coordenadas, z)
+            celda_x = int(px // CELDA_AGRUPACION_PX) * CELDA_AGRUPACION_PX
+            celda_y = int(py // CELDA_AGRUPACION_PX) * CELDA_AGRUPACION_PX
+            limite = 2 ** z - 1
+            fin_x = (celda_x + CELDA_AGRUPACION_PX - 1) // TILE_PX
+            fin_y = (celda_y + CELDA_AGRUPACION_PX - 1) // TILE_PX
+            for tx in range(celda_x // TILE_PX, fin_x + 1):
+                for ty in range(celda_y // TILE_PX, fin_y + 1):
+                    tiles.add((z, min(tx, limite), min(ty, limite)))
+        else:
+            tiles.add((z, *tile_de(coordenadas, z)))
+    return tiles
+
+
+def invalidar_tiles(coordenadas):
+    """Borra del disco los tiles afectados por cambios en las coordenadas dadas."""
+    for punto in coordenadas:
+        for z, x, y in tiles_afectados(punto):
+            try:
+                os.remove(ruta_tile(z, x, y))
+            except FileNotFoundError:
+                pass
+
+
+def _version_mapa():
+    return MapaSnapshot.objects.filter(pk=MapaSnapshot.SINGLETON_ID).values_list('version', flat=True).first()
@@ -0,0 +1,186 @@
+"""
+Cola de trabajos de imagen respaldada por la base de datos.
+
+Guardar una Fotografia con imagen y sin thumbnail crea un ``TrabajoImagen``
+pendiente y marca la foto como ``EstadoImagen.PENDIENTE`` (también al crear
+una foto que solo tiene ``url_imagen``). Los workers (``manage.py
+procesar_trabajos``) toman los trabajos de uno en uno, generan el thumbnail
+y las renditions (ver rendiciones.py) y marcan la foto como ``LISTA``.
+
+Para tomar un trabajo se usa un UPDATE condicional sobre su estado, así que
+varios workers pueden ejecutarse a la vez sin repartirse el mismo trabajo.
+Un trabajo ``en_proceso`` durante más de ``TIEMPO_MAXIMO_TRABAJO`` (worker
+caído) vuelve a estar disponible, salvo que ya haya agotado ``MAX_INTENTOS``:
+entonces queda en error (y la foto también), para que una imagen que tumba
+al worker no lo siga tumbando indefinidamente.
+"""
+import logging
+from datetime import timedelta
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Fotografia, MapaSnapshot, TrabajoImagen, EstadoImagen, EstadoTrabajo
+
+logger = logging.getLogger(__name__)
+
+MAX_INTENTOS = 3
+TIEMPO_MAXIMO_TRABAJO = timedelta(minutes=10)
+
+
+def encolar_imagen(foto):
+    """Crea un trabajo para ``foto`` si no tiene ya uno sin terminar."""
+    activos = TrabajoImagen.objects.filter(
+        fotografia=foto, estado__in=[EstadoTrabajo.PENDIENTE, EstadoTrabajo.EN_PROCESO]
+    )
+    if not activos.exists():
+        TrabajoImagen.objects.create(fotografia=foto)
+    ahora = timezone.now()
+    Fotografia.all_objects.filter(pk=foto.pk).update(estado_imagen=EstadoImagen.PENDIENTE, updated_at=ahora)
+    foto.estado_imagen, foto.updated_at = EstadoImagen.PENDIENTE, ahora
+
+
+def encolar_faltantes():
+    """Encola las fotos con imagen que aún no tienen renditions. Devuelve cuántas."""
+    fotos = (
+        Fotografia.all_objects
+        .filter(rendiciones__isnull=True)
+        .exclude(Q(imagen='') | Q(imagen__isnull=True), Q(url_imagen='') | Q(url_imagen__isnull=True))
+    )
+    encoladas = 0
+    for foto in fotos.iterator():
+        encolar_imagen(foto)
+        encoladas += 1
+    return encoladas
+
+
+def _vencidos():
+    return TrabajoImagen.objects.filter(
+        estado=EstadoTrabajo.EN_PROCESO, iniciado__lt=timezone.now() - TIEMPO_MAXIMO_TRABAJO
+    )
+
+
+def _disponibles():
+    return TrabajoImagen.objects.filter(
+        Q(estado=EstadoTrabajo.PENDIENTE)
+        | Q(pk__in=_vencidos().filter(intentos__lt=MAX_INTENTOS).values('pk'))
+    )
+
+
+def descartar_agotados():
+    """
+    Pasa a error los trabajos vencidos que ya agotaron sus intentos (el
+    worker murió con ellos, p. ej. sin memoria) y marca sus fotos como error.
+    Devuelve cuántos descartó.
+    """
+    agotados = _vencidos().filter(intentos__gte=MAX_INTENTOS)
+    foto_ids = list(agotados.values_list('fotografia_id', flat=True))
+    if not foto_ids:
+        return 0
+    ahora = timezone.now()
+    descartados = agotados.filter(fotografia_id__in=foto_ids).update(
+        estado=EstadoTrabajo.ERROR,
+        ultimo_error='El worker no terminó el trabajo en ninguno de sus intentos',
+        terminado=ahora,
+    )
+    Fotografia.all_objects.filter(pk__in=foto_ids).update(
+        estado_imagen=EstadoImagen.ERROR,
+        updated_at=ahora,
+    )
+    return descartados
+
+
+def tomar_trabajo():
+    """Reserva el trabajo disponible más antiguo, o devuelve ``None`` si no hay."""
+    descartar_agotados()
+    for trabajo_id in _disponibles().order_by('creado', 'id').values_list('id', flat=True)[:10]:
+        # Solo un worker consigue cambiar el estado; los demás prueban el siguiente
+        tomado = _disponibles().filter(pk=trabajo_id).update(
+            estado=EstadoTrabajo.EN_PROCESO,
+            iniciado=timezone.now(),
+            intentos=F('intentos') + 1,
+        )
+        if tomado:
+            return TrabajoImagen.objects.select_related('fotografia').get(pk=trabajo_id)
+    return None
+
+
+def procesar_trabajo(trabajo):
+    """
+    Ejecuta un trabajo ya reservado. Si falla, vuelve a la cola hasta
+    ``MAX_INTENTOS`` veces y después queda en error (y la foto también).
+
+    Returns:
+        bool: True si el trabajo terminó correctamente
+    """
+    foto = trabajo.fotografia
+    try:
+        procesar_imagen(foto)
+    except Exception as e:
+        logger.exception("Error procesando el trabajo %s: %s", trabajo.pk, e)
+        reintentar = trabajo.intentos < MAX_INTENTOS
+        TrabajoImagen.objects.filter(pk=trabajo.pk).update(
+            estado=EstadoTrabajo.PENDIENTE if reintentar else EstadoTrabajo.ERROR,
+            ultimo_error=str(e),
+            terminado=None if reintentar else timezone.now(),
+        )
+        if not reintentar:
+            Fotografia.all_objects.filter(pk=foto.pk).update(
+                estado_imagen=EstadoImagen.ERROR,
+                updated_at=timezone.now(),
+            )
+        return False
+
+    TrabajoImagen.objects.filter(pk=trabajo.pk).update(
+        estado=EstadoTrabajo.COMPLETADO,
+        ultimo_error='',
+        terminado=timezone.now(),
+    )
+    return True
+
+
+def procesar_pendientes(limite=None):
+    """Procesa trabajos hasta vaciar la cola (o hasta ``limite``). Devuelve cuántos tomó."""
+    procesados = 0
+    while limite is None or procesados < limite:
+        trabajo = tomar_trabajo()
+        if trabajo is None:
+            break
+        procesar_trabajo(trabajo)
+        procesados += 1
+    return procesados
+
+
+def procesar_imagen(foto):
+    """Genera el thumbnail (si falta) y las renditions de ``foto`` y la marca como lista."""
+    from .rendiciones import generar_rendiciones
+    from .tiles import coordenadas_afectadas, invalidar_tiles
+
+    campos = generar_miniatura(foto) if foto.imagen and not foto.thumbnail else {}
+    generar_rendiciones(foto)
+
+    # update() no dispara signals: se invalidan a mano el snapshot y los tiles
+    Fotografia.all_objects.filter(pk=foto.pk).update(
+        estado_imagen=EstadoImagen.LISTA,
+        updated_at=timezone.now(),
+        **campos,
+    )
+    MapaSnapshot.invalidar()
+    invalidar_tiles(coordenadas_afectadas(foto))
+
+
+def generar_miniatura(foto):
+    """Genera el thumbnail de ``foto`` y devuelve los campos a actualizar."""
+    from .rendiciones import guardar_variantes
+    from .utils import create_thumbnail
+
+    thumbnail_file = create_thumbnail(foto.imagen)
+    if thumbnail_file is None:
+        raise RuntimeError(f"No se pudo generar el thumbnail de {foto.imagen.name}")
+    foto.thumbnail.save(thumbnail_file.name, thumbnail_file, save=False)
+    guardar_variantes(foto.thumbnail.path, thumbnail_file.variantes)
+    return {
+        'thumbnail': foto.thumbnail.name,
+        'thumbnail_url': foto.thumbnail.url,
+        'url_imagen': foto.imagen.url,
+    }
@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     LugarViewSet, FotografiaViewSet, EntradaDeBlogViewSet, 
-    mapa_data, entrada_blog_galeria, entrada_blog_por_slug, 
+    mapa_data, mapa_tile, cambios, entrada_blog_galeria, entrada_blog_por_slug, 
     entrada_blog_galeria_por_slug
 )
 
@@ -14,6 +14,8 @@ router.register(r'entradas-blog', EntradaDeBlogViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('mapa-data/', mapa_data, name='mapa-data'),
+    path('tiles/<int:z>/<int:x>/<int:y>/', mapa_tile, name='mapa-tile'),
+    path('changes/', cambios, name='cambios'),
     # URLs por ID (mantenidas para compatibilidad)
     path('entrada-blog-galeria/<int:entrada_id>/', entrada_blog_galeria, name='entrada-blog-galeria'),
     path('entrada-blog-galeria/<int:entrada_id>/<int:foto_id>/', entrada_blog_galeria, name='entrada-blog-galeria-foto'),
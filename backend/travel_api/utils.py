@@ -1,8 +1,15 @@
 import markdown
 import bleach
+from bleach import html5lib_shim
 from markdown.extensions import codehilite, toc, tables, fenced_code, admonition
+import os
 import re
+import hashlib
 import logging
+import tempfile
+import threading
+from html.parser import HTMLParser
+from django.core.cache import cache
 
 # Logger para el módulo
 logger = logging.getLogger(__name__)
@@ -64,9 +71,98 @@ ALLOWED_ATTRIBUTES = {
     'input': ['type', 'checked', 'disabled'],  # Para listas de tareas
 }
 
+# Un renderer y un sanitizador por hilo: cargar las extensiones cuesta más que
+# convertir un post corto, y ni Markdown ni bleach.Cleaner se pueden compartir
+# entre hilos (guardan estado mientras procesan).
+_renderers = threading.local()
+
+def crear_renderer_markdown():
+    """Crea un procesador de Markdown con la configuración del blog."""
+    return markdown.Markdown(
+        extensions=MARKDOWN_EXTENSIONS,
+        extension_configs=MARKDOWN_CONFIG,
+    )
+
+def obtener_renderer_markdown():
+    """Devuelve el procesador de Markdown del hilo actual, creándolo la primera vez."""
+    md = getattr(_renderers, 'md', None)
+    if md is None:
+        md = _renderers.md = crear_renderer_markdown()
+    return md
+
+class PresentacionBlogFilter(html5lib_shim.Filter):
+    """
+    Filtro de bleach que aplica la presentación del blog sobre los tokens ya
+    sanitizados: añade las clases CSS y hace que los enlaces externos abran
+    en una pestaña nueva. Así no hace falta volver a recorrer el HTML.
+    """
+    CLASES = {
+        'blockquote': 'blog-quote',
+        'table': 'blog-table',
+        'pre': 'blog-code',
+        'img': 'blog-image',
+    }
+
+    def __iter__(self):
+        for token in super().__iter__():
+            if token['type'] in ('StartTag', 'EmptyTag'):
+                atributos = token['data']
+                clase = self.CLASES.get(token['name'])
+                if clase:
+                    actuales = atributos.get((None, 'class'), '').split()
+                    if clase not in actuales:
+                        atributos[(None, 'class')] = ' '.join([clase] + actuales)
+                elif token['name'] == 'a' and atributos.get((None, 'href'), '').startswith(('http://', 'https://')):
+                    atributos[(None, 'target')] = '_blank'
+                    atributos[(None, 'rel')] = 'noopener noreferrer'
+            yield token
+
+def obtener_sanitizador_html():
+    """Devuelve el bleach.Cleaner del hilo actual, creándolo la primera vez."""
+    cleaner = getattr(_renderers, 'cleaner', None)
+    if cleaner is None:
+        cleaner = _renderers.cleaner = bleach.Cleaner(
+            tags=ALLOWED_TAGS,
+            attributes=ALLOWED_ATTRIBUTES,
+            strip=True,
+            filters=[PresentacionBlogFilter],
+        )
+    return cleaner
+
+# Caché del HTML renderizado, por huella del texto y de la configuración.
+# Incrementar VERSION_RENDER al cambiar el código del pipeline (p. ej. PresentacionBlogFilter).
+VERSION_RENDER = 2
+TIEMPO_CACHE_RENDER = 60 * 60 * 24 * 7  # 7 días
+
+_estadisticas_render = {'aciertos': 0, 'fallos': 0}
+_lock_estadisticas = threading.Lock()
+
+# La configuración no cambia en tiempo de ejecución: se calcula una sola vez
+_HUELLA_CONFIGURACION = hashlib.sha256(repr(
+    (VERSION_RENDER, MARKDOWN_EXTENSIONS, MARKDOWN_CONFIG, ALLOWED_TAGS, ALLOWED_ATTRIBUTES)
+).encode('utf-8')).hexdigest()
+
+def clave_cache_render(markdown_text):
+    """Clave de caché: sha256 de la configuración del renderer + el texto Markdown."""
+    huella = hashlib.sha256(_HUELLA_CONFIGURACION.encode('utf-8'))
+    huella.update(markdown_text.encode('utf-8'))
+    return f"markdown_html:{huella.hexdigest()}"
+
+def estadisticas_cache_render():
+    """Aciertos y fallos de la caché de render en este proceso."""
+    with _lock_estadisticas:
+        return dict(_estadisticas_render)
+
+def _contar_render(resultado):
+    with _lock_estadisticas:
+        _estadisticas_render[resultado] += 1
+
 def markdown_to_html(markdown_text):
     """
     Convierte texto Markdown a HTML seguro.
+
+    Si el mismo texto ya se renderizó con la misma configuración, devuelve el
+    HTML guardado en la caché sin volver a procesarlo.
     
     Args:
         markdown_text (str): Texto en formato Markdown
@@ -76,47 +172,124 @@ def markdown_to_html(markdown_text):
     """
     if not markdown_text:
         return ''
+
+    clave = clave_cache_render(markdown_text)
+    html = cache.get(clave)
+    if html is not None:
+        _contar_render('aciertos')
+        return html
+
+    _contar_render('fallos')
+    html = renderizar_markdown(markdown_text)
+    cache.set(clave, html, TIEMPO_CACHE_RENDER)
+    return html
+
+def renderizar_markdown(markdown_text):
+    """Pipeline completo Markdown -> HTML seguro, sin caché."""
+    if not markdown_text:
+        return ''
     
-    # Configurar el procesador de Markdown
-    md = markdown.Markdown(
-        extensions=MARKDOWN_EXTENSIONS,
-        extension_configs=MARKDOWN_CONFIG,
-    )
-    
-    # Convertir Markdown a HTML
-    html = md.convert(markdown_text)
-    
-    # Limpiar HTML para seguridad (prevenir XSS)
-    clean_html = bleach.clean(
-        html,
-        tags=ALLOWED_TAGS,
-        attributes=ALLOWED_ATTRIBUTES,
-        strip=True
-    )
-    
-    # Post-procesamiento para mejorar la presentación
-    clean_html = _post_process_html(clean_html)
+    # Convertir Markdown a HTML con el procesador reutilizable del hilo;
+    # reset() limpia el estado (notas al pie, TOC, ...) para la siguiente llamada
+    md = obtener_renderer_markdown()
+    try:
+        html = md.convert(markdown_text)
+    finally:
+        md.reset()
     
-    return clean_html
+    # Limpiar HTML para seguridad (prevenir XSS) y aplicar la presentación
+    # del blog en la misma pasada (ver PresentacionBlogFilter)
+    return obtener_sanitizador_html().clean(html)
+
+# Títulos que abren una sección nueva (solo fuera de otros bloques)
+NIVELES_SECCION = ('h1', 'h2')
+
+ETIQUETAS_VACIAS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr',
+}
+
+class _LectorTitulos(HTMLParser):
+    """Recorre el HTML y anota cada título: nivel, id, texto, posición y profundidad."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.profundidad = 0
+        self.titulos = []
+        self._titulo = None
+        self._en_enlace_permanente = False
+
+    def handle_starttag(self, tag, attrs):
+        atributos = dict(attrs)
+        if re.fullmatch(r'h[1-6]', tag):
+            self._titulo = {
+                'etiqueta': tag,
+                'id': atributos.get('id'),
+                'texto': '',
+                'posicion': self.getpos(),
+                'profundidad': self.profundidad,
+            }
+        elif tag == 'a' and 'headerlink' in (atributos.get('class') or '').split():
+            # Enlace permanente de la extensión toc (¶): no es parte del título
+            self._en_enlace_permanente = True
+        if tag not in ETIQUETAS_VACIAS:
+            self.profundidad += 1
 
-def _post_process_html(html):
+    def handle_endtag(self, tag):
+        if tag not in ETIQUETAS_VACIAS:
+            self.profundidad -= 1
+        if tag == 'a':
+            self._en_enlace_permanente = False
+        if self._titulo and tag == self._titulo['etiqueta']:
+            self._titulo['texto'] = self._titulo['texto'].strip()
+            self.titulos.append(self._titulo)
+            self._titulo = None
+
+    def handle_data(self, data):
+        if self._titulo is not None and not self._en_enlace_permanente:
+            self._titulo['texto'] += data
+
+def dividir_secciones(html):
     """
-    Post-procesa el HTML para mejorar la presentación.
+    Divide el HTML de una entrada en secciones que empiezan en cada título
+    h1/h2 de primer nivel, y extrae la tabla de contenidos.
+
+    Args:
+        html (str): HTML ya procesado (``contenido_html``)
+
+    Returns:
+        tuple: (secciones, toc). ``secciones`` es una lista de
+        ``{'id', 'titulo', 'html'}`` (el texto anterior al primer título va en
+        una sección sin id); ``toc`` es una lista plana de ``{'nivel', 'id', 'titulo'}``.
     """
-    # Agregar clases CSS para styling
-    html = re.sub(r'<blockquote>', '<blockquote class="blog-quote">', html)
-    html = re.sub(r'<table>', '<table class="blog-table">', html)
-    html = re.sub(r'<pre>', '<pre class="blog-code">', html)
-    html = re.sub(r'<img', '<img class="blog-image"', html)
-    
-    # Hacer que los enlaces externos abran en nueva pestaña
-    html = re.sub(
-        r'<a href="(https?://[^"]*)"([^>]*)>',
-        r'<a href="\1" target="_blank" rel="noopener noreferrer"\2>',
-        html
-    )
-    
-    return html
+    if not html:
+        return [], []
+
+    lector = _LectorTitulos()
+    lector.feed(html)
+    lector.close()
+
+    # getpos() da (línea, columna): se traduce a índice en el texto
+    inicios_linea = [0] + [i + 1 for i, caracter in enumerate(html) if caracter == '\n']
+    cortes = [
+        (inicios_linea[t['posicion'][0] - 1] + t['posicion'][1], t)
+        for t in lector.titulos
+        if t['profundidad'] == 0 and t['etiqueta'] in NIVELES_SECCION
+    ]
+
+    secciones = []
+    introduccion = html[:cortes[0][0] if cortes else len(html)].strip()
+    if introduccion:
+        secciones.append({'id': None, 'titulo': '', 'html': introduccion})
+    for i, (inicio, titulo) in enumerate(cortes):
+        fin = cortes[i + 1][0] if i + 1 < len(cortes) else len(html)
+        secciones.append({'id': titulo['id'], 'titulo': titulo['texto'], 'html': html[inicio:fin].strip()})
+
+    toc = [
+        {'nivel': int(t['etiqueta'][1]), 'id': t['id'], 'titulo': t['texto']}
+        for t in lector.titulos if t['id']
+    ]
+    return secciones, toc
 
 def extract_excerpt(markdown_text, max_length=200):
     """
@@ -188,41 +361,46 @@ def create_thumbnail(image, size=(300, 300)):
         size: Tupla con el tamaño del thumbnail (width, height)
         
     Returns:
-        ImageField: Thumbnail generado
+        ImageField: Thumbnail generado (JPEG). En ``variantes`` lleva los bytes
+        del mismo thumbnail en WebP/AVIF para ``rendiciones.guardar_variantes``.
     """
     try:
-        from PIL import Image
         from django.core.files.base import ContentFile
-        from django.core.files.storage import default_storage
         import os
+        from .rendiciones import crear_miniatura, codificar, variantes_modernas
         
-        # Abrir la imagen original
-        img = Image.open(image)
-        
-        # Convertir a RGB si es necesario
-        if img.mode in ('RGBA', 'P'):
-            img = img.convert('RGB')
-        
-        # Crear thumbnail manteniendo las proporciones
-        img.thumbnail(size, Image.Resampling.LANCZOS)
+        # Decodificar reducido (draft) y crear thumbnail manteniendo las proporciones
+        img = crear_miniatura(image, size)
         
         # Generar nombre del archivo thumbnail
         name, ext = os.path.splitext(image.name)
         thumbnail_name = f"{name}_thumb{ext}"
         
-        # Guardar thumbnail en memoria
-        from io import BytesIO
-        temp_thumb = BytesIO()
-        img.save(temp_thumb, format='JPEG', quality=85)
-        temp_thumb.seek(0)
-        
         # Crear ContentFile para Django
-        thumbnail_file = ContentFile(temp_thumb.read())
+        thumbnail_file = ContentFile(codificar(img, 'jpeg'))
         thumbnail_file.name = thumbnail_name
+        thumbnail_file.variantes = variantes_modernas(img)
         
         return thumbnail_file
         
     except Exception as e:
         # Usar logging para capturar el stacktrace sin exponer en consola en producción
         logger.exception("Error creando thumbnail: %s", e)
-        return None 
\ No newline at end of file
+        return None
+
+def escribir_atomico(ruta, contenido):
+    """
+    Escribe ``contenido`` (bytes) en ``ruta`` a través de un temporal en el
+    mismo directorio, para que nunca se lea un archivo a medio escribir.
+    """
+    directorio = os.path.dirname(ruta)
+    os.makedirs(directorio, exist_ok=True)
+    fd, temporal = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(contenido)
+        os.replace(temporal, ruta)
+    except OSError:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
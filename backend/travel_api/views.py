@@ -1,4 +1,12 @@
 from django.shortcuts import render, get_object_or_404
+from django.conf import settings
+from django.http import HttpResponse, FileResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.views.decorators.http import require_GET
+from django.views.static import serve
+import os
+from django.db.models import Prefetch
 from rest_framework import viewsets, generics
 from rest_framework.response import Response
 from .models import Lugar, Fotografia, EntradaDeBlog
@@ -6,10 +14,60 @@ from .serializers import (
     LugarSerializer, FotografiaSerializer, LugarDetalleSerializer,
     EntradaDeBlogSerializer, EntradaDeBlogConFotosSerializer
 )
-from rest_framework.decorators import api_view, permission_classes
+from .mapa import (
+    obtener_snapshot, construir_marcadores, parsear_bbox, lugares_en_bbox,
+    marcador_en_bbox, marcadores_para_zoom, ZOOM_MAX_AGRUPACION
+)
+from .tiles import contenido_tile, tile_valido
+from .rendiciones import (
+    srcset, fuentes, formato_preferido, ruta_variante,
+    tamano_permitido, obtener_bajo_demanda, version_original, FORMATOS_SALIDA, EXTENSIONES
+)
+from .renderers import MarcadoresCompactosRenderer, MarcadoresGeoJSONRenderer
+from .condicional import con_validadores, ValidadoresMixin
+from .cambios import obtener_cambios
+from .pagination import FotografiaCursorPagination, EntradaDeBlogCursorPagination
+from rest_framework.decorators import action, api_view, permission_classes, renderer_classes
+from rest_framework.renderers import JSONRenderer
 from rest_framework.permissions import IsAuthenticated, AllowAny
 
-class LugarViewSet(viewsets.ReadOnlyModelViewSet):
+# Fotografías con las relaciones que lee FotografiaSerializer
+FOTOS_SERIALIZABLES = Fotografia.objects.select_related('lugar', 'entrada_blog').prefetch_related('rendiciones').defer(
+    *FotografiaSerializer.columnas_sin_campos()
+)
+
+def con_relaciones(queryset, select_related=(), prefetch_related=()):
+    """Aplica select_related/prefetch_related solo si se declararon relaciones."""
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    return queryset
+
+class RelacionesMixin:
+    """
+    Carga de una vez las relaciones que usa el serializer de cada acción,
+    para que list/retrieve hagan un número acotado de consultas.
+
+    Cada ViewSet declara ``relaciones = {accion: (select_related, prefetch_related)}``.
+    """
+    relaciones = {}
+
+    def get_queryset(self):
+        return con_relaciones(super().get_queryset(), *self.relaciones.get(self.action, ()))
+
+class CamposMixin:
+    """
+    No carga las columnas pesadas que no necesita ningún campo pedido con
+    ``?fields=`` / ``?omit=`` (ver ``CamposDinamicosMixin``).
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        diferidas = self.get_serializer_class().columnas_no_usadas(self.request)
+        return queryset.defer(*diferidas) if diferidas else queryset
+
+class LugarViewSet(CamposMixin, RelacionesMixin, ValidadoresMixin, viewsets.ReadOnlyModelViewSet):
     """
     Vista para listar y recuperar lugares.
     GET /api/lugares/ - Lista todos los lugares
@@ -18,23 +76,32 @@ class LugarViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Lugar.objects.all()
     serializer_class = LugarSerializer
     permission_classes = [AllowAny]
+    relaciones = {
+        'retrieve': ((), LugarDetalleSerializer.prefetch_related),
+    }
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return LugarDetalleSerializer
         return LugarSerializer
 
-class FotografiaViewSet(viewsets.ReadOnlyModelViewSet):
+class FotografiaViewSet(CamposMixin, RelacionesMixin, ValidadoresMixin, viewsets.ReadOnlyModelViewSet):
     """
     Vista para listar y recuperar fotografías.
     GET /api/fotografias/ - Lista todas las fotografías
     GET /api/fotografias/?lugar={id} - Lista fotografías de un lugar específico
     GET /api/fotografias/?entrada_blog={id} - Lista fotografías de una entrada de blog específica
     GET /api/fotografias/{id}/ - Detalle de una fotografía específica
+    GET /api/fotografias/?cursor={cursor} - Página siguiente (enlace 'next' de la respuesta)
     """
     queryset = Fotografia.objects.all()
     serializer_class = FotografiaSerializer
     permission_classes = [AllowAny]
+    pagination_class = FotografiaCursorPagination
+    relaciones = {
+        'list': (('lugar', 'entrada_blog'), ('rendiciones',)),
+        'retrieve': (('lugar', 'entrada_blog'), ('rendiciones',)),
+    }
     
     def get_queryset(self):
         """Filtra fotografías por lugar o entrada de blog si se proporciona el parámetro"""
@@ -54,16 +121,24 @@ class FotografiaViewSet(viewsets.ReadOnlyModelViewSet):
         context = super().get_serializer_context()
         return context
 
-class EntradaDeBlogViewSet(viewsets.ReadOnlyModelViewSet):
+class EntradaDeBlogViewSet(CamposMixin, RelacionesMixin, ValidadoresMixin, viewsets.ReadOnlyModelViewSet):
     """
     Vista para listar y recuperar entradas de blog.
     GET /api/entradas-blog/ - Lista todas las entradas de blog
     GET /api/entradas-blog/{id}/ - Detalle de una entrada de blog específica con sus fotos
     GET /api/entradas-blog/?lugar={id} - Lista entradas de blog de un lugar específico
+    GET /api/entradas-blog/?cursor={cursor} - Página siguiente (enlace 'next' de la respuesta)
+    GET /api/entradas-blog/{id}/?secciones={n} - Detalle con la tabla de contenidos y las primeras n secciones
+    GET /api/entradas-blog/{id}/secciones/?desde={n} - Resto de secciones
     """
     queryset = EntradaDeBlog.objects.all()
     serializer_class = EntradaDeBlogSerializer
     permission_classes = [AllowAny]
+    pagination_class = EntradaDeBlogCursorPagination
+    relaciones = {
+        'list': (('autor', 'lugar_asociado'), ()),
+        'retrieve': (('autor', 'lugar_asociado'), (Prefetch('fotografias', queryset=FOTOS_SERIALIZABLES),)),
+    }
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -78,75 +153,182 @@ class EntradaDeBlogViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(lugar_asociado_id=lugar_id)
         return queryset
 
+    @action(detail=True)
+    def secciones(self, request, pk=None):
+        """
+        Secciones de una entrada, para cargar de forma diferida las que no
+        vinieron con ?secciones=N.
+        GET /api/entradas-blog/{id}/secciones/?desde={n}&cantidad={m}
+        """
+        try:
+            desde = _entero_no_negativo(request.query_params.get('desde'), 'desde', 0)
+            cantidad = _entero_no_negativo(request.query_params.get('cantidad'), 'cantidad', None)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+
+        entrada = get_object_or_404(EntradaDeBlog.objects.only('id', 'secciones'), pk=pk)
+        hasta = None if cantidad is None else desde + cantidad
+        return Response({
+            'total': len(entrada.secciones),
+            'desde': desde,
+            'secciones': entrada.secciones[desde:hasta],
+        })
+
+def _entero_no_negativo(valor, nombre, defecto):
+    if valor in (None, ''):
+        return defecto
+    try:
+        numero = int(valor)
+    except ValueError:
+        numero = -1
+    if numero < 0:
+        raise ValueError(f"{nombre} debe ser un entero mayor o igual a 0")
+    return numero
+
+@con_validadores
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@renderer_classes([JSONRenderer, MarcadoresCompactosRenderer, MarcadoresGeoJSONRenderer])
 def mapa_data(request):
     """
     Endpoint para obtener los datos necesarios para el mapa.
     Devuelve marcadores individuales para cada foto, agrupados por entradas de blog.
+
+    Los marcadores se sirven desde el snapshot precalculado. La versión actual
+    va en el header ``X-Mapa-Version``; si el cliente la pide con ``?v=<version>``
+    la respuesta se puede cachear indefinidamente.
+
+    GET /api/mapa-data/?zoom=z - En zooms bajos (hasta ZOOM_MAX_AGRUPACION) los
+    marcadores cercanos se agrupan en objetos ``cluster`` precalculados.
+    GET /api/mapa-data/?bbox=minLon,minLat,maxLon,maxLat&zoom=z - Solo los
+    marcadores visibles en el recuadro. En zooms altos se consultan
+    directamente en la base de datos.
+    GET /api/mapa-data/?format=compact|geojson - Mismos marcadores sin repetir
+    los datos de lugar y entrada en cada foto (ver mapa.marcadores_compactos).
     """
-    lugares = Lugar.objects.all()
-    resultado = []
-    
-    for lugar in lugares:
-        # Obtener todas las entradas de blog de este lugar
-        entradas_blog = lugar.entradas_blog.all()
-        
-        if entradas_blog.exists():
-            # Para cada entrada de blog, crear marcadores para cada foto
-            for entrada in entradas_blog:
-                fotos_entrada = entrada.fotografias.all().order_by('orden_en_entrada')
-                
-                for foto in fotos_entrada:
-                    # Crear un marcador individual para cada foto
-                    marcador = {
-                        'id': f"{lugar.id}-{entrada.id}-{foto.id}",  # ID único combinado
-                        'lugar_id': lugar.id,
-                        'entrada_id': entrada.id,
-                        'entrada_slug': entrada.slug,
-                        'foto_id': foto.id,
-                        'coordinates': [float(lugar.longitud), float(lugar.latitud)],
-                        'nombre': lugar.nombre,
-                        'ciudad': lugar.ciudad,
-                        'pais': lugar.pais,
-                        'thumbnail': foto.thumbnail_url,
-                        'imagen_completa': foto.url_imagen,
-                        'descripcion': lugar.descripcion_corta,
-                        'entrada_titulo': entrada.titulo,
-                        'foto_orden': foto.orden_en_entrada,
-                        'foto_descripcion': foto.descripcion,
-                        'tipo_marcador': 'foto_blog'  # Identificador del tipo
-                    }
-                    resultado.append(marcador)
-        else:
-            # Para lugares sin entradas de blog, mantener comportamiento original
-            foto_principal = lugar.fotografias.filter(es_foto_principal_lugar=True).first()
-            if not foto_principal:
-                foto_principal = lugar.fotografias.first()
-            
-            thumbnail = None
-            imagen_completa = None
-            
-            if foto_principal:
-                thumbnail = foto_principal.thumbnail_url
-                imagen_completa = foto_principal.url_imagen
-            
-            marcador = {
-                'id': lugar.id,
-                'lugar_id': lugar.id,
-                'coordinates': [float(lugar.longitud), float(lugar.latitud)],
-                'nombre': lugar.nombre,
-                'ciudad': lugar.ciudad,
-                'pais': lugar.pais,
-                'thumbnail': thumbnail,
-                'imagen_completa': imagen_completa,
-                'descripcion': lugar.descripcion_corta,
-                'tipo_marcador': 'lugar_simple'  # Identificador del tipo
-            }
-            resultado.append(marcador)
-    
-    return Response(resultado)
+    try:
+        bbox = request.query_params.get('bbox')
+        bbox = parsear_bbox(bbox) if bbox else None
+        zoom = _parsear_zoom(request.query_params.get('zoom'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+
+    if bbox and (zoom is None or zoom > ZOOM_MAX_AGRUPACION):
+        return Response(construir_marcadores(lugares_en_bbox(bbox)))
+
+    snapshot = obtener_snapshot()
+    marcadores = marcadores_para_zoom(snapshot, zoom)
+    if bbox:
+        marcadores = [m for m in marcadores if marcador_en_bbox(m, bbox)]
+
+    response = Response(marcadores)
+    response['X-Mapa-Version'] = str(snapshot.version)
+    if request.query_params.get('v') == str(snapshot.version):
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+def _parsear_zoom(valor):
+    """Valida el nivel de zoom de Mapbox (0-22). ``None`` si no se envía."""
+    if valor in (None, ''):
+        return None
+    zoom = int(valor)
+    if not 0 <= zoom <= 22:
+        raise ValueError("zoom debe estar entre 0 y 22")
+    return zoom
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def mapa_tile(request, z, x, y):
+    """
+    Endpoint con los marcadores (o clusters en zooms bajos) de un tile del mapa.
+    GET /api/tiles/{z}/{x}/{y}/ - Esquema XYZ de Mapbox/OSM
+
+    El JSON se sirve desde la caché en disco (MAPA_TILES_ROOT) y solo se genera
+    cuando el tile no existe o fue invalidado por un cambio en sus datos.
+    """
+    if not tile_valido(z, x, y):
+        return Response({'error': 'Tile fuera de rango'}, status=404)
+
+    response = HttpResponse(contenido_tile(z, x, y), content_type='application/json')
+    response['Cache-Control'] = 'public, max-age=300'
+    return response
+
+@require_GET
+def rendicion_bajo_demanda(request, ancho, alto, uuid, extension=None):
+    """
+    Imagen de una foto reducida para caber en {ancho}x{alto}.
+    GET /media/r/{ancho}x{alto}/{uuid}.{jpg|webp|avif} - Solo tamaños de FOTOS_TAMANOS_BAJO_DEMANDA
+    GET /media/r/{ancho}x{alto}/{uuid} - Mejor formato según el header Accept
+
+    Se genera la primera vez y después se sirve desde disco. La URL no cambia
+    aunque se reemplace el original, así que por defecto se cachea poco tiempo
+    con ETag (la versión del original, ver rendiciones.version_original).
+    Con ``?v={version}`` (header X-Imagen-Version) la URL apunta a una versión
+    concreta y se cachea como inmutable, igual que mapa-data.
+    """
+    if extension is None:
+        formato = formato_preferido(request.META.get('HTTP_ACCEPT'), FORMATOS_SALIDA)
+    else:
+        formato = EXTENSIONES.get(extension)
+    if not tamano_permitido(ancho, alto) or formato is None:
+        raise Http404('Tamaño o formato no disponible')
+
+    foto = get_object_or_404(Fotografia.objects.only('id', 'uuid', 'imagen', 'url_imagen'), uuid=uuid)
+    try:
+        version = version_original(foto)
+        etag = f'"{version}-{formato}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            ruta = obtener_bajo_demanda(foto, ancho, alto, formato)
+            response = FileResponse(open(ruta, 'rb'), content_type=FORMATOS_SALIDA[formato][1])
+    except FileNotFoundError:
+        raise Http404('Imagen original no encontrada')
+
+    response['ETag'] = etag
+    response['X-Imagen-Version'] = version
+    if request.GET.get('v') == version:
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'public, max-age=300'
+    if extension is None:
+        patch_vary_headers(response, ['Accept'])
+    return response
+
+def servir_media(request, path):
+    """
+    Archivos de MEDIA_ROOT. Para las imágenes JPEG/PNG que tienen variantes
+    WebP/AVIF al lado (thumbnails, ver rendiciones.guardar_variantes) sirve la
+    mejor que acepte el cliente según su header Accept.
+    """
+    es_imagen = os.path.splitext(path)[1].lower() in ('.jpg', '.jpeg', '.png')
+    if es_imagen:
+        formato = formato_preferido(request.META.get('HTTP_ACCEPT'), FORMATOS_SALIDA)
+        if formato != 'jpeg':
+            variante = ruta_variante(path, formato)
+            if os.path.isfile(safe_join(settings.MEDIA_ROOT, variante)):
+                path = variante
+
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if es_imagen:
+        patch_vary_headers(response, ['Accept'])
+    return response
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def cambios(request):
+    """
+    Feed de cambios para mantener una réplica local sin volver a descargar todo.
+    GET /api/changes/ - Sincronización inicial: todas las filas
+    GET /api/changes/?since={cursor} - Lugares, fotografías y entradas creados,
+    modificados o deshabilitados desde el cursor de la respuesta anterior
+    """
+    try:
+        datos = obtener_cambios(request.query_params.get('since'), context={'request': request})
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+    return Response(datos)
 
+@con_validadores
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def entrada_blog_galeria(request, entrada_id, foto_id=None):
@@ -159,7 +341,7 @@ def entrada_blog_galeria(request, entrada_id, foto_id=None):
         lugar = entrada.lugar_asociado
         
         # Obtener todas las fotos de esta entrada, ordenadas
-        fotos_entrada = entrada.fotografias.all().order_by('orden_en_entrada')
+        fotos_entrada = entrada.fotografias.all().order_by('orden_en_entrada').prefetch_related('rendiciones')
         
         # Determinar el índice de la foto activa
         foto_activa_index = 0
@@ -178,6 +360,8 @@ def entrada_blog_galeria(request, entrada_id, foto_id=None):
                 'uuid': str(foto.uuid),
                 'url': foto.url_imagen,
                 'thumbnail': foto.thumbnail_url,
+                'srcset': srcset(foto.rendiciones.all(), request),
+                'fuentes': fuentes(foto.rendiciones.all(), request),
                 'caption': foto.descripcion,
                 'description': foto.descripcion,
                 'date': foto.fecha_toma.strftime('%Y-%m-%d') if foto.fecha_toma else None,
@@ -214,19 +398,26 @@ def entrada_blog_galeria(request, entrada_id, foto_id=None):
     except EntradaDeBlog.DoesNotExist:
         return Response({'error': 'Entrada de blog no encontrada'}, status=404)
 
+@con_validadores
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def entrada_blog_por_slug(request, slug):
     """
     Endpoint para obtener una entrada de blog específica por su slug.
     GET /api/blog/{slug}/ - Obtiene la entrada de blog con el slug especificado
+    GET /api/blog/{slug}/?secciones={n} - Igual, con la tabla de contenidos y las primeras n secciones
     """
-    entrada = get_object_or_404(EntradaDeBlog, slug=slug)
+    entradas = con_relaciones(EntradaDeBlog.objects.all(), *EntradaDeBlogViewSet.relaciones['retrieve'])
+    diferidas = EntradaDeBlogConFotosSerializer.columnas_no_usadas(request)
+    if diferidas:
+        entradas = entradas.defer(*diferidas)
+    entrada = get_object_or_404(entradas, slug=slug)
     
     # Usar el serializer detallado que incluye las fotografías
     serializer = EntradaDeBlogConFotosSerializer(entrada, context={'request': request})
     return Response(serializer.data)
 
+@con_validadores
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def entrada_blog_galeria_por_slug(request, slug, foto_id=None):
@@ -239,7 +430,7 @@ def entrada_blog_galeria_por_slug(request, slug, foto_id=None):
         lugar = entrada.lugar_asociado
         
         # Obtener todas las fotos de esta entrada, ordenadas
-        fotos_entrada = entrada.fotografias.all().order_by('orden_en_entrada')
+        fotos_entrada = entrada.fotografias.all().order_by('orden_en_entrada').prefetch_related('rendiciones')
         
         # Determinar el índice de la foto activa
         foto_activa_index = 0
@@ -258,6 +449,8 @@ def entrada_blog_galeria_por_slug(request, slug, foto_id=None):
                 'uuid': str(foto.uuid),
                 'url': foto.url_imagen,
                 'thumbnail': foto.thumbnail_url,
+                'srcset': srcset(foto.rendiciones.all(), request),
+                'fuentes': fuentes(foto.rendiciones.all(), request),
                 'caption': foto.descripcion,
                 'description': foto.descripcion,
                 'date': foto.fecha_toma.strftime('%Y-%m-%d') if foto.fecha_toma else None,
@@ -81,6 +81,7 @@ cd ..
 if command -v supervisorctl &> /dev/null; then
     info "Reiniciando servicios del servidor..."
     sudo supervisorctl restart blog_gunicorn || info "No se pudo reiniciar Gunicorn (puede que no esté configurado)"
+    sudo supervisorctl restart blog_procesar_trabajos || info "No se pudo reiniciar el worker de imágenes (puede que no esté configurado)"
 fi
 
 if command -v systemctl &> /dev/null; then
@@ -6,6 +6,7 @@ Uso:
 python generate_thumbnails.py  # Generar faltantes
 python generate_thumbnails.py --force  # Regenerar todos
 python generate_thumbnails.py --entry 8  # Solo una entrada
+python generate_thumbnails.py --force --workers 8  # Regenerar todos en paralelo
 """
 
 import os
@@ -32,6 +33,9 @@ Ejemplos de uso:
 
 4. Cambiar tamaño de thumbnails:
    python generate_thumbnails.py --size 200x200
+
+5. Regenerar todo el archivo usando 8 procesos:
+   python generate_thumbnails.py --force --workers 8
         """
     )
     
@@ -53,6 +57,13 @@ Ejemplos de uso:
         help='Tamaño del thumbnail en formato "WIDTHxHEIGHT" (default: 300x300)'
     )
     
+    parser.add_argument(
+        '--workers', '-w',
+        type=int,
+        default=1,
+        help='Procesos que generan thumbnails en paralelo (default: 1)'
+    )
+    
     args = parser.parse_args()
     
     # Construir comando Django
@@ -66,7 +77,8 @@ Ejemplos de uso:
     cmd = [
         sys.executable, str(manage_py),
         'generate_missing_thumbnails',
-        '--size', args.size
+        '--size', args.size,
+        '--workers', str(args.workers)
     ]
     
     # Agregar opciones
@@ -85,6 +97,9 @@ Ejemplos de uso:
     
     print(f"📏 Tamaño: {args.size}")
     
+    if args.workers > 1:
+        print(f"⚙️  Procesos: {args.workers}")
+    
     if args.force:
         print("🔄 Regenerando todos (incluso existentes)")
     else:
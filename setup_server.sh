@@ -72,6 +72,13 @@ sudo -u blogapp npm run build
 # Configurar Nginx
 echo "🌐 Configurando Nginx..."
 cat > /etc/nginx/sites-available/otravezlunes << EOF
+# Variante WebP/AVIF de los thumbnails (foto_thumb.jpg.webp) según el header Accept
+map \$http_accept \$variante_imagen {
+    default "";
+    "~*image/avif" ".avif";
+    "~*image/webp" ".webp";
+}
+
 server {
     listen 80;
     server_name otravezlunes.com www.otravezlunes.com 157.230.111.57;
@@ -100,11 +107,20 @@ server {
         proxy_set_header X-Forwarded-Proto \$scheme;
     }
 
+    # Imágenes redimensionadas bajo demanda (las genera y cachea Django)
+    location /media/r/ {
+        proxy_pass http://127.0.0.1:8000;
+        proxy_set_header Host \$host;
+        proxy_set_header X-Forwarded-Proto \$scheme;
+    }
+
     # Archivos media (fotos)
     location /media/ {
-        alias /home/blogapp/blog/media/;
+        root /home/blogapp/blog;
+        try_files \$uri\$variante_imagen \$uri =404;
         expires 1y;
         add_header Cache-Control "public, immutable";
+        add_header Vary Accept;
     }
 
     # Archivos estáticos Django
@@ -132,6 +148,18 @@ autorestart=true
 redirect_stderr=true
 stdout_logfile=/var/log/supervisor/otravezlunes_gunicorn.log
 environment=DJANGO_SETTINGS_MODULE=core_project.settings
+
+# Worker de thumbnails y renditions (cola de trabajos de imagen)
+[program:blog_procesar_trabajos]
+command=/home/blogapp/blog/backend/venv/bin/python manage.py procesar_trabajos
+directory=/home/blogapp/blog/backend
+user=blogapp
+autostart=true
+autorestart=true
+stopsignal=INT
+redirect_stderr=true
+stdout_logfile=/var/log/supervisor/blog_procesar_trabajos.log
+environment=DJANGO_SETTINGS_MODULE=core_project.settings
 EOF
 
 # Reiniciar servicios
@@ -139,6 +167,7 @@ echo "🔄 Reiniciando servicios..."
 supervisorctl reread
 supervisorctl update
 supervisorctl start otravezlunes_gunicorn
+supervisorctl start blog_procesar_trabajos
 systemctl restart nginx
 
 # Configurar permisos